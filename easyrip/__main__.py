@@ -1,3 +1,4 @@
+import multiprocessing
 import sys
 from typing import TYPE_CHECKING, NoReturn
 
@@ -153,4 +154,6 @@ def run() -> NoReturn:
 
 
 if __name__ == "__main__":
+    # 打包为可执行文件时，子集化字体的进程池以 spawn 启动的子进程从这里进入，不能执行 run
+    multiprocessing.freeze_support()
     run()
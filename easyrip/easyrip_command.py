@@ -199,6 +199,13 @@ class Cmd_type(enum.Enum):
                 ("Default",), description="Show Ripper list", is_no_prompt_child=True
             ),
             Cmd_type_val(("clear", "clean"), description="Clear Ripper list"),
+            Cmd_type_val(
+                ("load",),
+                description=(
+                    "Load the unfinished Ripper from the journal of the current directory\n"
+                    "e.g. after the program is interrupted"
+                ),
+            ),
             Cmd_type_val(
                 ("del", "pop"),
                 param="<index>",
@@ -206,13 +213,14 @@ class Cmd_type(enum.Enum):
             ),
             Cmd_type_val(
                 ("sort",),
-                param="[n][r]",
+                param="[n][r] | cost",
                 description=(
                     "Sort list\n"  # .
                     "'n': Natural Sorting\n"
-                    "'r': Reverse"
+                    "'r': Reverse\n"
+                    "'cost': Longest job first, by the cost estimated from the media info and preset"
                 ),
-                childs=(Cmd_type_val(("n", "r", "nr")),),
+                childs=(Cmd_type_val(("n", "r", "nr", "cost")),),
             ),
             Cmd_type_val(
                 ("<int> <int>",),
@@ -223,7 +231,7 @@ class Cmd_type(enum.Enum):
     )
     run = Cmd_type_val(
         ("run",),
-        param="[<run option>] [-multithreading <0 | 1>]",
+        param="[<run option>] [-multithreading <0 | 1>] [-sort-cost <0 | 1>] [-resume <0 | 1>]",
         description="Run the Ripper from the Ripper list",
         childs=(
             Cmd_type_val(("Default",), description="Only run", is_no_prompt_child=True),
@@ -306,6 +314,18 @@ class Cmd_type(enum.Enum):
             "e.g. 'translate zh-Hans zh-Hant' will translate all '*.zh-Hans.ass' files into zh-Hant"
         ),
     )
+    bench = Cmd_type_val(
+        ("bench",),
+        param="<input> <preset name>[?<option>=<val>...] [...] [-n <int>] [-t <sec>] [-quality-detection <algorithm>]",
+        description=(
+            "Cut evenly distributed clips from the input, encode them with each preset or option variant,\n"
+            'and report the encoding FPS, bitrate and quality in a table and "<input stem>.bench.json"\n'
+            "  -n                  Number of clips, default: 3\n"
+            "  -t                  Duration of each clip, default: 10\n"
+            "  -quality-detection  ssim | psnr | vmaf, default: no quality detection\n"
+            "e.g. 'bench in.mkv x265fast2 x265slow x265slow?crf=22 -quality-detection ssim'"
+        ),
+    )
     mediainfo = Cmd_type_val(
         ("mediainfo",),
         param="<<path> | 'fd' | 'cfd'>",
@@ -706,6 +726,77 @@ class Opt_type(enum.Enum):
             Cmd_type_val(("0", "1"), is_no_doc_child=True),
         ),
     )
+    _output_cache = Cmd_type_val(
+        ("-output-cache",),
+        param="<0 | 1 | hash>",
+        description=(
+            "Enable the output cache, when the input files, commands, options and tool versions are all the same, copy the previous output instead of encoding (reflink when the file system supports it)\n"
+            "1: Use the size and modification time as the fingerprint of the input files\n"
+            "hash: Also add the partial hash of the head and tail of the files\n"
+            "Can not be used with -p custom, -p subset, .vpy, -pipe, -soft-sub"
+        ),
+        childs=(
+            Cmd_type_val(("Default:",), param="0", is_no_prompt_child=True),
+            Cmd_type_val(("0", "1", "hash"), is_no_doc_child=True),
+        ),
+    )
+    _chunk = Cmd_type_val(
+        ("-chunk",),
+        param="<int>",
+        description=(
+            "In the video presets, split the input at the keyframes into this number of chunks,\n"
+            "encode the chunks at the same time, then concatenate them losslessly\n"
+            "Can not be used with -pipe, .vpy, -ss, -t, -sub or -vf\n"
+            "If it <= 1, do not split"
+        ),
+        childs=(Cmd_type_val(("Default:",), param="0", is_no_prompt_child=True),),
+    )
+    _flac_pipe = Cmd_type_val(
+        ("-flac-pipe",),
+        param="<0 | 1>",
+        description=(
+            "In -p flac, pipe the PCM output of FFmpeg straight into flac, without temporary WAV files\n"
+            "If it is 0, write the temporary WAV files first"
+        ),
+        childs=(
+            Cmd_type_val(("Default:",), param="1", is_no_prompt_child=True),
+            Cmd_type_val(("0", "1"), is_no_doc_child=True),
+        ),
+    )
+    _parallel_jobs = Cmd_type_val(
+        ("-parallel-jobs",),
+        param="<int>",
+        description=(
+            "The max number of commands run at the same time in a parallel command group\n"
+            "e.g. the per-track encodes of -p flac, the chunks of -chunk\n"
+            "Default: logical cores // 8, at least 1. All the chunks of -chunk\n"
+            "Also limits the font subset processes of -p subset,\n"
+            "whose default is the logical cores, or half of them when run beside the main encode"
+        ),
+    )
+    _nice = Cmd_type_val(
+        ("-nice",),
+        param="<int>",
+        description=(
+            "Increase the niceness of the commands run by Ripper, lower their CPU priority\n"
+            "On Windows, > 0 is below normal and >= 10 is idle priority, negative values raise it"
+        ),
+    )
+    _cpu_affinity = Cmd_type_val(
+        ("-cpu-affinity",),
+        param="<list>",
+        description=(
+            "Limit the commands run by Ripper to these CPUs, only on Linux\ne.g. 0-3,6"
+        ),
+    )
+    _pipe_size = Cmd_type_val(
+        ("-pipe-size",),
+        param="<int>",
+        description=(
+            "The buffer size in bytes of the pipes between the commands, e.g. vspipe | ffmpeg, only on Linux\n"
+            "Default: the system default"
+        ),
+    )
     _multithreading = Cmd_type_val(
         ("-multithreading",),
         param="<0 | 1>",
@@ -718,11 +809,61 @@ class Opt_type(enum.Enum):
             Cmd_type_val(("0", "1"), is_no_doc_child=True),
         ),
     )
+    _sort_cost = Cmd_type_val(
+        ("-sort-cost",),
+        param="<0 | 1>",
+        description=(
+            "Sort Ripper list by the estimated cost before run, longest job first\n"
+            "Shorten the total time when used with -multithreading"
+        ),
+        childs=(
+            Cmd_type_val(("Default:",), param="0", is_no_prompt_child=True),
+            Cmd_type_val(("0", "1"), is_no_doc_child=True),
+        ),
+    )
+    _resume = Cmd_type_val(
+        ("-resume",),
+        param="<0 | 1>",
+        description=(
+            "Resume from the journal of the current directory, skip the finished Ripper and clean the unfinished temporary files\n"
+            "If the Ripper list is empty, load the unfinished Ripper from the journal first"
+        ),
+        childs=(
+            Cmd_type_val(("Default:",), param="0", is_no_prompt_child=True),
+            Cmd_type_val(("0", "1"), is_no_doc_child=True),
+        ),
+    )
+    _lazy_probe = Cmd_type_val(
+        ("-lazy-probe",),
+        param="<0 | 1>",
+        description=(
+            "Do not probe the media info when adding to Ripper list, probe it just before run\n"
+            "Suitable for very large Ripper list"
+        ),
+        childs=(
+            Cmd_type_val(("Default:",), param="0", is_no_prompt_child=True),
+            Cmd_type_val(("0", "1"), is_no_doc_child=True),
+        ),
+    )
+    _crf = Cmd_type_val(
+        ("-crf",),
+        param="<val | auto[:<metric>[:<target>]]>",
+        description=(
+            "Set the CRF in the x264, x265 and svtav1 presets\n"
+            "auto: Before encoding, encode the evenly distributed samples at several CRF values in parallel,\n"
+            "score them with the metric of -quality-detection, and interpolate the CRF whose mean score reaches the target\n"
+            "Default metric and target: ssim:0.98, psnr:40, vmaf:93\n"
+            "The samples go through -vf, but the subtitles of -sub are not burned in\n"
+            "The number of samples encoded at the same time follows -parallel-jobs or the CPU cost of the preset\n"
+            "Can not be used with -pipe or .vpy"
+        ),
+    )
     _quality_detection = Cmd_type_val(
         ("-quality-detection",),
         param="<algorithm>[:<threshold>]",
         description=(
             "Comparison of quality between detection and source after encoding is completed\n"
+            'The statistics and the frame ranges below the threshold are written to "<output>.quality.json"\n'
             "\n"
             "Algorithm:"
         ),
@@ -732,6 +873,35 @@ class Opt_type(enum.Enum):
             Cmd_type_val(("vmaf",), description="Default threshold: 80"),
         ),
     )
+    _quality_detection_mode = Cmd_type_val(
+        ("-quality-detection-mode",),
+        param="<full | inline | sample[:<count>[:<sec>]]>",
+        description=(
+            "How -quality-detection compares the output with the source\n\nMode:"
+        ),
+        childs=(
+            Cmd_type_val(("Default:",), param="full", is_no_prompt_child=True),
+            Cmd_type_val(
+                ("full",),
+                description="Decode the source and the output again after encoding is completed",
+            ),
+            Cmd_type_val(
+                ("inline",),
+                description=(
+                    "In the video presets, decode the encoded stream with a loopback decoder and compare it in the same FFmpeg,\n"
+                    "the source is decoded only once\n"
+                    "Need FFmpeg >= 7.0, can not be used with -hwaccel"
+                ),
+            ),
+            Cmd_type_val(
+                ("sample",),
+                description=(
+                    "After encoding is completed, only compare <count> evenly distributed segments of <sec> seconds in parallel\n"
+                    "Default: sample:10:2"
+                ),
+            ),
+        ),
+    )
 
     @classmethod
     def from_str(cls, s: str) -> Self | None:
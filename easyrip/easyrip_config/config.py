@@ -1,5 +1,6 @@
 import json
 import os
+from copy import deepcopy
 from typing import TYPE_CHECKING, Literal, get_origin, overload
 
 from ..easyrip_log import log
@@ -11,7 +12,7 @@ from .config_key import CONFIG_TYPE_DICT, CONFIG_VERSION, Config_key
 if TYPE_CHECKING:
     from pathlib import Path
 
-CONFIG_DEFAULT_DICT: dict[Config_key, str | bool | list[str] | int] = {
+CONFIG_DEFAULT_DICT: dict[Config_key, str | bool | list[str] | int | float | dict] = {
     Config_key.language: "auto",
     Config_key.check_update: True,
     Config_key.check_dependent: True,
@@ -21,8 +22,14 @@ CONFIG_DEFAULT_DICT: dict[Config_key, str | bool | list[str] | int] = {
     Config_key.log_print_level: log.LogLevel.send.name,
     Config_key.log_write_level: log.LogLevel.send.name,
     Config_key.save_prompt_history: True,
-    Config_key.refresh_progress_sec: 3,
+    Config_key.refresh_progress_sec: 0.5,
     Config_key.proxies: "auto",
+    Config_key.scheduler_cpu_slots: 0,
+    Config_key.scheduler_memory_mb: 0,
+    Config_key.scheduler_job_cost: {},
+    Config_key.output_cache_dir: "",
+    Config_key.output_cache_max_mb: 51200,
+    Config_key.subset_cache_max_mb: 1024,
 }
 
 assert all(k in CONFIG_DEFAULT_DICT for k in Config_key), [
@@ -43,9 +50,9 @@ class config:
         if not cls._config_file.is_file():
             cls._config_dir.mkdir(exist_ok=True)
             with cls._config_file.open("wt", encoding="utf-8", newline="\n") as f:
-                config_default_dict: dict[str, str | bool | list[str] | int] = {
-                    k.name: v for k, v in CONFIG_DEFAULT_DICT.items()
-                }
+                config_default_dict: dict[
+                    str, str | bool | list[str] | int | float | dict
+                ] = {k.name: v for k, v in CONFIG_DEFAULT_DICT.items()}
                 json.dump(
                     {
                         "version": CONFIG_VERSION,
@@ -97,7 +104,14 @@ class config:
             except json.JSONDecodeError as e:
                 log.error(f"{e!r} {e}", deep=True)
                 return False
-            return True
+
+        # 旧版本的配置文件缺少新增的键，用默认值补全
+        if isinstance(cls._config, dict) and isinstance(
+            user_profile := cls._config.get("user_profile"), dict
+        ):
+            for k, v in CONFIG_DEFAULT_DICT.items():
+                user_profile.setdefault(k.name, deepcopy(v))
+        return True
 
     @classmethod
     def _write_config(cls, new_config: dict | None = None) -> bool:
@@ -157,6 +171,7 @@ class config:
             Config_key.log_print_level,
             Config_key.log_write_level,
             Config_key.proxies,
+            Config_key.output_cache_dir,
         ],
         default: T = None,
         /,
@@ -191,8 +206,31 @@ class config:
         config_key: Literal[Config_key.refresh_progress_sec],
         default: T = None,
         /,
+    ) -> int | float | T: ...
+
+    @overload
+    @classmethod
+    def get_user_profile[T](
+        cls,
+        config_key: Literal[
+            Config_key.scheduler_cpu_slots,
+            Config_key.scheduler_memory_mb,
+            Config_key.output_cache_max_mb,
+            Config_key.subset_cache_max_mb,
+        ],
+        default: T = None,
+        /,
     ) -> int | T: ...
 
+    @overload
+    @classmethod
+    def get_user_profile[T](
+        cls,
+        config_key: Literal[Config_key.scheduler_job_cost],
+        default: T = None,
+        /,
+    ) -> dict[str, list[int]] | T: ...
+
     @overload
     @classmethod
     def get_user_profile[T](
@@ -200,7 +238,7 @@ class config:
         config_key: str,
         default: T = None,
         /,
-    ) -> str | bool | list[str] | int | T: ...
+    ) -> str | bool | list[str] | int | float | dict | T: ...
 
     @classmethod
     def get_user_profile[T](
@@ -208,7 +246,7 @@ class config:
         config_key: Config_key | str,
         default: T = None,
         /,
-    ) -> str | bool | list[str] | int | T:
+    ) -> str | bool | list[str] | int | float | dict | T:
         key = config_key.name if isinstance(config_key, Config_key) else config_key
 
         if key not in Config_key._member_map_:
@@ -293,7 +331,7 @@ class config:
                     CONFIG_DEFAULT_DICT[Config_key.save_prompt_history],
                 ),
                 Config_key.refresh_progress_sec.name: gettext(
-                    "Refresh progress interval. Default: {}",
+                    "Refresh progress interval in seconds, decimals are allowed. Default: {}",
                     CONFIG_DEFAULT_DICT[Config_key.refresh_progress_sec],
                 ),
                 Config_key.proxies.name: gettext(
@@ -301,6 +339,32 @@ class config:
                     "\"{'http': 'http://127.0.0.1:5678'}\"",
                     CONFIG_DEFAULT_DICT[Config_key.proxies],
                 ),
+                Config_key.scheduler_cpu_slots.name: gettext(
+                    "The number of CPU slots that multithreading run can use at the same time, if it is 0, use the number of logical cores. Default: {}",
+                    CONFIG_DEFAULT_DICT[Config_key.scheduler_cpu_slots],
+                ),
+                Config_key.scheduler_memory_mb.name: gettext(
+                    "The memory (MiB) that multithreading run can use at the same time, if it is 0, use the total physical memory. Default: {}",
+                    CONFIG_DEFAULT_DICT[Config_key.scheduler_memory_mb],
+                ),
+                Config_key.scheduler_job_cost.name: gettext(
+                    "Override the cost of the preset or preset family in the format of dict[str, [CPU slots, memory MiB]] like {}. Families: {}. Default: {}",
+                    '{"x265": [16, 3072], "x265full": [32, 8192]}',
+                    "custom, subset, flac, copy, x264, x265, svtav1, vvenc, ffv1, hw",
+                    CONFIG_DEFAULT_DICT[Config_key.scheduler_job_cost],
+                ),
+                Config_key.output_cache_dir.name: gettext(
+                    "The directory of the output cache, when the value is empty, it is in the config directory. Default: {}",
+                    CONFIG_DEFAULT_DICT[Config_key.output_cache_dir] or '""',
+                ),
+                Config_key.output_cache_max_mb.name: gettext(
+                    "The max total size (MiB) of the output cache, the least recently used outputs are deleted first. Default: {}",
+                    CONFIG_DEFAULT_DICT[Config_key.output_cache_max_mb],
+                ),
+                Config_key.subset_cache_max_mb.name: gettext(
+                    "The max total size (MiB) of the subset font cache, the least recently used fonts are deleted first. Default: {}",
+                    CONFIG_DEFAULT_DICT[Config_key.subset_cache_max_mb],
+                ),
             }
             | (cls._config or {})
         ).get(key, "None about")
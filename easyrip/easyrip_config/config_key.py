@@ -1,6 +1,7 @@
 import enum
+from types import UnionType
 
-CONFIG_VERSION = "4.18.1"
+CONFIG_VERSION = "4.18.5"
 
 
 class Config_key(enum.Enum):
@@ -15,9 +16,15 @@ class Config_key(enum.Enum):
     save_prompt_history = enum.auto()
     refresh_progress_sec = enum.auto()
     proxies = enum.auto()
+    scheduler_cpu_slots = enum.auto()
+    scheduler_memory_mb = enum.auto()
+    scheduler_job_cost = enum.auto()
+    output_cache_dir = enum.auto()
+    output_cache_max_mb = enum.auto()
+    subset_cache_max_mb = enum.auto()
 
 
-CONFIG_TYPE_DICT: dict[Config_key, type] = {
+CONFIG_TYPE_DICT: dict[Config_key, type | UnionType] = {
     Config_key.language: str,
     Config_key.check_update: bool,
     Config_key.check_dependent: bool,
@@ -27,6 +34,12 @@ CONFIG_TYPE_DICT: dict[Config_key, type] = {
     Config_key.log_print_level: str,
     Config_key.log_write_level: str,
     Config_key.save_prompt_history: bool,
-    Config_key.refresh_progress_sec: int,
+    Config_key.refresh_progress_sec: int | float,
     Config_key.proxies: str,
+    Config_key.scheduler_cpu_slots: int,
+    Config_key.scheduler_memory_mb: int,
+    Config_key.scheduler_job_cost: dict[str, list[int]],
+    Config_key.output_cache_dir: str,
+    Config_key.output_cache_max_mb: int,
+    Config_key.subset_cache_max_mb: int,
 }
@@ -1,5 +1,6 @@
 import ast
 import ctypes
+import functools
 import itertools
 import json
 import os
@@ -35,9 +36,21 @@ from .easyrip_mlang import (
     translate_subtitles,
 )
 from .easyrip_prompt import easyrip_prompt
+from .ripper.bench import (
+    BENCH_CLIP_COUNT,
+    BENCH_CLIP_SEC,
+    Bench_config,
+    bench_to_table,
+    run_bench,
+    write_bench_json,
+)
+from .ripper.journal import Ripper_journal
 from .ripper.media_info import Media_info
+from .ripper.quality import Quality_metric
 from .ripper.ripper import Ripper
-from .ripper.sub_and_font import Ass, load_fonts
+from .ripper.scheduler import Scheduler, get_ripper_cost, sort_by_workload
+from .ripper.sub_and_font import Ass
+from .ripper.sub_and_font.font_index import get_font_info_list
 from .utils import change_title, check_ver, read_text, terminal_progress
 
 if TYPE_CHECKING:
@@ -179,7 +192,7 @@ def check_env() -> None:
                 )
 
             _url = "https://mkvtoolnix.download/downloads.html"
-            for _name in ("mkvpropedit", "mkvmerge"):
+            for _name in ("mkvmerge",):
                 if not shutil.which(_name):
                     log.warning(
                         "\n" + gettext("{} not found, download it: {}", _name, _url)
@@ -246,11 +259,36 @@ def file_dialog(
     return file_paths or ()
 
 
+def load_ripper_list_from_journal(journal: Ripper_journal) -> None:
+    """将任务日志中未完成的任务加入 Ripper list"""
+    record_list = [
+        record
+        for record in journal.get_unfinished_list()
+        if record.preset_name in Ripper.Preset_name._value2member_map_
+    ]
+    Ripper.add_ripper_list(
+        [
+            (
+                record.input_path_list,
+                record.output_prefix_list,
+                record.output_dir,
+                Ripper.Preset_name(record.preset_name),
+                record.option_map,
+            )
+            for record in record_list
+        ],
+        is_lazy=True,
+    )
+    log.info("Load {} unfinished Ripper from the journal", len(record_list))
+
+
 def run_ripper_list(
     *,
     is_exit_when_run_finished: bool = False,
     shutdow_sec_str: str | None = None,
     enable_multithreading: bool = False,
+    is_sort_cost: bool = False,
+    is_resume: bool = False,
 ) -> None:
     shutdown_sec: int | None = None
     if shutdow_sec_str is not None:
@@ -292,6 +330,28 @@ def run_ripper_list(
         ).encode("utf-8")
         path_lock_shm.buf[: len(_data)] = _data
 
+    # 任务日志，进程中断后用于恢复
+    journal = Ripper_journal()
+    if is_resume:
+        if not Ripper.ripper_list:
+            load_ripper_list_from_journal(journal)
+        _ripper_num = len(Ripper.ripper_list)
+        Ripper.ripper_list[:] = [
+            ripper for ripper in Ripper.ripper_list if not journal.is_done(ripper)
+        ]
+        if _skip_num := _ripper_num - len(Ripper.ripper_list):
+            log.info("Skip {} finished Ripper", _skip_num)
+    journal.add(Ripper.ripper_list)
+    for ripper in Ripper.ripper_list:
+        ripper.journal = journal
+
+    # 并行调度和按开销排序需要所有的媒体信息
+    if enable_multithreading or is_sort_cost:
+        Ripper.prepare_ripper_list(Ripper.ripper_list)
+
+    if is_sort_cost:
+        sort_by_workload(Ripper.ripper_list)
+
     total: Final[int] = len(Ripper.ripper_list)
     warning_num: Final[int] = log.warning_num
     error_num: Final[int] = log.error_num
@@ -312,16 +372,29 @@ def run_ripper_list(
             try:
                 if ripper.run() is False:
                     log.error("Run {} failed", "Ripper")
+                    journal.set_end(ripper, is_done=False)
             except Exception as e:
                 log.error(e, deep=True)
                 log.warning("Stop run Ripper")
                 terminal_progress.error()
+                journal.set_end(ripper, is_done=False)
 
         try:
-            with ThreadPoolExecutor() as executor:
-                for ripper in Ripper.ripper_list:
-                    executor.submit(_executor_submit_ripper_run, ripper)
-                    sleep(0.1)
+            scheduler = Scheduler.from_config()
+            log.info(
+                "Run Rippers with {} CPU slots and {} MiB memory",
+                scheduler.cpu_slots,
+                scheduler.memory_mb or "∞",
+            )
+            scheduler.run(
+                [
+                    (
+                        get_ripper_cost(ripper),
+                        functools.partial(_executor_submit_ripper_run, ripper),
+                    )
+                    for ripper in Ripper.ripper_list
+                ]
+            )
         except KeyboardInterrupt:
             log.warning("Manually stop run and clear Ripper list")
             Ripper.ripper_list.clear()
@@ -329,24 +402,38 @@ def run_ripper_list(
             raise
 
     else:
+        # 在执行当前 Ripper 时，提前准备之后的 lazy Ripper
+        prefetch_executor = ThreadPoolExecutor(max_workers=1)
+        prefetch_window: Final[int] = 2
+
         for i, ripper in enumerate(Ripper.ripper_list, 1):
+            for _ripper in Ripper.ripper_list[i : i + prefetch_window]:
+                if not _ripper.is_prepared:
+                    prefetch_executor.submit(_ripper.prepare)
+
             progress = f"{i} / {total} - {PROJECT_TITLE}"
             log.info(progress)
             change_title(progress)
             try:
                 if ripper.run() is False:
                     log.error("Run {} failed", "Ripper")
+                    journal.set_end(ripper, is_done=False)
             except Exception as e:
                 log.error(e, deep=True)
                 log.warning("Stop run Ripper")
                 terminal_progress.error()
+                journal.set_end(ripper, is_done=False)
             except KeyboardInterrupt:
                 log.warning("Manually stop run and clear Ripper list")
                 Ripper.ripper_list.clear()
                 terminal_progress.warning()
+                prefetch_executor.shutdown(wait=False, cancel_futures=True)
                 raise
+            ripper.release()
             sleep(0.5)
 
+        prefetch_executor.shutdown(wait=False, cancel_futures=True)
+
     if log.warning_num > warning_num:
         log.warning(
             "There are {} {} during run", log.warning_num - warning_num, "warning"
@@ -355,6 +442,7 @@ def run_ripper_list(
     if log.error_num > error_num:
         log.error("There are {} {} during run", log.error_num - error_num, "error")
         terminal_progress.error()
+    journal.clean()
     Ripper.ripper_list.clear()
     path_lock_shm.close()
 
@@ -616,7 +704,7 @@ def run_command(command: "Iterable[str] | str") -> bool:
                         _send_assinfo(font_sign, len(ss))
                 case Cmd_type.fontinfo:
                     for _font in itertools.chain.from_iterable(
-                        load_fonts(_path) for _path in _path_tuple
+                        get_font_info_list(_path) for _path in _path_tuple
                     ):
                         log.send(
                             f"{_font.pathname}: {_font.familys} / {_font.font_type.name}"
@@ -643,6 +731,8 @@ def run_command(command: "Iterable[str] | str") -> bool:
             match cmd_list[1]:
                 case "clear" | "clean":
                     Ripper.ripper_list.clear()
+                case "load":
+                    load_ripper_list_from_journal(Ripper_journal())
                 case "del" | "pop":
                     try:
                         del Ripper.ripper_list[int(cmd_list[2]) - 1]
@@ -652,7 +742,9 @@ def run_command(command: "Iterable[str] | str") -> bool:
                         log.info("Delete the {}th Ripper success", cmd_list[2])
                 case "sort":
                     reverse = "r" in cmd_list[2]
-                    if "n" in cmd_list[2]:
+                    if cmd_list[2] == "cost":
+                        sort_by_workload(Ripper.ripper_list)
+                    elif "n" in cmd_list[2]:
                         Ripper.ripper_list.sort(
                             key=lambda ripper: [
                                 int(text) if text.isdigit() else text.lower()
@@ -704,6 +796,10 @@ def run_command(command: "Iterable[str] | str") -> bool:
 
             _enable_multithreading: bool = False
 
+            _is_sort_cost: bool = False
+
+            _is_resume: bool = False
+
             _shutdown_sec_str: str | None = None
 
             _skip_run_param: int = 0
@@ -747,6 +843,22 @@ def run_command(command: "Iterable[str] | str") -> bool:
                             log.error("{} need param", cmd)
                             return False
 
+                    case "-sort-cost":
+                        _skip_run_param += 1
+                        if i + 1 < len(cmd_list[1:]):
+                            _is_sort_cost = cmd_list[i + 1] != "0"
+                        else:
+                            log.error("{} need param", cmd)
+                            return False
+
+                    case "-resume":
+                        _skip_run_param += 1
+                        if i + 1 < len(cmd_list[1:]):
+                            _is_resume = cmd_list[i + 1] != "0"
+                        else:
+                            log.error("{} need param", cmd)
+                            return False
+
                     case _ as param:
                         log.error("Unsupported param: {}", param)
                         return False
@@ -756,6 +868,8 @@ def run_command(command: "Iterable[str] | str") -> bool:
                     is_exit_when_run_finished=is_run_exit,
                     shutdow_sec_str=_shutdown_sec_str,
                     enable_multithreading=_enable_multithreading,
+                    is_sort_cost=_is_sort_cost,
+                    is_resume=_is_resume,
                 )
             else:
                 easyrip_web.run_server(
@@ -764,6 +878,8 @@ def run_command(command: "Iterable[str] | str") -> bool:
                         is_exit_when_run_finished=is_run_exit,
                         shutdow_sec_str=_shutdown_sec_str,
                         enable_multithreading=_enable_multithreading,
+                        is_sort_cost=_is_sort_cost,
+                        is_resume=_is_resume,
                     ),
                 )
 
@@ -850,6 +966,64 @@ def run_command(command: "Iterable[str] | str") -> bool:
                             is_format=False,
                         )
 
+        case Cmd_type.bench:
+            if not cmd_list[1]:
+                log.error("{} param illegal", "bench")
+                return False
+
+            bench_input = Path(cmd_list[1])
+            if not bench_input.is_file():
+                log.error('The file "{}" does not exist', bench_input)
+                return False
+
+            bench_config_list: list[Bench_config] = []
+            bench_clip_count: int = BENCH_CLIP_COUNT
+            bench_clip_sec: float = BENCH_CLIP_SEC
+            bench_metric: Quality_metric | None = None
+            _skip: int = 0
+            for i, s in enumerate(cmd_list[2:-1], 2):
+                if _skip:
+                    _skip -= 1
+                    continue
+                try:
+                    match s:
+                        case "-n":
+                            bench_clip_count = int(cmd_list[i + 1])
+                            _skip = 1
+                        case "-t":
+                            bench_clip_sec = float(cmd_list[i + 1])
+                            _skip = 1
+                        case "-quality-detection":
+                            bench_metric = Quality_metric(cmd_list[i + 1])
+                            _skip = 1
+                        case _:
+                            bench_config_list.append(Bench_config.from_str(s))
+                except ValueError as e:
+                    log.error("{} param illegal", f"{s}: {e}")
+                    return False
+
+            if not bench_config_list or bench_clip_count <= 0 or bench_clip_sec <= 0:
+                log.error("{} param illegal", "bench")
+                return False
+
+            bench_result_list = run_bench(
+                bench_input,
+                bench_config_list,
+                clip_count=bench_clip_count,
+                clip_sec=bench_clip_sec,
+                metric=bench_metric,
+            )
+            log.send(bench_to_table(bench_result_list), is_format=False)
+            try:
+                write_bench_json(
+                    Path(f"{bench_input.stem}.bench.json"),
+                    bench_input,
+                    bench_result_list,
+                )
+            except OSError as e:
+                log.error(e)
+            return not any(result.is_failed for result in bench_result_list)
+
         case Cmd_type.translate:
             if not (_infix := cmd_list[1]):
                 log.error("Need target infix")
@@ -927,6 +1101,9 @@ def run_command(command: "Iterable[str] | str") -> bool:
             is_exit_when_run_finished: bool = False
             shutdown_sec_str: str | None = None
             enable_multithreading: bool = False
+            is_sort_cost: bool = False
+            is_resume: bool = False
+            is_lazy_probe: bool = False
 
             _skip: int = 0
             for i in range(len(cmd_list)):
@@ -1012,6 +1189,36 @@ def run_command(command: "Iterable[str] | str") -> bool:
                                 log.error("Unsupported param: {}", cmd_list[i + 1])
                                 return False
 
+                    case "-sort-cost":
+                        match cmd_list[i + 1]:
+                            case "0":
+                                is_sort_cost = False
+                            case "1":
+                                is_sort_cost = True
+                            case _:
+                                log.error("Unsupported param: {}", cmd_list[i + 1])
+                                return False
+
+                    case "-resume":
+                        match cmd_list[i + 1]:
+                            case "0":
+                                is_resume = False
+                            case "1":
+                                is_resume = True
+                            case _:
+                                log.error("Unsupported param: {}", cmd_list[i + 1])
+                                return False
+
+                    case "-lazy-probe":
+                        match cmd_list[i + 1]:
+                            case "0":
+                                is_lazy_probe = False
+                            case "1":
+                                is_lazy_probe = True
+                            case _:
+                                log.error("Unsupported param: {}", cmd_list[i + 1])
+                                return False
+
                     case str() as s if len(s) > 1 and s.startswith("-"):
                         option_map[s[1:]] = cmd_list[i + 1]
 
@@ -1042,6 +1249,16 @@ def run_command(command: "Iterable[str] | str") -> bool:
                     log.warning("Input file number == 0")
                     return False
 
+                ripper_args_list: list[
+                    tuple[
+                        list[Path],
+                        list[str | None],
+                        Path | None,
+                        Ripper.Preset_name,
+                        dict[str, str],
+                    ]
+                ] = []
+
                 for i, input_pathname in enumerate(input_pathname_org_list):
                     new_option_map = option_map.copy()
 
@@ -1146,14 +1363,16 @@ def run_command(command: "Iterable[str] | str") -> bool:
                                     _output_base_suffix_name.suffix
                                     or _output_base_suffix_name.stem
                                 )
-                                Ripper.add_ripper(
-                                    input_path_list,
-                                    [
-                                        f"{new_output_basename or _input_basename.stem}{_output_base_suffix_name}"
-                                    ],
-                                    output_dir,
-                                    preset_name,
-                                    new_option_map,
+                                ripper_args_list.append(
+                                    (
+                                        input_path_list,
+                                        [
+                                            f"{new_output_basename or _input_basename.stem}{_output_base_suffix_name}"
+                                        ],
+                                        output_dir,
+                                        preset_name,
+                                        new_option_map.copy(),
+                                    )
                                 )
 
                         elif sub_list_len == 0:
@@ -1165,23 +1384,30 @@ def run_command(command: "Iterable[str] | str") -> bool:
 
                         else:
                             new_option_map["sub"] = sub_list[0]
-                            Ripper.add_ripper(
+                            ripper_args_list.append(
+                                (
+                                    input_path_list,
+                                    [new_output_basename],
+                                    output_dir,
+                                    preset_name,
+                                    new_option_map,
+                                )
+                            )
+
+                    else:
+                        ripper_args_list.append(
+                            (
                                 input_path_list,
                                 [new_output_basename],
                                 output_dir,
                                 preset_name,
                                 new_option_map,
                             )
-
-                    else:
-                        Ripper.add_ripper(
-                            input_path_list,
-                            [new_output_basename],
-                            output_dir,
-                            preset_name,
-                            new_option_map,
                         )
 
+                # 并发探测所有输入
+                Ripper.add_ripper_list(ripper_args_list, is_lazy=is_lazy_probe)
+
             except KeyError as e:
                 log.error("Unsupported option: {}", e)
                 return False
@@ -1192,6 +1418,8 @@ def run_command(command: "Iterable[str] | str") -> bool:
                         is_exit_when_run_finished=is_exit_when_run_finished,
                         shutdow_sec_str=shutdown_sec_str,
                         enable_multithreading=enable_multithreading,
+                        is_sort_cost=is_sort_cost,
+                        is_resume=is_resume,
                     )
                 else:
                     easyrip_web.run_server(
@@ -1200,6 +1428,8 @@ def run_command(command: "Iterable[str] | str") -> bool:
                             is_exit_when_run_finished=is_exit_when_run_finished,
                             shutdow_sec_str=shutdown_sec_str,
                             enable_multithreading=enable_multithreading,
+                            is_sort_cost=is_sort_cost,
+                            is_resume=is_resume,
                         ),
                     )
 
@@ -48,14 +48,19 @@ LANG_MAP: dict[str, str] = {
     Cmd_type.list.value.description: "操作 Ripper list",
     Cmd_type.list.value.childs[0].description: "打印 Ripper list",
     Cmd_type.list.value.childs[1].description: "清空 Ripper list",
-    Cmd_type.list.value.childs[2].description: "删除 Ripper list 中指定的一个 Ripper",
-    Cmd_type.list.value.childs[3].description: (
+    Cmd_type.list.value.childs[2].description: (
+        "从当前目录的任务日志中加载未完成的 Ripper\n"  # .
+        "例如程序中断后"
+    ),
+    Cmd_type.list.value.childs[3].description: "删除 Ripper list 中指定的一个 Ripper",
+    Cmd_type.list.value.childs[4].description: (
         "排序 list\n"  # .
         "'n': 自然排序\n"
-        "'r': 倒序"
+        "'r': 倒序\n"
+        "'cost': 最长任务优先, 按媒体信息和 preset 估算的开销排序"
     ),
-    Cmd_type.list.value.childs[4].description: "交换指定索引",
-    Cmd_type.run.value.param: "[<run 选项>] [-multithreading <0 | 1>]",
+    Cmd_type.list.value.childs[5].description: "交换指定索引",
+    Cmd_type.run.value.param: "[<run 选项>] [-multithreading <0 | 1>] [-sort-cost <0 | 1>] [-resume <0 | 1>]",
     Cmd_type.run.value.description: "执行 Ripper list 中的 Ripper",
     Cmd_type.run.value.childs[0].description: "仅执行",
     Cmd_type.run.value.childs[1].description: "执行后退出程序",
@@ -96,6 +101,17 @@ LANG_MAP: dict[str, str] = {
         "  -strict     不跳过覆写所有已经存在的文件并在有已存在文件时退出\n"
         "例如 'translate zh-Hans zh-Hant' 将翻译所有 '*.zh-Hans.ass' 文件为 zh-Hant"
     ),
+    Cmd_type.bench.value.param: (
+        "<输入> <预设名>[?<选项>=<值>...] [...] [-n <整数>] [-t <秒数>] [-quality-detection <算法>]"
+    ),
+    Cmd_type.bench.value.description: (
+        "从输入中截取均匀分布的片段, 以每个预设或选项组合编码,\n"
+        '在表格和 "<输入文件名>.bench.json" 中报告编码帧率、码率和画质\n'
+        "  -n                  片段数量, 默认: 3\n"
+        "  -t                  每个片段的时长, 默认: 10\n"
+        "  -quality-detection  ssim | psnr | vmaf, 默认: 不检测画质\n"
+        "例如 'bench in.mkv x265fast2 x265slow x265slow?crf=22 -quality-detection ssim'"
+    ),
     Cmd_type.mediainfo.value.description: "使用 Media_info 类获取媒体信息",
     Cmd_type.assinfo.value.description: "使用 Ass 类获取 ASS 信息",
     Cmd_type.fontinfo.value.description: "使用 Font 类获取字体信息",
@@ -234,10 +250,82 @@ LANG_MAP: dict[str, str] = {
     Opt_type._hevc_strict.value.description: (
         "当分辨率 >= 4K 时, 关闭 HME, 并自动降低 -ref"
     ),
+    Opt_type._output_cache.value.description: (
+        "启用输出缓存, 输入文件、命令、选项和工具版本都相同时, 直接复制之前的输出 (文件系统支持时使用 reflink), 不再编码\n"
+        "1: 以大小和修改时间作为输入文件的指纹\n"
+        "hash: 再加上文件首尾的部分哈希\n"
+        "不能用于 -p custom, -p subset, .vpy, -pipe, -soft-sub"
+    ),
+    Opt_type._crf.value.description: (
+        "设置 x264, x265 和 svtav1 preset 中的 CRF\n"
+        "auto: 编码前, 以多个 CRF 并行编码均匀分布的样本,\n"
+        "用 -quality-detection 的指标评分, 插值出平均分恰好达到目标的 CRF\n"
+        "默认指标和目标: ssim:0.98, psnr:40, vmaf:93\n"
+        "样本经过 -vf, 但不烧录 -sub 的字幕\n"
+        "同时编码的样本数取决于 -parallel-jobs 或 preset 的 CPU 开销\n"
+        "不能与 -pipe 或 .vpy 同时使用"
+    ),
+    Opt_type._quality_detection_mode.value.description: (
+        "-quality-detection 比较输出和源的方式\n"  # .
+        "\n"
+        "模式:"
+    ),
+    Opt_type._quality_detection_mode.value.childs[1].description: (
+        "编码完成后再次解码源和输出"
+    ),
+    Opt_type._quality_detection_mode.value.childs[2].description: (
+        "在视频 preset 中, 用回环解码器解码编码后的流, 在同一个 FFmpeg 中比较,\n"
+        "源只解码一次\n"
+        "需要 FFmpeg >= 7.0, 不能与 -hwaccel 同时使用"
+    ),
+    Opt_type._quality_detection_mode.value.childs[3].description: (
+        "编码完成后, 只并行比较均匀分布的 <count> 个 <sec> 秒的片段\n默认: sample:10:2"
+    ),
+    Opt_type._chunk.value.description: (
+        "在视频 preset 中, 将输入在关键帧处分为此数量的段,\n"
+        "同时编码所有段, 再无损拼接\n"
+        "不能与 -pipe, .vpy, -ss, -t, -sub 或 -vf 同时使用\n"
+        "若 <= 1, 则不分段"
+    ),
+    Opt_type._flac_pipe.value.description: (
+        "在 -p flac 中, 将 FFmpeg 输出的 PCM 直接通过管道送入 flac, 不写临时 WAV 文件\n"  # .
+        "若为 0, 则先写入临时 WAV 文件"
+    ),
+    Opt_type._parallel_jobs.value.description: (
+        "并行命令组中同时执行的命令的最大数量\n"
+        "例如 -p flac 中各轨道的编码, -chunk 的各段\n"
+        "默认: 逻辑核心数 // 8, 至少为 1。-chunk 为所有段\n"
+        "也限制 -p subset 中子集化字体的进程数,\n"
+        "其默认值为逻辑核心数, 与主命令并行时为一半"
+    ),
+    Opt_type._nice.value.description: (
+        "增加 Ripper 执行的命令的 niceness, 降低其 CPU 优先级\n"
+        "Windows 中, 大于 0 时为低于正常, >= 10 时为空闲优先级, 负数时相反"
+    ),
+    Opt_type._cpu_affinity.value.description: (
+        "将 Ripper 执行的命令限制在这些 CPU 上, 仅在 Linux 中生效\n"  # .
+        "例如 0-3,6"
+    ),
+    Opt_type._pipe_size.value.description: (
+        "命令之间的管道的缓冲区字节数, 例如 vspipe | ffmpeg, 仅在 Linux 中生效\n"
+        "默认: 系统默认值"
+    ),
     Opt_type._multithreading.value.description: (
         "使用多线程执行 Ripper list, 适合性能占用低的情况\n"  # .
         "例如 -p subset 或 -p copy"
     ),
+    Opt_type._sort_cost.value.description: (
+        "执行前按估算的开销排序 Ripper list, 最长任务优先\n"  # .
+        "与 -multithreading 一起使用时可缩短总耗时"
+    ),
+    Opt_type._resume.value.description: (
+        "从当前目录的任务日志恢复, 跳过已完成的 Ripper, 并清理未完成的临时文件\n"
+        "若 Ripper list 为空, 则先从任务日志中加载未完成的 Ripper"
+    ),
+    Opt_type._lazy_probe.value.description: (
+        "加入 Ripper list 时不探测媒体信息, 在执行前才探测\n"  # .
+        "适合非常大的 Ripper list"
+    ),
     # utils
     "{} has new version ({} -> {}). Suggest upgrading it: {}": "检测到 {} 有新版本 ({} -> {})。建议更新: {}",
     "{} not found, download it: {}": "没找到 {}, 在此下载: {}",
@@ -249,6 +337,7 @@ LANG_MAP: dict[str, str] = {
     "Easy Rip command": "Easy Rip 命令",
     "Stop run and clear Ripper list": "终止执行并清空 Ripper list",
     "Manually stop run and clear Ripper list": "手动终止执行并清空 Ripper list",
+    "Run Rippers with {} CPU slots and {} MiB memory": "使用 {} 个 CPU 槽位和 {} MiB 内存执行 Ripper",
     "There are {} {} during run": "执行期间有 {} 个 {}",
     "Execute shutdown in {}s": "{}s 后执行关机",
     "{} run completed, shutdown in {}s": "{} 执行完成, {}s 后关机",
@@ -300,6 +389,32 @@ LANG_MAP: dict[str, str] = {
     "{} param illegal: {}": "{} 参数非法: {}",
     'The file "{}" already exists, skip translating it': '文件 "{}" 已存在, 跳过翻译',
     "Subset failed, cancel mux": "子集化失败, 取消混流",
+    'Output cache hit, skip encoding: "{}"': '命中输出缓存, 跳过编码: "{}"',
+    "{} < threshold {} in {} frames: {}": "{} < 阈值 {} 的帧有 {} 个: {}",
+    "Bench {} clip {}/{}": "测速 {} 片段 {}/{}",
+    "Search CRF for {} = {} in {} samples: {}": "搜索 {} = {} 的 CRF, 样本数 {}: {}",
+    "Auto CRF = {}, {} of the samples: {}": "自动 CRF = {}, 样本的 {}: {}",
+    "{} min = {}, mean = {}, 1% low = {}, 5% low = {}": (
+        "{} 最小值 = {}, 平均值 = {}, 1% 低值 = {}, 5% 低值 = {}"
+    ),
+    "Output cache is disabled: {}": "输出缓存已禁用: {}",
+    "Resource usage of the command {}: {}": "命令 {} 的资源使用量: {}",
+    "Run in shell: {}": "在 shell 中执行: {}",
+    "Can not set the pipe size: {}": "无法设置管道大小: {}",
+    "'{}' has no effect on this platform": "'{}' 在此平台上无效",
+    "The pipe can not detect the failure of FFmpeg, use temporary WAV files": "管道无法察觉 FFmpeg 的失败, 使用临时 WAV 文件",
+    "Update font index: {} files": "更新字体索引: {} 个文件",
+    "Font index is disabled: {}": "字体索引已禁用: {}",
+    "Process pool is unavailable, subset fonts one by one: {}": "进程池不可用, 逐个子集化字体: {}",
+    "Subset cache is disabled: {}": "子集化缓存已禁用: {}",
+    "Subset cache hit: {}/{} fonts": "命中子集化缓存: {}/{} 个字体",
+    'Unicode decode error in font "{}". Skip this font': '字体 "{}" 中有 Unicode 解码错误, 跳过此字体',
+    "Load {} unfinished Ripper from the journal": "从任务日志中加载了 {} 个未完成的 Ripper",
+    "Skip {} finished Ripper": "跳过 {} 个已完成的 Ripper",
+    'Delete the unfinished temporary file "{}"': '删除未完成的临时文件 "{}"',
+    "Failed to load journal: {}": "加载任务日志失败: {}",
+    "Failed to save journal: {}": "保存任务日志失败: {}",
+    "{} can not be used with {}, disable it": "{} 不能与 {} 同时使用, 已禁用",
     "FFmpeg report: {}": "FFmpeg 报告: {}",
     "{} not found. Skip it": "没找到 {}。默认跳过",
     "{} not found. Skip it. Perhaps you want the {}": "没找到 {}。默认跳过。或许你想要的是 {}",
@@ -321,6 +436,7 @@ LANG_MAP: dict[str, str] = {
     "User profile is not found, regenerate config": "用户配置文件不存在, 重新生成配置",
     "User profile is not a valid dictionary": "用户配置文件不是有效的字典",
     "User profile is not found in config file": "用户配置文件不存在于配置文件",
+    "The config '{}' has an illegal value for '{}': {}": "配置 '{}' 中 '{}' 的值非法: {}",
     "Type mismatch: need '{}'": "类型不匹配: 需要 '{}'",
     "Key '{}' is not found in user profile": "用户配置文件中不存在 {}",
     # config about
@@ -333,7 +449,13 @@ LANG_MAP: dict[str, str] = {
     "Logs this level and above will be printed, and if the value is '{}', they will not be printed. Default: {}. Supported: {}": "此等级及以上的日志会打印到控制台, 若值为 '{}' 则不打印。默认: {}。支持: {}",
     "Logs this level and above will be written, and if the value is '{}', the '{}' only be written when 'server', they will not be written. Default: {}. Supported: {}": "此等级及以上的日志会写入日志文件, 若值为 '{}' 则不写入, '{}' 仅在 'server' 时写入。默认: {}。支持: {}",
     "Save prompt history to config directory, otherwise save to memory. Take effect after reboot. Default: {}": "将 prompt 历史保存到 config 目录，否则保存到内存。重启后生效。默认: {}",
-    "Refresh progress interval. Default: {}": "刷新进度间隔。默认: {}",
+    "Refresh progress interval in seconds, decimals are allowed. Default: {}": "刷新进度间隔 (秒)，允许小数。默认: {}",
+    "The number of CPU slots that multithreading run can use at the same time, if it is 0, use the number of logical cores. Default: {}": "多线程运行时可同时使用的 CPU 槽位数, 为 0 时使用逻辑核心数。默认: {}",
+    "The memory (MiB) that multithreading run can use at the same time, if it is 0, use the total physical memory. Default: {}": "多线程运行时可同时使用的内存 (MiB), 为 0 时使用物理内存总量。默认: {}",
+    "Override the cost of the preset or preset family in the format of dict[str, [CPU slots, memory MiB]] like {}. Families: {}. Default: {}": "覆盖 preset 或 preset 族的开销, 格式为 dict[str, [CPU 槽位数, 内存 MiB]], 例如 {}。族: {}。默认: {}",
+    "The directory of the output cache, when the value is empty, it is in the config directory. Default: {}": "输出缓存的目录, 值为空时在配置目录中。默认: {}",
+    "The max total size (MiB) of the output cache, the least recently used outputs are deleted first. Default: {}": "输出缓存的最大总体积 (MiB), 优先删除最久未使用的输出。默认: {}",
+    "The max total size (MiB) of the subset font cache, the least recently used fonts are deleted first. Default: {}": "子集化字体缓存的最大总体积 (MiB), 优先删除最久未使用的字体。默认: {}",
     # 第三方 API
     "Translating into '{target_lang}' using '{api_name}'": "正在使用 '{api_name}' 翻译为 '{target_lang}'",
     # mlang
@@ -0,0 +1,239 @@
+import json
+import shutil
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Final, Self, final
+
+from ..easyrip_log import log
+from ..utils import get_base62_time
+from .media_info import Media_info, get_keyframe_list
+from .param import Preset_name
+from .process import run_cmd
+from .quality import (
+    Quality_metric,
+    Quality_stats,
+    get_compare_cmd,
+    get_sample_window_list,
+)
+from .ripper import Ripper
+
+BENCH_CLIP_COUNT: Final[int] = 3
+BENCH_CLIP_SEC: Final[float] = 10
+
+_IGNORED_OPTION_KEY_SET: Final[frozenset[str]] = frozenset(
+    {"ss", "t", "chunk", "output-cache", "quality-detection"}
+)
+"""由 bench 控制或会使测速失真的选项"""
+
+
+@final
+@dataclass(slots=True)
+class Bench_config:
+    preset_name: Preset_name
+    option_map: dict[str, str] = field(default_factory=dict[str, str])
+
+    @classmethod
+    def from_str(cls, s: str) -> Self:
+        """
+        <preset name>[?<option>=<val>...]
+
+        例如 x265slow?crf=22?psy-rd=1.5
+        """
+        preset_name_str, *option_list = s.split("?")
+        if preset_name_str not in Preset_name._value2member_map_:
+            raise ValueError(s)
+        option_map: dict[str, str] = {}
+        for option in option_list:
+            key, sep, val = option.partition("=")
+            if not (key and sep):
+                raise ValueError(s)
+            option_map[key.lstrip("-")] = val
+        return cls(Preset_name(preset_name_str), option_map)
+
+    def __str__(self) -> str:
+        return "?".join(
+            (self.preset_name.value, *(f"{k}={v}" for k, v in self.option_map.items()))
+        )
+
+
+@final
+@dataclass(slots=True)
+class Bench_result:
+    config: str
+    clip_count: int = 0
+    frame_count: int = 0
+    duration: float = 0
+    """片段总时长 s"""
+    encode_sec: float = 0
+    """编码总耗时 s，包括 Ripper 中复用等步骤"""
+    size: int = 0
+    """输出总体积 B"""
+    quality: dict[str, object] | None = None
+    is_failed: bool = False
+
+    @property
+    def fps(self) -> float:
+        return self.frame_count / self.encode_sec if self.encode_sec else 0
+
+    @property
+    def bitrate(self) -> float:
+        """kb/s"""
+        return self.size * 8 / 1000 / self.duration if self.duration else 0
+
+    def to_dict(self) -> dict[str, object]:
+        return asdict(self) | {
+            "fps": round(self.fps, 3),
+            "bitrate": round(self.bitrate, 3),
+        }
+
+
+def run_bench(
+    input_path: Path,
+    config_list: list[Bench_config],
+    *,
+    clip_count: int = BENCH_CLIP_COUNT,
+    clip_sec: float = BENCH_CLIP_SEC,
+    metric: Quality_metric | None = None,
+) -> list[Bench_result]:
+    """
+    从输入中截取均匀分布的片段，以每种配置通过正常的 Ripper 编码，统计速度、码率和画质
+
+    片段总时长不短于输入时使用整个输入
+    """
+    media_info = Media_info.from_path(input_path)
+    # (-ss, -t)
+    clip_list: list[tuple[float, float] | None] = [
+        (start, clip_sec)
+        for start in get_sample_window_list(media_info.duration, clip_count, clip_sec)
+    ] or [None]
+
+    bench_dir = Path(f"bench_temp_{get_base62_time()}")
+    bench_dir.mkdir()
+
+    result_list: list[Bench_result] = []
+    try:
+        for i, config in enumerate(config_list):
+            result = Bench_result(str(config))
+            result_list.append(result)
+            stats = (
+                None
+                if metric is None
+                else Quality_stats(metric, metric.default_threshold)
+            )
+
+            for j, clip in enumerate(clip_list):
+                basename = f"bench_{i}_{j}"
+                option_map = {
+                    k: v
+                    for k, v in config.option_map.items()
+                    if k not in _IGNORED_OPTION_KEY_SET
+                }
+                if clip is not None:
+                    option_map |= {"ss": f"{clip[0]:.6f}", "t": f"{clip[1]:g}"}
+
+                log.info("Bench {} clip {}/{}", config, j + 1, len(clip_list))
+                start_time = time.perf_counter()
+                is_ok = Ripper(
+                    [input_path],
+                    [basename],
+                    bench_dir,
+                    config.preset_name,
+                    option_map,
+                ).run()
+                encode_sec = time.perf_counter() - start_time
+
+                output_path = next(
+                    (
+                        path
+                        for path in bench_dir.glob(f"{basename}.*")
+                        if path.is_file() and path.suffix != ".json"
+                    ),
+                    None,
+                )
+                if not is_ok or output_path is None:
+                    result.is_failed = True
+                    break
+
+                result.clip_count += 1
+                result.encode_sec += encode_sec
+                result.size += output_path.stat().st_size
+                result.frame_count += get_keyframe_list(output_path)[1]
+                result.duration += clip[1] if clip else media_info.duration
+
+                if stats is not None:
+                    log_path = output_path.with_suffix(".quality.log")
+                    if run_cmd(
+                        get_compare_cmd(
+                            stats.metric,
+                            input_path,
+                            output_path,
+                            log_path,
+                            ref_seek=(
+                                f"-ss {clip[0]:.6f} -t {clip[1]:g} " if clip else ""
+                            ),
+                        ),
+                    ):
+                        log.error("Run {} failed", "-quality-detection")
+                    else:
+                        stats.add_log(log_path)
+
+                output_path.unlink()
+
+            if stats is not None and stats.count:
+                result.quality = stats.to_dict()
+
+    finally:
+        shutil.rmtree(bench_dir, ignore_errors=True)
+
+    return result_list
+
+
+def bench_to_table(result_list: list[Bench_result]) -> str:
+    def _score(val: object) -> str:
+        """Quality_stats.to_dict 将 inf 和 nan 保存为 None，有帧时只会是完全相同的帧的 PSNR"""
+        return "inf" if val is None else f"{val:.6g}"
+
+    header = ("Config", "FPS", "Bitrate (kb/s)", "Size (MiB)", "Quality mean / min")
+    row_list: list[tuple[str, ...]] = [header]
+    for result in result_list:
+        if result.is_failed:
+            row_list.append((result.config, "failed", "", "", ""))
+            continue
+        quality = result.quality or {}
+        row_list.append(
+            (
+                result.config,
+                f"{result.fps:.2f}",
+                f"{result.bitrate:.1f}",
+                f"{result.size / 2**20:.2f}",
+                (
+                    f"{str(quality['metric']).upper()} {_score(quality['mean'])} / {_score(quality['min'])}"
+                    if quality
+                    else "-"
+                ),
+            )
+        )
+
+    width_list = [max(len(row[k]) for row in row_list) for k in range(len(header))]
+    return "\n".join(
+        "  ".join(s.ljust(width) for s, width in zip(row, width_list, strict=True))
+        for row in row_list
+    )
+
+
+def write_bench_json(
+    path: Path,
+    input_path: Path,
+    result_list: list[Bench_result],
+) -> None:
+    with path.open("wt", encoding="utf-8", newline="\n") as f:
+        json.dump(
+            {
+                "input": str(input_path),
+                "result_list": [result.to_dict() for result in result_list],
+            },
+            f,
+            ensure_ascii=False,
+            indent=3,
+        )
@@ -0,0 +1,218 @@
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Final, Self, final
+
+from ..easyrip_log import log
+from ..utils import get_base62_time
+from .param import Preset_name
+from .process import Process_option, run_cmd
+from .quality import (
+    Quality_metric,
+    Quality_stats,
+    get_compare_cmd,
+    get_sample_window_list,
+)
+from .scheduler import get_ripper_cost
+
+if TYPE_CHECKING:
+    from .ripper import Ripper
+
+CRF_SAMPLE_COUNT: Final[int] = 4
+CRF_SAMPLE_SEC: Final[float] = 2
+
+_DEFAULT_TARGET_DICT: Final[dict[Quality_metric, float]] = {
+    Quality_metric.ssim: 0.98,
+    Quality_metric.psnr: 40,
+    Quality_metric.vmaf: 93,
+}
+
+_CRF_CANDIDATE_TUPLE: Final[tuple[float, ...]] = (14, 18, 22, 26, 30)
+_SVTAV1_CRF_CANDIDATE_TUPLE: Final[tuple[float, ...]] = (20, 27, 34, 41, 48)
+
+
+@final
+@dataclass(slots=True)
+class Crf_auto:
+    metric: Quality_metric
+    target: float
+
+    @classmethod
+    def from_option_map(cls, option_map: dict[str, str]) -> Self | None:
+        """
+        解析 -crf auto[:<metric>[:<target>]]
+
+        参数错误时记录日志并使用默认值，不是 auto 时返回 None
+        """
+        if not (crf := option_map.get("crf", "")).startswith("auto"):
+            return None
+
+        _param_list = crf.split(":")
+        metric = Quality_metric.ssim
+        if len(_param_list) > 1:
+            try:
+                metric = Quality_metric(_param_list[1])
+            except ValueError:
+                log.error(
+                    "Param error from '{}': {}",
+                    "-crf",
+                    f"{_param_list[1]} -> {metric.value}",
+                )
+
+        target = _DEFAULT_TARGET_DICT[metric]
+        if len(_param_list) > 2:
+            try:
+                target = float(_param_list[2])
+            except ValueError as e:
+                log.error("Param error from '{}': {}", "-crf", e)
+
+        return cls(metric, target)
+
+
+def get_crf_candidate_tuple(preset_name: Preset_name) -> tuple[float, ...]:
+    return (
+        _SVTAV1_CRF_CANDIDATE_TUPLE
+        if preset_name == Preset_name.svtav1
+        else _CRF_CANDIDATE_TUPLE
+    )
+
+
+def interpolate_crf(score_list: list[tuple[float, float]], target: float) -> float:
+    """
+    在 (CRF, 分数) 中线性插值出分数恰好为目标值的 CRF
+
+    分数随 CRF 增大而降低，超出范围时取最接近目标的端点
+    """
+    score_list = sorted(score_list)
+    if score_list[0][1] <= target:
+        return score_list[0][0]
+    for (crf0, score0), (crf1, score1) in itertools.pairwise(score_list):
+        if score0 >= target >= score1:
+            if score0 == score1:
+                return crf0
+            return crf0 + (score0 - target) * (crf1 - crf0) / (score0 - score1)
+    return score_list[-1][0]
+
+
+def search_crf(ripper: "Ripper", crf_auto: Crf_auto) -> str | None:
+    """
+    在均匀分布的样本片段上以多个 CRF 同时编码，评分后插值出达到目标的 CRF
+
+    样本编码经过 -vf，评分时源也经过 -vf，-sub 的字幕在定位后时间错位，不烧录
+    失败时返回 None
+    """
+    if not (enc_opt_format := ripper.option.crf_auto_enc_opt):
+        return None
+
+    duration = ripper.media_info.duration
+    start_list: list[float] = get_sample_window_list(
+        duration, CRF_SAMPLE_COUNT, CRF_SAMPLE_SEC
+    )
+    # 样本总时长不短于总时长时，使用整个输入
+    seek_list: list[str] = [
+        f"-ss {start:.6f} -t {CRF_SAMPLE_SEC} " for start in start_list
+    ] or [""]
+
+    crf_candidate_tuple = get_crf_candidate_tuple(ripper.preset_name)
+    hwaccel = (
+        f"-hwaccel {hwaccel} " if (hwaccel := ripper.option_map.get("hwaccel")) else ""
+    )
+    _vf = ripper.option_map.get("vf", "")
+    process_option = Process_option.from_option_map(ripper.option_map)
+    sample_prefix = f"FFCrfSample.{get_base62_time()}.{id(ripper):x}"
+
+    def _run_sample(crf: float, j: int) -> Path | None:
+        """编码并评分一个样本，返回逐帧数据文件"""
+        sample_file = Path(f"{sample_prefix}.{crf:g}.{j}.mkv")
+        sample_log = sample_file.with_suffix(".log")
+        try:
+            if run_cmd(
+                f"ffmpeg -hide_banner -v error -y {hwaccel}{seek_list[j]}"
+                f'-i "{ripper.input_path_list[0]}" -map 0:v:0 -an -sn -dn '
+                f"{enc_opt_format.replace('{crf}', f'{crf:g}')} "
+                + (f'-vf "{_vf}" ' if _vf else "")
+                + f'"{sample_file}"',
+                option=process_option,
+            ) or run_cmd(
+                get_compare_cmd(
+                    crf_auto.metric,
+                    ripper.input_path_list[0],
+                    sample_file,
+                    sample_log,
+                    ref_seek=seek_list[j],
+                    ref_vf=_vf,
+                ),
+                option=process_option,
+            ):
+                sample_log.unlink(missing_ok=True)
+                return None
+        finally:
+            sample_file.unlink(missing_ok=True)
+        return sample_log
+
+    log.info(
+        "Search CRF for {} = {} in {} samples: {}",
+        crf_auto.metric.value.upper(),
+        crf_auto.target,
+        len(seek_list),
+        crf_candidate_tuple,
+    )
+
+    task_list = [(crf, j) for crf in crf_candidate_tuple for j in range(len(seek_list))]
+
+    # 每个编码器已使用多个核心，按调度器的开销限制同时编码的样本数
+    max_workers: int = max(
+        1, (os.cpu_count() or 1) // max(1, get_ripper_cost(ripper).cpu_slots)
+    )
+    if (_parallel_jobs := ripper.option_map.get("parallel-jobs")) is not None:
+        try:
+            max_workers = max(1, int(_parallel_jobs))
+        except ValueError:
+            log.error("{} param illegal", f"-parallel-jobs {_parallel_jobs}")
+
+    with ThreadPoolExecutor(
+        max_workers=min(len(task_list), max_workers),
+        thread_name_prefix="Ripper_crf_search",
+    ) as executor:
+        sample_log_list = list(executor.map(lambda task: _run_sample(*task), task_list))
+
+    score_list: list[tuple[float, float]] = []
+    try:
+        if None in sample_log_list:
+            log.error("Run {} failed", "-crf auto")
+            return None
+
+        for crf in crf_candidate_tuple:
+            stats = Quality_stats(crf_auto.metric, crf_auto.target)
+            for (_crf, _), sample_log in zip(task_list, sample_log_list, strict=True):
+                if _crf == crf and sample_log is not None:
+                    stats.add_log(sample_log)
+            if not stats.count:
+                log.error("Run {} failed", "-crf auto")
+                return None
+            score_list.append((crf, stats.mean))
+
+    except (OSError, ValueError) as e:
+        log.error(e)
+        return None
+
+    finally:
+        for sample_log in sample_log_list:
+            if sample_log is not None:
+                sample_log.unlink(missing_ok=True)
+
+    crf = interpolate_crf(score_list, crf_auto.target)
+    res = (
+        str(round(crf))
+        if ripper.preset_name == Preset_name.svtav1
+        else f"{round(crf, 1):g}"
+    )
+    log.info(
+        "Auto CRF = {}, {} of the samples: {}",
+        res,
+        crf_auto.metric.value.upper(),
+        ", ".join(f"{_crf:g}={score:.6g}" for _crf, score in score_list),
+    )
+    return res
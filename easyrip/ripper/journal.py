@@ -0,0 +1,243 @@
+import enum
+import hashlib
+import json
+import shutil
+import threading
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from glob import escape
+from pathlib import Path
+from typing import TYPE_CHECKING, Final, final
+
+from ..easyrip_log import log
+from ..global_val import get_CONFIG_DIR
+
+if TYPE_CHECKING:
+    from .ripper import Ripper
+
+
+def get_journal_path(work_dir: Path | None = None) -> Path:
+    """每个工作目录在配置目录中有独立的任务日志，不在媒体目录中留下文件"""
+    work_dir = (work_dir or Path.cwd()).resolve()
+    return (
+        get_CONFIG_DIR()
+        / "journal"
+        / f"{hashlib.sha256(str(work_dir).encode('utf-8')).hexdigest()[:16]}.json"
+    )
+
+
+class Job_state(enum.Enum):
+    pending = "pending"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+
+@final
+@dataclass(slots=True)
+class Job_record:
+    input_path_list: list[str]
+    output_prefix_list: list[str]
+    output_dir: str
+    preset_name: str
+    option_map: dict[str, str] = field(default_factory=dict[str, str])
+
+    state: Job_state = Job_state.pending
+    temp_path: str = ""
+    """执行中的临时输出"""
+    temp_glob_list: list[str] = field(default_factory=list[str])
+    """执行中的其他临时文件和目录，只在文件名中使用 glob 模式，例如并行阶段和 FFmpeg 的日志"""
+    output_path: str = ""
+    """完成后的输出，只子集化时是输出目录"""
+    size: int = 0
+    """输出体积 (B)，目录时是其中所有文件的总和"""
+    start_time: str = ""
+    end_time: str = ""
+
+    @property
+    def key(self) -> str:
+        return json.dumps(
+            [
+                self.input_path_list,
+                self.output_prefix_list,
+                self.output_dir,
+                self.preset_name,
+                self.option_map,
+            ],
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+
+    @classmethod
+    def from_ripper(cls, ripper: "Ripper") -> "Job_record":
+        return cls(
+            [str(path.resolve()) for path in ripper.input_path_list],
+            list(ripper.output_prefix_list),
+            str(ripper.output_dir.resolve()),
+            ripper.preset_name.value,
+            dict(ripper.option_map),
+        )
+
+    def clean_temp(self) -> None:
+        """删除中断时写了一半的临时输出，包括以它为前缀的中间文件和 temp_glob_list 中的文件"""
+        if not self.temp_path:
+            return
+        temp_path = Path(self.temp_path)
+        for path in (
+            temp_path,
+            *temp_path.parent.glob(escape(temp_path.name) + ".*"),
+            *(
+                path
+                for pattern in map(Path, self.temp_glob_list)
+                for path in pattern.parent.glob(pattern.name)
+            ),
+        ):
+            try:
+                if path.is_file():
+                    path.unlink()
+                    log.info('Delete the unfinished temporary file "{}"', path)
+                elif path.is_dir():
+                    shutil.rmtree(path)
+                    log.info('Delete the unfinished temporary file "{}"', path)
+            except OSError as e:
+                log.error(e)
+        self.temp_path = ""
+        self.temp_glob_list = []
+
+
+@final
+class Ripper_journal:
+    """
+    Ripper 队列的任务日志
+
+    以 JSON 保存在配置目录，每个工作目录一个文件，记录每个 Ripper 的参数和状态，每次状态变化后立即写入
+    进程中断后可以据此恢复队列，跳过已完成的任务
+    """
+
+    VERSION: Final[int] = 1
+
+    def __init__(self, path: Path | None = None) -> None:
+        self.path = path or get_journal_path()
+        self.record_map: dict[str, Job_record] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self) -> None:
+        if not self.path.is_file():
+            return
+        try:
+            with self.path.open("rt", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict) or data.get("version") != self.VERSION:
+                raise TypeError(f'The journal "{self.path}" version is not match')
+            for _record in data.get("job_list", []):
+                record = Job_record(
+                    **(_record | {"state": Job_state(_record.get("state"))})
+                )
+                self.record_map[record.key] = record
+        except Exception as e:
+            log.error("Failed to load journal: {}", e)
+
+    def save(self) -> None:
+        # 先写入临时文件再替换，防止中断时损坏
+        temp_path = self.path.with_suffix(".temp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with temp_path.open("wt", encoding="utf-8", newline="\n") as f:
+                json.dump(
+                    {
+                        "version": self.VERSION,
+                        "job_list": [
+                            asdict(record) | {"state": record.state.value}
+                            for record in self.record_map.values()
+                        ],
+                    },
+                    f,
+                    ensure_ascii=False,
+                    indent=3,
+                )
+            temp_path.replace(self.path)
+        except OSError as e:
+            log.error("Failed to save journal: {}", e)
+
+    def get(self, ripper: "Ripper") -> Job_record | None:
+        return self.record_map.get(Job_record.from_ripper(ripper).key)
+
+    def get_unfinished_list(self) -> list[Job_record]:
+        return [
+            record
+            for record in self.record_map.values()
+            if record.state != Job_state.done
+        ]
+
+    def add(self, ripper_list: "list[Ripper]") -> None:
+        """加入队列，已有的记录保持原状态"""
+        with self._lock:
+            for ripper in ripper_list:
+                record = Job_record.from_ripper(ripper)
+                self.record_map.setdefault(record.key, record)
+            self.save()
+
+    def is_done(self, ripper: "Ripper") -> bool:
+        """已完成且输出仍然存在"""
+        return (
+            (record := self.get(ripper)) is not None
+            and record.state == Job_state.done
+            and bool(record.output_path)
+            and Path(record.output_path).exists()
+        )
+
+    def set_running(
+        self,
+        ripper: "Ripper",
+        temp_path: Path,
+        temp_glob_list: list[str] | None = None,
+    ) -> None:
+        with self._lock:
+            record = self.record_map.setdefault(
+                (_record := Job_record.from_ripper(ripper)).key, _record
+            )
+            record.clean_temp()
+            record.state = Job_state.running
+            record.temp_path = str(temp_path.resolve())
+            record.temp_glob_list = temp_glob_list or []
+            record.output_path = ""
+            record.size = 0
+            record.start_time = datetime.now().strftime("%Y.%m.%d %H:%M:%S.%f")[:-4]
+            record.end_time = ""
+            self.save()
+
+    def set_end(
+        self,
+        ripper: "Ripper",
+        *,
+        is_done: bool,
+        output_path: Path | None = None,
+    ) -> None:
+        with self._lock:
+            if (record := self.get(ripper)) is None:
+                return
+            record.state = Job_state.done if is_done else Job_state.failed
+            # 失败时保留临时输出的路径，恢复时清理
+            if is_done:
+                record.temp_path = ""
+                record.temp_glob_list = []
+            if output_path is not None and output_path.is_file():
+                record.output_path = str(output_path.resolve())
+                record.size = output_path.stat().st_size
+            elif output_path is not None and output_path.is_dir():
+                record.output_path = str(output_path.resolve())
+                record.size = sum(
+                    path.stat().st_size
+                    for path in output_path.rglob("*")
+                    if path.is_file()
+                )
+            record.end_time = datetime.now().strftime("%Y.%m.%d %H:%M:%S.%f")[:-4]
+            self.save()
+
+    def clean(self) -> None:
+        """所有任务都已完成时删除日志文件"""
+        with self._lock:
+            if self.record_map and not self.get_unfinished_list():
+                self.record_map.clear()
+                self.path.unlink(missing_ok=True)
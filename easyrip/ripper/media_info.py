@@ -1,11 +1,16 @@
 import json
+import os
+import sqlite3
 import subprocess
-from dataclasses import dataclass, field
+import threading
+import time
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
-from typing import Self, final
+from typing import Final, Self, final
 
 from ..easyrip_log import log
 from ..easyrip_mlang import Mlang_exception
+from ..global_val import get_CONFIG_DIR
 from ..utils import time_str_to_sec
 
 
@@ -41,17 +46,41 @@ class Media_info:
     audio_info: list[Audio_info] = field(default_factory=list[Audio_info])
 
     @classmethod
-    def from_path(cls, path: str | Path) -> Self:
+    def from_path(cls, path: str | Path, *, use_cache: bool = True) -> Self:
+        """
+        获取媒体信息
+
+        只调用一次 ffprobe，结果按路径、大小和修改时间缓存到配置目录
+        """
         path = Path(path)
+
+        stat: os.stat_result | None = None
+        if use_cache:
+            try:
+                stat = path.stat()
+            except OSError:
+                stat = None
+            else:
+                if (media_info := _Media_info_cache.get(path, stat)) is not None:
+                    return media_info
+
+        media_info = cls._from_ffprobe(path)
+
+        # 探测失败时不缓存，例如 .vpy 或正在写入的文件
+        if stat is not None and (media_info.width or media_info.audio_info):
+            _Media_info_cache.set(path, stat, media_info)
+
+        return media_info
+
+    @classmethod
+    def _from_ffprobe(cls, path: Path) -> Self:
         media_info = cls()
 
-        # 第一个视频轨
+        # 一次获取所有轨道
         _cmd = [
             "ffprobe",
             "-v",
             "0",
-            "-select_streams",
-            "v:0",
             "-show_streams",
             "-print_format",
             "json",
@@ -65,10 +94,17 @@ class Media_info:
                 text=True,
                 encoding="utf-8",
             ).communicate()[0]
+            or "{}"
         )
-        _info_list: list = _info.get("streams", [])
+        _info_list: list = [
+            _stream for _stream in _info.get("streams", []) if isinstance(_stream, dict)
+        ]
 
-        _video_info_dict: dict = _info_list[0] if _info_list else {}
+        # 第一个视频轨
+        _video_info_dict: dict = next(
+            (_stream for _stream in _info_list if _stream.get("codec_type") == "video"),
+            {},
+        )
 
         media_info.width = int(_video_info_dict.get("width", "0"))
         media_info.height = int(_video_info_dict.get("height", "0"))
@@ -91,29 +127,11 @@ class Media_info:
         media_info.duration = _duration
 
         # 遍历所有音频轨
-        _cmd = [
-            "ffprobe",
-            "-v",
-            "0",
-            "-select_streams",
-            "a",
-            "-show_streams",
-            "-print_format",
-            "json",
-            path,
+        _audio_info_list: list[dict] = [
+            _stream for _stream in _info_list if _stream.get("codec_type") == "audio"
         ]
-        log.debug(_cmd, print_level=log.LogLevel._detail)
-        _info: dict = json.loads(
-            subprocess.Popen(
-                _cmd,
-                stdout=subprocess.PIPE,
-                text=True,
-                encoding="utf-8",
-            ).communicate()[0]
-        )
-        _info_list: list = _info.get("streams", [])
 
-        for _audio_info_dict in _info_list:
+        for _audio_info_dict in _audio_info_list:
             if not isinstance(_audio_info_dict, dict):
                 _audio_info_dict = {}
 
@@ -172,3 +190,171 @@ class Media_info:
             )
 
         return media_info
+
+
+def get_keyframe_list(path: str | Path) -> tuple[list[tuple[float, int]], int]:
+    """
+    获取第一个视频轨的关键帧
+
+    只读取封装层的数据包，不解码
+    返回 ([(关键帧时间 s, 关键帧按显示顺序的帧序号), ...], 总帧数)
+    关键帧时间相对于封装的 start_time，与 FFmpeg 输入选项 -ss 的基准一致
+    """
+    _cmd = [
+        "ffprobe",
+        "-v",
+        "0",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "packet=pts_time,flags:format=start_time",
+        "-of",
+        "csv=p=1",
+        path,
+    ]
+    log.debug(_cmd, print_level=log.LogLevel._detail)
+    _stdout: str = subprocess.Popen(
+        _cmd,
+        stdout=subprocess.PIPE,
+        text=True,
+        encoding="utf-8",
+    ).communicate()[0]
+
+    # 数据包是解码顺序，按时间排序后才是显示顺序
+    _packet_list: list[tuple[float, bool]] = []
+    _start_time: float = 0
+    for line in _stdout.splitlines():
+        # packet,0.041000,K__
+        # format,1.400000
+        _section, _, _val = line.strip().partition(",")
+        _pts_time, _, _flags = _val.partition(",")
+        try:
+            match _section:
+                case "packet":
+                    _packet_list.append((float(_pts_time), _flags.startswith("K")))
+                case "format":
+                    _start_time = float(_pts_time)
+        except ValueError:
+            continue
+    _packet_list.sort(key=lambda packet: packet[0])
+
+    return (
+        [
+            (pts_time - _start_time, i)
+            for i, (pts_time, is_key) in enumerate(_packet_list)
+            if is_key
+        ],
+        len(_packet_list),
+    )
+
+
+@final
+class _Media_info_cache:
+    """以 sqlite 保存在配置目录的 Media_info 缓存，路径、大小或修改时间变化时失效"""
+
+    VERSION: Final[int] = 1
+    """解析逻辑变化时递增，使旧缓存失效"""
+    MAX_ROW_NUM: Final[int] = 20000
+
+    _lock: Final = threading.Lock()
+    _is_disabled: bool = False
+    _conn: sqlite3.Connection | None = None
+    """进程内共用的连接，只在持有 _lock 时使用"""
+    _row_num: int | None = None
+
+    @classmethod
+    def _connect(cls) -> sqlite3.Connection:
+        """首次调用时打开连接并建表，需持有 _lock"""
+        if cls._conn is None:
+            cache_file = get_CONFIG_DIR() / "media_info_cache.db"
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(cache_file, timeout=10, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS media_info ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+                "version INTEGER, data TEXT, access_time REAL)"
+            )
+            cls._conn = conn
+        return cls._conn
+
+    @staticmethod
+    def _key(path: Path) -> str:
+        return str(path.resolve())
+
+    @classmethod
+    def get(cls, path: Path, stat: os.stat_result) -> Media_info | None:
+        if cls._is_disabled:
+            return None
+
+        try:
+            with cls._lock, cls._connect() as conn:
+                key = cls._key(path)
+                row = conn.execute(
+                    "SELECT data FROM media_info "
+                    "WHERE path = ? AND size = ? AND mtime_ns = ? AND version = ?",
+                    (key, stat.st_size, stat.st_mtime_ns, cls.VERSION),
+                ).fetchone()
+                if row is None:
+                    return None
+                conn.execute(
+                    "UPDATE media_info SET access_time = ? WHERE path = ?",
+                    (time.time(), key),
+                )
+
+            data: dict = json.loads(row[0])
+            data["r_frame_rate"] = tuple(data["r_frame_rate"])
+            data["audio_info"] = [Audio_info(**a) for a in data["audio_info"]]
+            return Media_info(**data)
+
+        except Exception as e:
+            cls._disable(e)
+            return None
+
+    @classmethod
+    def set(cls, path: Path, stat: os.stat_result, media_info: Media_info) -> None:
+        if cls._is_disabled:
+            return
+
+        try:
+            with cls._lock, cls._connect() as conn:
+                if cls._row_num is None:
+                    cls._row_num = conn.execute(
+                        "SELECT COUNT(*) FROM media_info"
+                    ).fetchone()[0]
+                conn.execute(
+                    "INSERT OR REPLACE INTO media_info VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        cls._key(path),
+                        stat.st_size,
+                        stat.st_mtime_ns,
+                        cls.VERSION,
+                        json.dumps(asdict(media_info)),
+                        time.time(),
+                    ),
+                )
+                # REPLACE 时计数偏大，只会使清理提前
+                cls._row_num += 1
+
+                # 超出上限时才清理，只保留最近使用的记录
+                if cls._row_num > cls.MAX_ROW_NUM:
+                    conn.execute(
+                        "DELETE FROM media_info WHERE path NOT IN "
+                        "(SELECT path FROM media_info ORDER BY access_time DESC LIMIT ?)",
+                        (cls.MAX_ROW_NUM,),
+                    )
+                    cls._row_num = conn.execute(
+                        "SELECT COUNT(*) FROM media_info"
+                    ).fetchone()[0]
+
+        except Exception as e:
+            cls._disable(e)
+
+    @classmethod
+    def _disable(cls, e: Exception) -> None:
+        """缓存不可用时不影响探测，本次运行内不再尝试"""
+        cls._is_disabled = True
+        log.debug(
+            "Media info cache is disabled: {}",
+            e,
+            print_level=log.LogLevel._detail,
+        )
@@ -0,0 +1,304 @@
+import functools
+import hashlib
+import json
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import TYPE_CHECKING, Final, final
+
+from ..easyrip_config.config import CONFIG_DEFAULT_DICT, config
+from ..easyrip_config.config_key import Config_key
+from ..easyrip_log import log
+from ..global_val import get_CONFIG_DIR
+from .param import Preset_name
+
+if TYPE_CHECKING:
+    from .ripper import Ripper
+
+_PARTIAL_HASH_SIZE: Final[int] = 2**20
+"""部分哈希读取文件首尾的字节数"""
+
+_TOOL_NAME_TUPLE: Final[tuple[str, ...]] = (
+    "ffmpeg",
+    "flac",
+    "mkvmerge",
+    "mp4box",
+)
+
+_IGNORED_OPTION_KEY_SET: Final[frozenset[str]] = frozenset(
+    {
+        "_sub_ripper_num",
+        "_sub_ripper_title",
+        "_side_stage",
+        "output-cache",
+        "parallel-jobs",
+        "nice",
+        "cpu-affinity",
+        "pipe-size",
+    }
+)
+"""不影响输出内容的选项"""
+
+_UNCACHEABLE_OPTION_KEY_SET: Final[frozenset[str]] = frozenset(
+    {"pipe", "soft-sub", "translate-sub", "only-mux-sub-path"}
+)
+"""输出依赖于无法指纹化的文件，例如 vpy 脚本导入的模块或扫描的目录"""
+
+
+@functools.cache
+def _get_tool_ver(name: str) -> str:
+    try:
+        res = subprocess.run(
+            [name, "-version" if name in {"ffmpeg", "mp4box"} else "--version"],
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+    except OSError:
+        return ""
+    return next(iter((res.stdout or res.stderr).strip().splitlines()), "")
+
+
+def _get_file_fingerprint(path: Path, *, is_hash: bool) -> list[int | str]:
+    """大小、修改时间，以及可选的首尾部分哈希"""
+    stat = path.stat()
+    fingerprint: list[int | str] = [stat.st_size, stat.st_mtime_ns]
+    if is_hash:
+        _hash = hashlib.blake2b(digest_size=16)
+        with path.open("rb") as f:
+            _hash.update(f.read(_PARTIAL_HASH_SIZE))
+            if stat.st_size > _PARTIAL_HASH_SIZE * 2:
+                f.seek(-_PARTIAL_HASH_SIZE, 2)
+                _hash.update(f.read(_PARTIAL_HASH_SIZE))
+        fingerprint.append(_hash.hexdigest())
+    return fingerprint
+
+
+def get_output_cache_key(ripper: "Ripper") -> str | None:
+    """
+    由输入文件的指纹、完整的命令模板、影响输出的选项和工具版本生成缓存键
+
+    无法缓存时返回 None
+    """
+    if (
+        ripper.preset_name in {Preset_name.custom, Preset_name.subset}
+        or ripper.input_path_list[0].suffix == ".vpy"
+        or any(key in ripper.option_map for key in _UNCACHEABLE_OPTION_KEY_SET)
+    ):
+        return None
+
+    is_hash: bool = ripper.option_map.get("output-cache") == "hash"
+
+    try:
+        input_fingerprint_list = [
+            _get_file_fingerprint(path, is_hash=is_hash)
+            for path in ripper.input_path_list
+        ]
+        # 选项中引用的文件
+        extra_fingerprint_dict = {
+            key: _get_file_fingerprint(Path(val), is_hash=is_hash)
+            for key in ("sub", "chapters")
+            if (val := ripper.option_map.get(key)) and Path(val).is_file()
+        }
+    except OSError as e:
+        log.debug("Output cache is skipped: {}", e, print_level=log.LogLevel._detail)
+        return None
+
+    data = json.dumps(
+        [
+            Output_cache.VERSION,
+            ripper.preset_name.value,
+            [
+                cmd if isinstance(cmd, str) else list(cmd)
+                for cmd_list in (
+                    ripper.option.encoder_format_str_list,
+                    ripper.option.muxer_format_str_list,
+                )
+                for cmd in cmd_list
+            ],
+            {
+                k: v
+                for k, v in ripper.option_map.items()
+                if k not in _IGNORED_OPTION_KEY_SET
+            },
+            input_fingerprint_list,
+            extra_fingerprint_dict,
+            [_get_tool_ver(name) for name in _TOOL_NAME_TUPLE],
+        ],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _clone_or_copy(src: Path, dst: Path) -> None:
+    """
+    复制文件，文件系统支持时使用 reflink (写时复制)，不支持或跨设备时完整复制
+
+    不使用硬链接，否则原地修改输出 (例如 mkvpropedit) 时会同时改变缓存
+    """
+    if sys.platform == "linux":
+        try:
+            import fcntl
+
+            with src.open("rb") as f_src, dst.open("wb") as f_dst:
+                fcntl.ioctl(f_dst.fileno(), fcntl.FICLONE, f_src.fileno())
+            shutil.copystat(src, dst)
+        except OSError:
+            dst.unlink(missing_ok=True)
+        else:
+            return
+    shutil.copy2(src, dst)
+
+
+@final
+class Output_cache:
+    """
+    以缓存键保存 Ripper 的输出，命中时直接复制，不再编码
+
+    文件保存在缓存目录中，按最近使用时间淘汰，使总体积不超过上限
+    """
+
+    VERSION: Final[int] = 1
+    """缓存键的组成变化时递增，使旧缓存失效"""
+
+    _lock: Final = threading.Lock()
+    _is_disabled: bool = False
+
+    @staticmethod
+    def get_cache_dir() -> Path:
+        return Path(
+            config.get_user_profile(
+                Config_key.output_cache_dir,
+                CONFIG_DEFAULT_DICT[Config_key.output_cache_dir],
+            )
+            or get_CONFIG_DIR() / "output_cache"
+        )
+
+    @classmethod
+    def _connect(cls) -> sqlite3.Connection:
+        cache_dir = cls.get_cache_dir()
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(cache_dir / "output_cache.db", timeout=10)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS output_cache ("
+            "key TEXT PRIMARY KEY, file TEXT, size INTEGER, access_time REAL)"
+        )
+        return conn
+
+    @classmethod
+    def contains(cls, key: str) -> bool:
+        """是否有可用的缓存，不更新使用时间"""
+        if cls._is_disabled:
+            return False
+
+        try:
+            with cls._lock, closing(cls._connect()) as conn, conn:
+                row = conn.execute(
+                    "SELECT file FROM output_cache WHERE key = ?", (key,)
+                ).fetchone()
+        except Exception as e:
+            cls._disable(e)
+            return False
+
+        return row is not None and (cls.get_cache_dir() / row[0]).is_file()
+
+    @classmethod
+    def restore(cls, key: str, output_path: Path) -> bool:
+        """命中时将缓存的输出复制到 output_path"""
+        if cls._is_disabled or output_path.exists():
+            return False
+
+        try:
+            with cls._lock, closing(cls._connect()) as conn, conn:
+                row = conn.execute(
+                    "SELECT file FROM output_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return False
+
+                cache_file = cls.get_cache_dir() / row[0]
+                if not cache_file.is_file():
+                    conn.execute("DELETE FROM output_cache WHERE key = ?", (key,))
+                    return False
+
+                conn.execute(
+                    "UPDATE output_cache SET access_time = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+
+        except Exception as e:
+            cls._disable(e)
+            return False
+
+        try:
+            _clone_or_copy(cache_file, output_path)
+        except OSError as e:
+            log.error(e)
+            return False
+        return True
+
+    @classmethod
+    def set(cls, key: str, output_path: Path) -> None:
+        if cls._is_disabled or not output_path.is_file():
+            return
+
+        try:
+            max_size: int = (
+                config.get_user_profile(
+                    Config_key.output_cache_max_mb,
+                    CONFIG_DEFAULT_DICT[Config_key.output_cache_max_mb],
+                )
+                * 2**20
+            )
+            size = output_path.stat().st_size
+            if size > max_size:
+                return
+
+            cache_dir = cls.get_cache_dir()
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            cache_file = cache_dir / (key + output_path.suffix)
+            # 跨设备时复制可能很慢，不持有锁，完成后再替换
+            temp_file = cache_dir / f"{key}.{threading.get_ident():x}.temp"
+            temp_file.unlink(missing_ok=True)
+            try:
+                _clone_or_copy(output_path, temp_file)
+            except OSError:
+                temp_file.unlink(missing_ok=True)
+                raise
+
+            with cls._lock, closing(cls._connect()) as conn, conn:
+                temp_file.replace(cache_file)
+
+                conn.execute(
+                    "INSERT OR REPLACE INTO output_cache VALUES (?, ?, ?, ?)",
+                    (key, cache_file.name, size, time.time()),
+                )
+
+                # 按最近使用时间淘汰
+                total_size: int = conn.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM output_cache"
+                ).fetchone()[0]
+                for _key, _file, _size in conn.execute(
+                    "SELECT key, file, size FROM output_cache ORDER BY access_time"
+                ).fetchall():
+                    if total_size <= max_size:
+                        break
+                    (cache_dir / _file).unlink(missing_ok=True)
+                    conn.execute("DELETE FROM output_cache WHERE key = ?", (_key,))
+                    total_size -= _size
+
+        except Exception as e:
+            cls._disable(e)
+
+    @classmethod
+    def _disable(cls, e: Exception) -> None:
+        """缓存不可用时不影响编码，本次运行内不再尝试"""
+        cls._is_disabled = True
+        log.warning("Output cache is disabled: {}", e)
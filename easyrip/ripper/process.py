@@ -0,0 +1,294 @@
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Final, Self, final
+
+from ..easyrip_log import log
+
+_OPERATOR_SET: Final[frozenset[str]] = frozenset({"|", "&&"})
+"""支持的 shell 操作符，其余操作符 (重定向、;、||、& 等) 交给 shell"""
+
+_SHELL_CHAR_SET: Final[frozenset[str]] = frozenset("$`*?~")
+"""需要 shell 展开的字符"""
+
+_WINDOWS_SHELL_CHAR_SET: Final[frozenset[str]] = frozenset("%^!*?")
+"""需要 cmd.exe 展开或转义的字符"""
+
+_SHELL_NOT_FOUND_CODE: Final[int] = 127
+"""与 shell 找不到命令时的状态码一致"""
+
+_usage_lock: Final = threading.Lock()
+
+
+def split_cmd(cmd: str) -> list[list[list[str]]] | None:
+    """
+    将命令字符串解析为以 && 连接的管道序列，每个管道为若干 argv
+
+    Windows 中反斜杠不是转义字符，只去除引号，与路径的写法一致
+    命令中有不支持的 shell 语法时，返回 None
+    """
+    match os.name:
+        case "posix":
+            shell_char_set = _SHELL_CHAR_SET
+        case "nt":
+            shell_char_set = _WINDOWS_SHELL_CHAR_SET
+        case _:
+            return None
+    if any(c in shell_char_set for c in cmd):
+        return None
+
+    lex = shlex.shlex(cmd, posix=True, punctuation_chars=True)
+    lex.whitespace_split = True
+    if os.name == "nt":
+        lex.escape = ""
+    try:
+        token_list = list(lex)
+    except ValueError:
+        return None
+
+    pipeline_list: list[list[list[str]]] = [[[]]]
+    for token in token_list:
+        if token and all(c in lex.punctuation_chars for c in token):
+            if token not in _OPERATOR_SET or not pipeline_list[-1][-1]:
+                return None
+            if token == "|":
+                pipeline_list[-1].append([])
+            else:
+                pipeline_list.append([[]])
+        else:
+            pipeline_list[-1][-1].append(token)
+
+    if not pipeline_list[-1][-1]:
+        return None
+    # 不是可执行文件的命令，例如 shell 的内部命令
+    if any(
+        shutil.which(argv[0]) is None for pipeline in pipeline_list for argv in pipeline
+    ):
+        return None
+    return pipeline_list
+
+
+@final
+@dataclass(slots=True)
+class Process_option:
+    pipe_size: int = 0
+    """管道缓冲区的字节数，0 为系统默认，只在 Linux 中生效"""
+    cpu_affinity: frozenset[int] | None = None
+    """子进程可使用的 CPU，只在 Linux 中生效"""
+    nice: int = 0
+    """子进程的 niceness 增量，Windows 中对应优先级类"""
+
+    @classmethod
+    def from_option_map(cls, option_map: dict[str, str]) -> Self:
+        """
+        解析 -pipe-size、-cpu-affinity 和 -nice
+
+        参数错误时记录日志并使用默认值
+        """
+        res = cls()
+
+        if _pipe_size := option_map.get("pipe-size"):
+            try:
+                res.pipe_size = max(0, int(_pipe_size))
+            except ValueError as e:
+                log.error("Param error from '{}': {}", "-pipe-size", e)
+
+        if _cpu_affinity := option_map.get("cpu-affinity"):
+            # 0-3,6
+            try:
+                cpu_set: set[int] = set()
+                for _range in _cpu_affinity.split(","):
+                    _start, _, _end = _range.partition("-")
+                    cpu_set.update(range(int(_start), int(_end or _start) + 1))
+                if not cpu_set:
+                    raise ValueError(_cpu_affinity)
+                res.cpu_affinity = frozenset(cpu_set)
+            except ValueError as e:
+                log.error("Param error from '{}': {}", "-cpu-affinity", e)
+
+        if _nice := option_map.get("nice"):
+            try:
+                res.nice = int(_nice)
+            except ValueError as e:
+                log.error("Param error from '{}': {}", "-nice", e)
+
+        # 不支持的平台上不静默忽略
+        if res.pipe_size and sys.platform != "linux":
+            log.warning("'{}' has no effect on this platform", "-pipe-size")
+        if res.cpu_affinity is not None and not hasattr(os, "sched_setaffinity"):
+            log.warning("'{}' has no effect on this platform", "-cpu-affinity")
+
+        return res
+
+    @property
+    def creationflags(self) -> int:
+        """Windows 中以优先级类代替 niceness"""
+        if os.name != "nt" or not self.nice:
+            return 0
+        if self.nice >= 10:
+            return subprocess.IDLE_PRIORITY_CLASS
+        if self.nice > 0:
+            return subprocess.BELOW_NORMAL_PRIORITY_CLASS
+        if self.nice <= -10:
+            return subprocess.HIGH_PRIORITY_CLASS
+        return subprocess.ABOVE_NORMAL_PRIORITY_CLASS
+
+    def apply(self, pid: int) -> None:
+        """在子进程启动后设置，不使用 preexec_fn，多线程中也是安全的"""
+        try:
+            if self.cpu_affinity is not None and hasattr(os, "sched_setaffinity"):
+                os.sched_setaffinity(pid, self.cpu_affinity)
+            if self.nice and hasattr(os, "setpriority"):
+                os.setpriority(
+                    os.PRIO_PROCESS,
+                    pid,
+                    os.getpriority(os.PRIO_PROCESS, pid) + self.nice,
+                )
+        except OSError as e:
+            log.warning(e)
+
+
+@final
+@dataclass(slots=True)
+class Process_usage:
+    name: str
+    returncode: int
+    wall_sec: float = 0
+    user_sec: float = 0
+    """用户态 CPU 时间 s"""
+    sys_sec: float = 0
+    """内核态 CPU 时间 s"""
+    max_rss: int = 0
+    """最大常驻内存 KiB，只在 Linux 中有效"""
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name}: exit {self.returncode}, wall {self.wall_sec:.2f}s, "
+            f"CPU user {self.user_sec:.2f}s sys {self.sys_sec:.2f}s, "
+            f"max RSS {self.max_rss / 1024:.1f} MiB"
+        )
+
+
+def _set_pipe_size(fd: int, size: int) -> None:
+    if not size or sys.platform != "linux":
+        return
+    try:
+        import fcntl
+
+        fcntl.fcntl(fd, fcntl.F_SETPIPE_SZ, size)
+    except OSError as e:
+        log.debug("Can not set the pipe size: {}", e, print_level=log.LogLevel._detail)
+
+
+def _wait(proc: subprocess.Popen[bytes], name: str, start_time: float) -> Process_usage:
+    if not hasattr(os, "wait4"):
+        return Process_usage(
+            name, proc.wait(), wall_sec=time.perf_counter() - start_time
+        )
+
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return Process_usage(
+        name,
+        proc.returncode,
+        wall_sec=time.perf_counter() - start_time,
+        user_sec=rusage.ru_utime,
+        sys_sec=rusage.ru_stime,
+        max_rss=rusage.ru_maxrss,
+    )
+
+
+def _run_pipeline(
+    pipeline: list[list[str]],
+    *,
+    env: dict[str, str] | None,
+    option: Process_option,
+    usage_list: list[Process_usage] | None,
+) -> int:
+    """用 OS 管道连接各进程，返回第一个非 0 的状态码，与 shell 的 pipefail 一致"""
+    proc_list: list[subprocess.Popen[bytes]] = []
+    start_time = time.perf_counter()
+    try:
+        stdin_fd: int | None = None
+        for i, argv in enumerate(pipeline):
+            if i < len(pipeline) - 1:
+                read_fd, write_fd = os.pipe()
+                _set_pipe_size(write_fd, option.pipe_size)
+            else:
+                read_fd = write_fd = None
+            try:
+                proc = subprocess.Popen(
+                    argv,
+                    stdin=stdin_fd,
+                    stdout=write_fd,
+                    env=env,
+                    creationflags=option.creationflags,
+                )
+            except BaseException:
+                if read_fd is not None:
+                    os.close(read_fd)
+                raise
+            finally:
+                # 父进程不持有管道的端口，使上游退出时下游能读到 EOF
+                if stdin_fd is not None:
+                    os.close(stdin_fd)
+                if write_fd is not None:
+                    os.close(write_fd)
+            stdin_fd = read_fd
+            proc_list.append(proc)
+            option.apply(proc.pid)
+
+        res_list = [
+            _wait(proc, Path(argv[0]).name, start_time)
+            for proc, argv in zip(proc_list, pipeline, strict=True)
+        ]
+
+    except BaseException:
+        # 取消时终止实际执行的进程，而不只是 shell
+        for proc in proc_list:
+            if proc.returncode is None:
+                proc.kill()
+                proc.wait()
+        raise
+
+    if usage_list is not None:
+        with _usage_lock:
+            usage_list.extend(res_list)
+    return next((res.returncode for res in res_list if res.returncode), 0)
+
+
+def run_cmd(
+    cmd: str,
+    *,
+    env: dict[str, str] | None = None,
+    option: Process_option | None = None,
+    usage_list: list[Process_usage] | None = None,
+) -> int:
+    """
+    不经过 shell 执行命令，返回状态码
+
+    管道中任一进程失败时返回其状态码
+    无法解析时交给 shell 执行，此时不应用 option，不统计资源使用量，管道只返回最后一个进程的状态码
+
+    :param usage_list: 非 None 时加入每个进程的资源使用量，多线程中可共用
+    """
+    if (pipeline_list := split_cmd(cmd)) is None:
+        log.debug("Run in shell: {}", cmd, print_level=log.LogLevel._detail)
+        return subprocess.call(cmd, shell=True, env=env)
+
+    option = option or Process_option()
+    for pipeline in pipeline_list:
+        try:
+            res = _run_pipeline(pipeline, env=env, option=option, usage_list=usage_list)
+        except OSError as e:
+            log.error(e)
+            return _SHELL_NOT_FOUND_CODE
+        if res:
+            return res
+    return 0
@@ -0,0 +1,275 @@
+import os
+from collections import deque
+from pathlib import Path
+from time import monotonic
+from typing import IO, final
+
+
+def _to_int(val: str | None, default: int = 0) -> int:
+    try:
+        return int(val) if val is not None else default
+    except ValueError:
+        return default
+
+
+def _to_float(val: str | None, default: float = 0) -> float:
+    try:
+        return float(val.rstrip("x")) if val is not None else default
+    except ValueError:
+        return default
+
+
+@final
+class Progress_reader:
+    """
+    增量读取 FFmpeg 的 -progress 输出
+
+    保持文件句柄和读取位置，每次只解析新写入的 key=value 块，
+    并在一个定长窗口内滚动统计 fps、速率和剩余时间
+    """
+
+    __slots__ = (
+        "_buffer",
+        "_file",
+        "_pending",
+        "_samples",
+        "block",
+        "duration",
+        "frame_count",
+        "is_end",
+        "path",
+    )
+
+    def __init__(
+        self,
+        path: str | Path,
+        *,
+        frame_count: int = 0,
+        duration: float = 0,
+        window: int = 16,
+    ) -> None:
+        """
+        创建读取器，进度文件可以尚未生成
+
+        :param path: FFmpeg -progress 输出的文件
+        :param frame_count: 总帧数，用于计算剩余时间
+        :param duration: 总时长 s，没有总帧数时用于计算剩余时间
+        :param window: 滚动统计保留的采样数
+        """
+        self.path = Path(path)
+        self.frame_count = frame_count
+        self.duration = duration
+
+        self.block: dict[str, str] = {}
+        """最近一个完整的块"""
+        self.is_end: bool = False
+        """最近一个完整的块是否为结束块"""
+
+        self._file: IO[bytes] | None = None
+        self._buffer: bytes = b""
+        self._pending: dict[str, str] = {}
+        self._samples: deque[tuple[float, int, int]] = deque(maxlen=max(2, window))
+        """(monotonic 时间, 已输出帧数, 已输出时长 us)"""
+
+    def read(self) -> bool:
+        """读取新写入的内容，有新的完整块时返回 True"""
+        if self._file is None:
+            try:
+                self._file = self.path.open("rb")
+            except FileNotFoundError:
+                return False
+
+        # 同一个 Ripper 的下一条 FFmpeg 命令会截断重写进度文件
+        if os.fstat(self._file.fileno()).st_size < self._file.tell():
+            self._file.seek(0)
+            self._buffer = b""
+            self._pending = {}
+            self._samples.clear()
+
+        if not (data := self._file.read()):
+            return False
+
+        lines = (self._buffer + data).split(b"\n")
+        self._buffer = lines.pop()
+
+        is_new_block: bool = False
+        for line in lines:
+            key, sep, val = (
+                line.decode("utf-8", errors="replace").strip().partition("=")
+            )
+            if not sep:
+                continue
+            self._pending[key] = val.strip()
+            if key == "progress":
+                self.block, self._pending = self._pending, {}
+                self.is_end = val != "continue"
+                is_new_block = True
+
+        if is_new_block:
+            self._samples.append((monotonic(), self.frame, self.out_time_us))
+
+        return is_new_block
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def frame(self) -> int:
+        """已输出帧数，没有时为 -1"""
+        return _to_int(self.block.get("frame"), -1)
+
+    @property
+    def out_time_us(self) -> int:
+        """已输出时长 us，没有时为 0"""
+        return _to_int(self.block.get("out_time_us"))
+
+    @property
+    def fps(self) -> float:
+        """窗口内的平均输出帧率，采样不足时使用 FFmpeg 报告的值"""
+        if len(self._samples) >= 2:
+            t0, f0, _ = self._samples[0]
+            t1, f1, _ = self._samples[-1]
+            if t1 > t0 and f0 >= 0 and f1 >= 0:
+                return (f1 - f0) / (t1 - t0)
+        return _to_float(self.block.get("fps"), -1)
+
+    @property
+    def speed(self) -> float:
+        """窗口内的平均输出速率 倍，采样不足时使用 FFmpeg 报告的值"""
+        if len(self._samples) >= 2:
+            t0, _, us0 = self._samples[0]
+            t1, _, us1 = self._samples[-1]
+            if t1 > t0 and us1 > us0:
+                return (us1 - us0) / 1_000_000 / (t1 - t0)
+        return _to_float(self.block.get("speed"))
+
+    @property
+    def speed_str(self) -> str:
+        """FFmpeg 报告的原始速率字符串"""
+        return self.block.get("speed", "N/A")
+
+    @property
+    def eta(self) -> float:
+        """预计剩余时间 s，无法计算时为 -1"""
+        if self.is_end:
+            return 0
+        if (
+            self.frame_count > 0
+            and (frame := self.frame) >= 0
+            and (fps := self.fps) > 0
+        ):
+            return max(0, self.frame_count - frame) / fps
+        if self.duration > 0 and (speed := self.speed) > 0:
+            return max(0, self.duration - self.out_time_us / 1_000_000) / speed
+        return -1
+
+    @property
+    def percent(self) -> float:
+        """完成百分比 [0, 100]，无法计算时为 -1"""
+        if self.frame_count > 0 and (frame := self.frame) >= 0:
+            return min(100, 100 * frame / self.frame_count)
+        if self.duration > 0 and (out_time_us := self.out_time_us):
+            return min(100, out_time_us / self.duration / 10_000)
+        return -1
+
+
+@final
+class Progress_reader_group:
+    """
+    合并并行执行的多个 FFmpeg 的进度
+
+    每个读取器对应一个并行的命令，各项取已有数据的读取器的平均值
+    分段编码时，各命令只处理总量的一段，帧数、速率和百分比取累加值
+    """
+
+    __slots__ = ("is_chunk", "reader_list")
+
+    def __init__(
+        self, reader_list: "list[Progress_reader]", *, is_chunk: bool = False
+    ) -> None:
+        """
+        合并多个读取器
+
+        :param reader_list: 每个读取器的总帧数和总时长都应为整个输入的值
+        :param is_chunk: 各命令是否为同一输入的不同分段
+        """
+        self.reader_list = reader_list
+        self.is_chunk = is_chunk
+
+    def read(self) -> bool:
+        # 每个读取器都要读取，不能短路
+        is_new_list = [reader.read() for reader in self.reader_list]
+        return any(is_new_list)
+
+    def close(self) -> None:
+        for reader in self.reader_list:
+            reader.close()
+
+    @property
+    def is_end(self) -> bool:
+        return all(reader.is_end for reader in self.reader_list)
+
+    @property
+    def frame(self) -> int:
+        frame_list = [reader.frame for reader in self.reader_list if reader.frame >= 0]
+        if not frame_list:
+            return -1
+        if self.is_chunk:
+            return sum(frame_list)
+        return round(sum(frame_list) / len(frame_list))
+
+    @property
+    def out_time_us(self) -> int:
+        out_time_us = sum(reader.out_time_us for reader in self.reader_list)
+        if self.is_chunk:
+            return out_time_us
+        return out_time_us // max(1, len(self.reader_list))
+
+    def _active_reader_list(self) -> "list[Progress_reader]":
+        return [reader for reader in self.reader_list if reader.block]
+
+    @property
+    def fps(self) -> float:
+        fps_list = [max(0, reader.fps) for reader in self._active_reader_list()]
+        if not fps_list:
+            return -1
+        return sum(fps_list) / (1 if self.is_chunk else len(fps_list))
+
+    @property
+    def speed(self) -> float:
+        speed_list = [reader.speed for reader in self._active_reader_list()]
+        if not speed_list:
+            return 0
+        return sum(speed_list) / (1 if self.is_chunk else len(speed_list))
+
+    @property
+    def speed_str(self) -> str:
+        return f"{speed:.3g}x" if (speed := self.speed) else "N/A"
+
+    @property
+    def eta(self) -> float:
+        if self.is_chunk:
+            if self.is_end:
+                return 0
+            # 剩余总量 / 总速率
+            frame_count = self.reader_list[0].frame_count if self.reader_list else 0
+            duration = self.reader_list[0].duration if self.reader_list else 0
+            if frame_count > 0 and (frame := self.frame) >= 0 and (fps := self.fps) > 0:
+                return max(0, frame_count - frame) / fps
+            if duration > 0 and (speed := self.speed) > 0:
+                return max(0, duration - self.out_time_us / 1_000_000) / speed
+            return -1
+
+        eta_list = [reader.eta for reader in self._active_reader_list()]
+        return -1 if not eta_list or -1 in eta_list else max(eta_list)
+
+    @property
+    def percent(self) -> float:
+        percent_list = [reader.percent for reader in self.reader_list]
+        if all(percent == -1 for percent in percent_list):
+            return -1
+        if self.is_chunk:
+            return min(100, sum(max(0, percent) for percent in percent_list))
+        return sum(max(0, percent) for percent in percent_list) / len(percent_list)
@@ -0,0 +1,270 @@
+import csv
+import enum
+import heapq
+import json
+import math
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Final, Self, final
+
+from ..easyrip_log import log
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+FF_QUALITY_LOG_FILE: Final[Path] = Path("FFQuality.log")
+
+
+class Quality_metric(enum.Enum):
+    ssim = "ssim"
+    psnr = "psnr"
+    vmaf = "vmaf"
+
+    @property
+    def default_threshold(self) -> float:
+        match self:
+            case Quality_metric.ssim:
+                return 0.85
+            case Quality_metric.psnr:
+                return 30
+            case Quality_metric.vmaf:
+                return 80
+
+    def get_filter(self, log_path: str, *, is_shortest: bool = False) -> str:
+        """
+        FFmpeg 的比较滤镜，第一个输入为源，第二个输入为编码结果
+
+        :param log_path: 已转义的逐帧数据文件路径
+        :param is_shortest: 任一输入结束时停止
+        """
+        shortest = "shortest=1:" if is_shortest else ""
+        match self:
+            case Quality_metric.ssim:
+                return f"ssim={shortest}f={log_path}"
+            case Quality_metric.psnr:
+                return f"psnr={shortest}f={log_path}"
+            case Quality_metric.vmaf:
+                return f"libvmaf={shortest}log_fmt=csv:log_path={log_path}"
+
+    def iter_log(self, line_iter: "Iterable[str]") -> "Iterator[tuple[int, float]]":
+        """逐行解析逐帧数据，产出 (从 0 开始的帧序号, 分数)"""
+        match self:
+            case Quality_metric.ssim | Quality_metric.psnr:
+                # n:1 Y:0.97 U:0.98 V:0.99 All:0.98 (16.2)
+                # n:1 mse_avg:1.2 ... psnr_avg:47.3 psnr_y:46.9 ...
+                score_key = "All" if self == Quality_metric.ssim else "psnr_avg"
+                for line in line_iter:
+                    item_dict = dict(
+                        s.split(":", maxsplit=1) for s in line.split() if ":" in s
+                    )
+                    if "n" in item_dict and score_key in item_dict:
+                        yield int(item_dict["n"]) - 1, float(item_dict[score_key])
+
+            case Quality_metric.vmaf:
+                for row in csv.DictReader(line_iter):
+                    if row.get("Frame") and row.get("vmaf"):
+                        yield int(row["Frame"]), float(row["vmaf"])
+
+
+class Quality_detection_mode(enum.Enum):
+    full = "full"
+    """编码完成后完整解码源和输出进行比较"""
+    inline = "inline"
+    """编码时用回环解码器同步比较，不再额外解码源"""
+    sample = "sample"
+    """编码完成后只比较均匀分布的若干片段"""
+
+
+@final
+@dataclass(slots=True)
+class Quality_detection:
+    metric: Quality_metric
+    threshold: float
+    mode: Quality_detection_mode = Quality_detection_mode.full
+    sample_count: int = 10
+    sample_sec: float = 2
+
+    @classmethod
+    def from_option_map(cls, option_map: dict[str, str]) -> Self | None:
+        """
+        解析 -quality-detection 和 -quality-detection-mode
+
+        参数错误时记录日志并使用默认值，未启用时返回 None
+        """
+        if not (quality_detection := option_map.get("quality-detection")):
+            return None
+
+        _param_list = quality_detection.split(":")
+        try:
+            metric = Quality_metric(_param_list[0])
+        except ValueError:
+            log.error(
+                "Param error from '{}': {}",
+                "-quality-detection",
+                f"{_param_list[0]} -> ssim",
+            )
+            metric = Quality_metric.ssim
+
+        threshold = metric.default_threshold
+        if len(_param_list) > 1:
+            try:
+                threshold = float(_param_list[1])
+            except ValueError as e:
+                log.error("Param error from '{}': {}", "-quality-detection", e)
+
+        res = cls(metric, threshold)
+
+        _mode_param_list = option_map.get("quality-detection-mode", "full").split(":")
+        try:
+            res.mode = Quality_detection_mode(_mode_param_list[0])
+            if res.mode == Quality_detection_mode.sample:
+                if len(_mode_param_list) > 1:
+                    res.sample_count = int(_mode_param_list[1])
+                if len(_mode_param_list) > 2:
+                    res.sample_sec = float(_mode_param_list[2])
+                if res.sample_count <= 0 or res.sample_sec <= 0:
+                    raise ValueError(":".join(_mode_param_list))
+        except ValueError as e:
+            log.error("Param error from '{}': {}", "-quality-detection-mode", e)
+            res.mode = Quality_detection_mode.full
+
+        return res
+
+
+def get_compare_cmd(
+    metric: Quality_metric,
+    ref_path: Path,
+    dist_path: Path,
+    log_path: Path,
+    *,
+    ref_seek: str = "",
+    ref_vf: str = "",
+) -> str:
+    """
+    比较编码结果和源的 FFmpeg 命令
+
+    :param ref_seek: 只作用于源的定位选项，编码结果应已从对应的位置开始
+    :param ref_vf: 编码时使用的滤镜，先作用于源再比较
+    """
+    log_path_filter_str = str(log_path).replace("\\", "/").replace(":", "\\\\:")
+    _filter = metric.get_filter(log_path_filter_str)
+    if ref_vf:
+        _filter = f"[0:v]{ref_vf}[ref];[ref][1:v]{_filter}"
+    return (
+        f'ffmpeg -hide_banner -v error {ref_seek}-i "{ref_path}" -i "{dist_path}" '
+        f'-lavfi "{_filter}" -f null -'
+    )
+
+
+def get_sample_window_list(
+    duration: float, sample_count: int, sample_sec: float
+) -> list[float]:
+    """
+    均匀分布的片段起始时间 s
+
+    片段总时长不短于总时长时返回空列表，表示应完整比较
+    """
+    if duration <= 0 or sample_count * sample_sec >= duration:
+        return []
+    return [
+        (duration - sample_sec) * (2 * i + 1) / (2 * sample_count)
+        for i in range(sample_count)
+    ]
+
+
+@final
+class Quality_stats:
+    """
+    逐帧分数的流式统计
+
+    分数保存在紧凑的 array 中，低于阈值的连续帧在读取时合并为区间
+    """
+
+    __slots__ = (
+        "bad_frame_count",
+        "bad_range_list",
+        "metric",
+        "score_array",
+        "threshold",
+    )
+
+    def __init__(self, metric: Quality_metric, threshold: float) -> None:
+        self.metric = metric
+        self.threshold = threshold
+
+        self.score_array: array[float] = array("d")
+        self.bad_frame_count: int = 0
+        self.bad_range_list: list[tuple[int, int]] = []
+        """低于阈值的帧区间 [起始帧, 结束帧]"""
+
+    def add(self, frame: int, score: float) -> None:
+        """按帧序号递增的顺序加入"""
+        self.score_array.append(score)
+        if score >= self.threshold:
+            return
+        self.bad_frame_count += 1
+        if self.bad_range_list and (
+            self.bad_range_list[-1][0] <= frame <= self.bad_range_list[-1][1] + 1
+        ):
+            self.bad_range_list[-1] = (self.bad_range_list[-1][0], frame)
+        else:
+            self.bad_range_list.append((frame, frame))
+
+    def add_log(self, path: Path, offset: int = 0) -> None:
+        """
+        读取一个逐帧数据文件
+
+        :param offset: 文件中第一帧在整个输出中的帧序号
+        """
+        with path.open("rt", encoding="utf-8", newline="") as f:
+            for n, q in self.metric.iter_log(f):
+                self.add(n + offset, q)
+
+    @property
+    def count(self) -> int:
+        return len(self.score_array)
+
+    @property
+    def min(self) -> float:
+        return min(self.score_array, default=math.nan)
+
+    @property
+    def mean(self) -> float:
+        return math.fsum(self.score_array) / self.count if self.count else math.nan
+
+    def get_low(self, *percent_tuple: float) -> tuple[float, ...]:
+        """
+        最差的百分之几的帧中最好的分数，即最近秩的低百分位数
+
+        只取出所需数量的最小值，不排序全部分数
+        """
+        if not self.count:
+            return tuple(math.nan for _ in percent_tuple)
+        rank_list = [
+            max(1, math.ceil(self.count * percent / 100)) for percent in percent_tuple
+        ]
+        low_list = heapq.nsmallest(max(rank_list), self.score_array)
+        return tuple(low_list[rank - 1] for rank in rank_list)
+
+    def to_dict(self) -> dict[str, object]:
+        def _num(val: float) -> float | None:
+            """JSON 没有 inf 和 nan，例如完全相同的帧的 PSNR"""
+            return val if math.isfinite(val) else None
+
+        p1, p5 = self.get_low(1, 5)
+        return {
+            "metric": self.metric.value,
+            "threshold": self.threshold,
+            "frame_count": self.count,
+            "min": _num(self.min),
+            "mean": _num(self.mean),
+            "p1": _num(p1),
+            "p5": _num(p5),
+            "bad_frame_count": self.bad_frame_count,
+            "bad_range_list": [list(bad_range) for bad_range in self.bad_range_list],
+        }
+
+    def write_json(self, path: Path) -> None:
+        with path.open("wt", encoding="utf-8", newline="\n") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=3)
@@ -1,17 +1,15 @@
 import ast
-import csv
 import itertools
 import os
-import re
 import shutil
-import subprocess
 import textwrap
-from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import astuple, dataclass, field
 from datetime import datetime
+from glob import escape
 from itertools import zip_longest
-from operator import itemgetter
 from pathlib import Path
-from threading import Thread
+from threading import Lock, RLock, Thread
 from time import sleep
 from typing import TYPE_CHECKING, Final, Self, TypedDict, final
 
@@ -26,19 +24,69 @@ from ..easyrip_mlang import (
     translate_subtitles,
 )
 from ..utils import get_base62_time, obj_fmt, terminal_progress, type_match
-from .media_info import Media_info, Stream_error
+from .crf_search import Crf_auto, search_crf
+from .media_info import Media_info, Stream_error, get_keyframe_list
+from .output_cache import Output_cache, get_output_cache_key
 from .param import (
     FONT_SUFFIX_SET,
     SUBTITLE_SUFFIX_SET,
 )
+from .process import Process_option, Process_usage, run_cmd, split_cmd
+from .progress import Progress_reader, Progress_reader_group
+from .quality import (
+    FF_QUALITY_LOG_FILE,
+    Quality_detection,
+    Quality_detection_mode,
+    Quality_stats,
+    get_sample_window_list,
+)
 from .sub_and_font import subset
 
 if TYPE_CHECKING:
     from collections.abc import Callable, Iterable, Sequence
 
+    from .journal import Ripper_journal
+
 FF_PROGRESS_LOG_FILE = Path("FFProgress.log")
 FF_REPORT_LOG_FILE = Path("FFReport.log")
 
+_OPTION_CACHE_MAX_SIZE: Final[int] = 64
+
+_UNCACHEABLE_OPTION_KEY_SET: Final[frozenset[str]] = frozenset(
+    {"chunk", "only-mux-sub-path"}
+)
+"""生成 option 时依赖于逐文件的关键帧或扫描的目录"""
+
+
+@final
+class Chunk_cmd_group(tuple[str, ...]):
+    """分段编码的命令组，组内每个命令编码同一条流的一段，进度需要累加"""
+
+    __slots__ = ()
+
+
+def _format_cmd(
+    cmd: "str | tuple[str, ...]", format_map: dict[str, str]
+) -> "str | tuple[str, ...]":
+    """格式化命令，元组为并行执行的命令组，组内每个命令使用独立的进度文件"""
+    if isinstance(cmd, str):
+        return cmd.format_map(format_map)
+    progress_file = Path(format_map["progress"])
+    return type(cmd)(
+        s.format_map(
+            format_map | {"progress": str(progress_file.with_suffix(f".{j}.log"))}
+        )
+        for j, s in enumerate(cmd)
+    )
+
+
+def _cmd_to_str(cmd: "str | tuple[str, ...]") -> str:
+    if isinstance(cmd, str):
+        return cmd
+    return (
+        "(parallel chunks)\n" if isinstance(cmd, Chunk_cmd_group) else "(parallel)\n"
+    ) + textwrap.indent("\n".join(cmd), prefix="   | ")
+
 
 @final
 class Ripper:
@@ -60,25 +108,132 @@ class Ripper:
         except Exception as e:
             log.error("Failed to add Ripper: {}", e, deep=True)
 
+    @classmethod
+    def add_ripper_list(
+        cls: type["Ripper"],
+        ripper_args_list: "Sequence[tuple[Iterable[str | Path], Iterable[str | None], str | Path | None, Option | Preset_name, dict[str, str]]]",
+        *,
+        max_workers: int = 8,
+        is_lazy: bool = False,
+    ) -> None:
+        """
+        并发构造多个 Ripper (探测媒体信息是 I/O 密集的)，按原顺序加入 ripper_list
+
+        输入相同的 Ripper 在同一个线程中依次构造，使后面的探测命中缓存
+        is_lazy 时不探测，直接构造
+        """
+        ripper_args_list = [
+            (list(input_path), list(output_prefix), output_dir, option, option_map)
+            for input_path, output_prefix, output_dir, option, option_map in ripper_args_list
+        ]
+
+        group_map: dict[str, list[int]] = {}
+        for i, ripper_args in enumerate(ripper_args_list):
+            group_map.setdefault(
+                str(ripper_args[0][0]) if ripper_args[0] else "", []
+            ).append(i)
+
+        ripper_res_list: list[Ripper | None] = [None] * len(ripper_args_list)
+
+        def _add_group(index_list: list[int]) -> None:
+            for i in index_list:
+                ripper_args = ripper_args_list[i]
+                try:
+                    ripper_res_list[i] = cls(*ripper_args, is_lazy=is_lazy)
+                except Exception as e:
+                    log.error(
+                        "Failed to add Ripper: {}",
+                        f"{ripper_args[0][0] if ripper_args[0] else ''} {e!r}",
+                        deep=True,
+                    )
+
+        with ThreadPoolExecutor(
+            max_workers=1 if is_lazy else max(1, min(max_workers, len(group_map)))
+        ) as executor:
+            # 消费迭代器以等待全部完成
+            for _ in executor.map(_add_group, group_map.values()):
+                pass
+
+        cls.ripper_list.extend(
+            ripper for ripper in ripper_res_list if ripper is not None
+        )
+
+    @classmethod
+    def prepare_ripper_list(
+        cls: type["Ripper"],
+        ripper_list: "list[Ripper]",
+        *,
+        max_workers: int = 8,
+    ) -> None:
+        """
+        并发准备 lazy 的 Ripper，准备失败的 Ripper 从列表中移除
+
+        并行调度和按开销排序需要所有 Ripper 的媒体信息
+        """
+        unprepared_list = [ripper for ripper in ripper_list if not ripper.is_prepared]
+        if not unprepared_list:
+            return
+
+        def _prepare(ripper: Ripper) -> bool:
+            try:
+                ripper.prepare()
+            except Exception as e:
+                log.error(
+                    "Failed to add Ripper: {}",
+                    f"{ripper.input_path_list[0]} {e!r}",
+                    deep=True,
+                )
+                return False
+            return True
+
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(max_workers, len(unprepared_list)))
+        ) as executor:
+            failed_set = {
+                id(ripper)
+                for ripper, is_ok in zip(
+                    unprepared_list,
+                    executor.map(_prepare, unprepared_list),
+                    strict=True,
+                )
+                if not is_ok
+            }
+
+        if failed_set:
+            ripper_list[:] = [
+                ripper for ripper in ripper_list if id(ripper) not in failed_set
+            ]
+
     from .param import Audio_codec, Muxer, Preset_name
 
     @dataclass(slots=True)
     class Option:
         preset_name: "Ripper.Preset_name"
-        encoder_format_str_list: list[str]
+        encoder_format_str_list: "list[str | tuple[str, ...]]"
+        """元组为可并行执行的命令组"""
         audio_encoder: "Ripper.Audio_codec | None"
         muxer: "Ripper.Muxer | None"
         muxer_format_str_list: list[str]
+        quality_log_offset_list: list[int] = field(default_factory=list[int])
+        """非空时编码命令同步进行画质检测，各数据文件对应的起始帧序号"""
+        crf_auto_enc_opt: str = ""
+        """-crf auto 的样本编码使用的编码器选项，其中的 CRF 为 {crf}"""
+
+    _option_cache: "Final[dict[tuple[object, ...], Option]]" = {}
+    """编译键 -> option，Option 生成后不再修改，因此可以被多个 Ripper 共享"""
+    _option_cache_lock: Final = Lock()
 
     input_path_list: list[Path]
     output_prefix_list: list[str]
     output_dir: Path
-    option: Option
     option_map: dict[str, str]
 
     preset_name: Preset_name
 
-    media_info: Media_info
+    is_lazy: bool
+    """推迟探测媒体信息和生成 option，直到执行前或被访问时"""
+    _media_info: Media_info | None
+    _option: Option | None
 
     class _Progress(TypedDict, total=False):
         frame_count: int
@@ -95,6 +250,8 @@ class Ripper:
 
         speed: float
         """当前输出速率 倍"""
+        eta: float
+        """预计剩余时间 s"""
 
     _progress: _Progress
 
@@ -105,10 +262,16 @@ class Ripper:
         output_dir: str | Path | None,
         option: Option | Preset_name,
         option_map: dict[str, str],
+        *,
+        is_lazy: bool = False,
     ) -> None:
         self.input_path_list = [Path(path) for path in input_path]
 
-        self.media_info = Media_info.from_path(self.input_path_list[0])
+        self.is_lazy = is_lazy
+        self._prepare_lock = RLock()
+        self._media_info = (
+            None if is_lazy else Media_info.from_path(self.input_path_list[0])
+        )
 
         self.output_prefix_list = [
             path[0] or (path[1] or self.input_path_list[-1]).stem
@@ -119,6 +282,11 @@ class Ripper:
 
         self.option_map = option_map.copy()
 
+        self.auto_crf: str | None = None
+        """-crf auto 搜索得到的 CRF，生成 option 时代替 auto"""
+        self.is_flac_pipe_fallback: bool = False
+        """管道无法察觉 FFmpeg 的失败时改用临时 WAV，不修改 option_map 以免任务日志的记录对不上"""
+
         # 内封字幕时强制修改 muxer
         if (
             self.option_map.get("soft-sub") or self.option_map.get("only-mux-sub-path")
@@ -130,27 +298,109 @@ class Ripper:
 
         if isinstance(option, Ripper.Preset_name):
             self.preset_name = option
-            self.option = self.preset_name_to_option(option)
+            self._option = None if is_lazy else self.preset_name_to_option(option)
         else:
             self.preset_name = Ripper.Preset_name.custom
-            self.option = option
+            self._option = option
 
         self._progress: Ripper._Progress = {}
 
+        self.journal: Ripper_journal | None = None
+        """执行时记录状态的任务日志"""
+
+    @property
+    def media_info(self) -> Media_info:
+        with self._prepare_lock:
+            if self._media_info is None:
+                self._media_info = Media_info.from_path(self.input_path_list[0])
+            return self._media_info
+
+    @property
+    def option(self) -> Option:
+        with self._prepare_lock:
+            if self._option is None:
+                self._option = self.preset_name_to_option(self.preset_name)
+            return self._option
+
+    @property
+    def is_prepared(self) -> bool:
+        return self._media_info is not None and self._option is not None
+
+    def prepare(self) -> Self:
+        """探测媒体信息并生成 option，非 lazy 时已在构造时完成"""
+        _ = self.media_info, self.option
+        return self
+
+    def release(self) -> None:
+        """Lazy 的 Ripper 执行后释放媒体信息和 option，使长列表的内存保持平稳"""
+        if self.is_lazy and self.preset_name is not Ripper.Preset_name.custom:
+            with self._prepare_lock:
+                self._media_info = None
+                self._option = None
+
     def __str__(self, *, indent: int = 2, width: int | None = None) -> str:
         return (
-            f"-i {self.input_path_list[0]} -o {self.output_prefix_list[0]} -o:dir {self.output_dir} -preset {self.option.preset_name.value} {' '.join((f'-{key} {val}' for key, val in self.option_map.items()))}\n"
-            f"option: {obj_fmt(self.option, indent=indent, width=width)}\n"
+            f"-i {self.input_path_list[0]} -o {self.output_prefix_list[0]} -o:dir {self.output_dir} -preset {(self.option.preset_name if self.is_prepared else self.preset_name).value} {' '.join((f'-{key} {val}' for key, val in self.option_map.items()))}\n"
+            f"option: {obj_fmt(self.option, indent=indent, width=width) if self.is_prepared else '(lazy)'}\n"
             f"option_map: {obj_fmt(self.option_map, indent=indent, width=width)}"
         )
 
+    def _get_option_cache_key(
+        self, preset_name: Preset_name
+    ) -> tuple[object, ...] | None:
+        """
+        生成 option 只依赖于选项、输入的类型和少量探测得到的值，以此作为编译键
+
+        命令中的输入输出路径在执行时才填入，因此批量处理相同选项的文件时可以复用编译结果
+        无法缓存时返回 None
+        """
+        if any(key in self.option_map for key in _UNCACHEABLE_OPTION_KEY_SET):
+            return None
+        return (
+            preset_name,
+            tuple(sorted(self.option_map.items())),
+            self.input_path_list[0].suffix,
+            self.auto_crf,
+            self.is_flac_pipe_fallback,
+            self.media_info.width,
+            self.media_info.height,
+            self.media_info.r_frame_rate,
+            tuple(astuple(audio_info) for audio_info in self.media_info.audio_info),
+        )
+
     def preset_name_to_option(self, preset_name: Preset_name) -> Option:
+        """
+        生成 option，编译键相同时复用已生成的 Option
+
+        日志只在实际生成时输出
+        """
+        if (key := self._get_option_cache_key(preset_name)) is None:
+            return self._compile_option(preset_name)
+
+        with Ripper._option_cache_lock:
+            if (option := Ripper._option_cache.pop(key, None)) is not None:
+                # 移到末尾，按最近使用的顺序淘汰
+                Ripper._option_cache[key] = option
+                return option
+
+        # 生成时不持有锁，使并行准备的不同选项互不阻塞
+        option = self._compile_option(preset_name)
+
+        with Ripper._option_cache_lock:
+            option = Ripper._option_cache.setdefault(key, option)
+            while len(Ripper._option_cache) > _OPTION_CACHE_MAX_SIZE:
+                del Ripper._option_cache[next(iter(Ripper._option_cache))]
+        return option
+
+    def _compile_option(self, preset_name: Preset_name) -> Option:
         if os.name == "nt":
             cmd_head_del = "del /Q"
             cmd_head_copy = "copy"
+            cmd_head_move = "move /Y"
         else:
-            cmd_head_del = "rm /f"
+            cmd_head_del = "rm -f"
             cmd_head_copy = "cp"
+            cmd_head_move = "mv -f"
 
         if (
             force_fps := self.option_map.get("r") or self.option_map.get("fps")
@@ -330,11 +580,11 @@ class Ripper:
                             log.error('It is not a path: "{}"', only_mux_sub_path)
                     del only_mux_sub_path
 
+                    # 一次写出最终的 MKV，再重命名覆盖编码输出
+                    # mkvmerge 默认会为每个轨道重新生成统计标签，--no-track-tags 只丢弃输入中过时的标签
                     muxer_format_str_list = [
-                        'mkvpropedit "{output}" --add-track-statistics-tags',
-                        'mkvmerge -o "{output}.temp.mkv" "{output}"',
                         (
-                            'mkvmerge -o "{output}" '
+                            'mkvmerge -o "{output}.temp.mkv" '
                             + (
                                 f"--default-duration 0:{force_fps}fps --fix-bitstream-timing-information 0:1 "
                                 if force_fps and only_mux_sub_file_list is None
@@ -363,9 +613,9 @@ class Ripper:
                                 if only_mux_sub_file_list is not None
                                 else ""
                             )
-                            + ' --no-global-tags --no-track-tags --default-track-flag 0 "{output}.temp.mkv"'
+                            + ' --no-global-tags --no-track-tags --default-track-flag 0 "{output}"'
                         ),
-                        cmd_head_del + ' "{output}.temp.mkv"',
+                        cmd_head_move + ' "{output}.temp.mkv" "{output}"',
                     ]
 
         else:
@@ -393,7 +643,7 @@ class Ripper:
         if _preset := self.option_map.get("v:preset"):
             ffparams_out += f"-preset {_preset} "
 
-        FFMPEG_HEADER = f"ffmpeg {'-hide_banner ' if self.option_map.get('_sub_ripper_num') else ''}-progress {FF_PROGRESS_LOG_FILE} -report {ffparams_ff} {ffparams_in}"
+        FFMPEG_HEADER = f'ffmpeg {"-hide_banner " if self.option_map.get("_sub_ripper_num") else ""}-progress "{{progress}}" -report {ffparams_ff} {ffparams_in}'
 
         def get_vs_ff_cmd(enc_opt: str) -> str:
             vspipe_input: str = ""
@@ -423,13 +673,158 @@ class Ripper:
                 )
             )
 
+        # 同步画质检测的各数据文件对应的起始帧序号
+        quality_log_offset_list: list[int] = []
+        quality_detection = Quality_detection.from_option_map(self.option_map)
+        if (
+            quality_detection is not None
+            and quality_detection.mode == Quality_detection_mode.inline
+            and self.option_map.get("hwaccel")
+        ):
+            log.warning(
+                "{} can not be used with {}, disable it",
+                "-quality-detection-mode inline",
+                "-hwaccel",
+            )
+            quality_detection.mode = Quality_detection_mode.full
+
+        def get_inline_quality_opt(j: int, offset: int) -> str:
+            """
+            用回环解码器解码刚编码的视频流，与源在同一个进程中比较
+
+            需要 FFmpeg 7.0 以上
+            """
+            if (
+                quality_detection is None
+                or quality_detection.mode != Quality_detection_mode.inline
+            ):
+                return ""
+            quality_log_offset_list.append(offset)
+            _ref = (
+                f"[0:v]{','.join(ff_vf_option)}[ref];[ref]" if ff_vf_option else "[0:v]"
+            )
+            _filter = quality_detection.metric.get_filter(
+                f"{{quality}}.{j}.log", is_shortest=True
+            )
+            return f' -dec 0:0 -filter_complex "{_ref}[dec:0]{_filter}[qd]" -map "[qd]" -f null -'
+
+        def get_video_cmd_list(enc_opt: str) -> "list[str | tuple[str, ...]]":
+            """
+            视频 preset 的编码命令
+
+            启用 -chunk 时，在关键帧处分段并行编码，再用 mkvmerge 无损拼接，最后合入音频
+            """
+            if (_chunk := self.option_map.get("chunk")) is None:
+                return [get_vs_ff_cmd(enc_opt) + get_inline_quality_opt(0, 0)]
+            try:
+                chunk_num = int(_chunk)
+            except ValueError as e:
+                raise Mlang_exception("{} param illegal", f"-chunk {_chunk}") from e
+            if chunk_num <= 1:
+                return [get_vs_ff_cmd(enc_opt) + get_inline_quality_opt(0, 0)]
+            if is_pipe_input or self.option_map.get("ss") or self.option_map.get("t"):
+                log.warning(
+                    "{} can not be used with {}, disable it",
+                    "-chunk",
+                    "-pipe / .vpy / -ss / -t",
+                )
+                return [get_vs_ff_cmd(enc_opt) + get_inline_quality_opt(0, 0)]
+            # 各段的时间戳从 0 开始，-sub 的字幕和 -vf 中与时间或帧序号相关的滤镜会错位
+            if ff_vf_option:
+                log.warning(
+                    "{} can not be used with {}, disable it",
+                    "-chunk",
+                    "-sub / -vf",
+                )
+                return [get_vs_ff_cmd(enc_opt) + get_inline_quality_opt(0, 0)]
+
+            # 取最接近均分点的关键帧作为分段点
+            keyframe_list, frame_count = get_keyframe_list(self.input_path_list[0])
+            split_keyframe_list: list[tuple[float, int]] = []
+            for j in range(1, chunk_num):
+                if not keyframe_list:
+                    break
+                _target = frame_count * j / chunk_num
+                _keyframe = min(keyframe_list, key=lambda kf: abs(kf[1] - _target))
+                if _keyframe[1] > (
+                    split_keyframe_list[-1][1] if split_keyframe_list else 0
+                ):
+                    split_keyframe_list.append(_keyframe)
+            if not split_keyframe_list:
+                log.warning(
+                    "{} can not be used with {}, disable it",
+                    "-chunk",
+                    "< 2 keyframes",
+                )
+                return [get_vs_ff_cmd(enc_opt) + get_inline_quality_opt(0, 0)]
+
+            _hwaccel = (
+                f"-hwaccel {hwaccel} "
+                if (hwaccel := self.option_map.get("hwaccel"))
+                else ""
+            )
+            _vf = f'-vf "{",".join(ff_vf_option)}" ' if len(ff_vf_option) else ""
+
+            _chunk_output_list: list[str] = []
+            _chunk_cmd_list: list[str] = []
+            for j, (_start, _end) in enumerate(
+                zip_longest(
+                    (None, *split_keyframe_list),
+                    split_keyframe_list,
+                )
+            ):
+                _chunk_output = f'"{{output}}.chunk.{j}.mkv"'
+                _chunk_output_list.append(_chunk_output)
+                _chunk_cmd_list.append(
+                    f"{FFMPEG_HEADER} {_hwaccel}"
+                    # 从关键帧的时间精确定位，再用帧数截断，各段首尾相接
+                    + (f"-ss {_start[0]:.6f} " if _start else "")
+                    + '-i "{input}" -map 0:v:0 -an -sn -dn '
+                    + (
+                        f"-frames:v {_end[1] - (_start[1] if _start else 0)} "
+                        if _end
+                        else ""
+                    )
+                    + f"{enc_opt} {ffparams_out}{_vf}{_chunk_output}"
+                    + get_inline_quality_opt(j, _start[1] if _start else 0)
+                )
+
+            return [
+                Chunk_cmd_group(_chunk_cmd_list),
+                (
+                    'mkvmerge -q -o "{output}.chunk.mkv" '
+                    + " + ".join(_chunk_output_list)
+                ),
+                (
+                    f'ffmpeg {"-hide_banner " if self.option_map.get("_sub_ripper_num") else ""}-progress "{{progress}}" -report {ffparams_ff} '
+                    '-i "{output}.chunk.mkv" -i "{input}" -map 0:v '
+                    + ("-map 1:a " if "0:a" in ff_stream_option else "")
+                    + f'-c:v copy {audio_option} "{{output}}"'
+                ),
+                f'{cmd_head_del} "{{output}}.chunk.mkv" {" ".join(_chunk_output_list)}',
+            ]
+
         preset_param_getted = {
             _param_name: self.option_map.get(_param_name)
             for _param_name in preset_name.get_param_name_set(set())
         }
         preset_param_default_dict = preset_name.get_param_default_dict({})
 
-        encoder_format_str_list: list[str]
+        # -crf auto 在执行前搜索，之前使用默认值
+        crf_auto = Crf_auto.from_option_map(self.option_map)
+        if crf_auto is not None:
+            if "crf" in preset_param_getted:
+                preset_param_getted["crf"] = self.auto_crf
+            if is_pipe_input:
+                log.warning(
+                    "{} can not be used with {}, disable it",
+                    "-crf auto",
+                    "-pipe / .vpy",
+                )
+                crf_auto = None
+        crf_auto_enc_opt: str = ""
+
+        encoder_format_str_list: list[str | tuple[str, ...]]
         match preset_name:
             case Ripper.Preset_name.custom:
                 if not (
@@ -454,7 +849,12 @@ class Ripper:
                         _encoder_format_str.replace("\\34/", '"')
                         .replace("\\39/", "'")
                         .format_map(
-                            self.option_map | {"input": "{input}", "output": "{output}"}
+                            self.option_map
+                            | {
+                                "input": "{input}",
+                                "output": "{output}",
+                                "progress": "{progress}",
+                            }
                         )
                     )
                     encoder_format_str_list = [_encoder_format_str]
@@ -512,6 +912,12 @@ class Ripper:
                 _mux_flac_input_list: list[str] = []
                 _del_flac_str_list: list[str] = []
 
+                # 将 FFmpeg 输出的 PCM 直接通过管道送入 flac，不写临时 WAV
+                _is_flac_pipe: bool = (
+                    self.option_map.get("flac-pipe", "1") != "0"
+                    and not self.is_flac_pipe_fallback
+                )
+
                 for _audio_info in self.media_info.audio_info:
                     _encoder: str = (
                         "pcm_s24le"
@@ -538,19 +944,25 @@ class Ripper:
 
                     _new_output_str: str = "{output}" + f".{_audio_info.index}.temp"
 
-                    _ff_encode_str += (
-                        f"-map 0:{_audio_info.index} -c:a {_encoder} {ffparams_out} "
-                        f'"{_new_output_str}.wav" '
-                    )
-                    _flac_encode_str_list.extend(
-                        [
-                            (
-                                f"flac -j 32 -8 -e -p -l {'19' if _audio_info.sample_rate > 48000 else '12'} "
-                                f'-o "{_new_output_str}.flac" "{_new_output_str}.wav"'
-                            ),
-                            f'{cmd_head_del} "{_new_output_str}.wav"',
-                        ]
-                    )
+                    _flac_param: str = f"-j 32 -8 -e -p -l {'19' if _audio_info.sample_rate > 48000 else '12'}"
+
+                    if _is_flac_pipe:
+                        # 管道中的 WAV 头没有正确的长度，需要 --ignore-chunk-sizes
+                        _flac_encode_str_list.append(
+                            FFMPEG_HEADER
+                            + f' -i "{{input}}" -map 0:{_audio_info.index} -c:a {_encoder} {ffparams_out} -f wav - | '
+                            f'flac --ignore-chunk-sizes {_flac_param} -o "{_new_output_str}.flac" -'
+                        )
+                    else:
+                        _ff_encode_str += (
+                            f"-map 0:{_audio_info.index} -c:a {_encoder} {ffparams_out} "
+                            f'"{_new_output_str}.wav" '
+                        )
+                        _flac_encode_str_list.append(
+                            f"flac {_flac_param} "
+                            f'-o "{_new_output_str}.flac" "{_new_output_str}.wav" && '
+                            f'{cmd_head_del} "{_new_output_str}.wav"'
+                        )
 
                     _mux_flac_input_list.append(f'"{_new_output_str}.flac"')
 
@@ -558,14 +970,27 @@ class Ripper:
                         f'{cmd_head_del} "{_new_output_str}.flac" '
                     )
 
+                _ff_decode_str_list: list[str] = (
+                    [FFMPEG_HEADER + f' -i "{{input}}" {_ff_encode_str}']
+                    if _ff_encode_str
+                    else []
+                )
+
+                # 各轨道的编码互相独立，作为命令组并行执行
+                _flac_encode_cmd_list: list[str | tuple[str, ...]] = (
+                    [tuple(_flac_encode_str_list)]
+                    if len(_flac_encode_str_list) > 1
+                    else [*_flac_encode_str_list]
+                )
+
                 match len(_mux_flac_input_list):
                     case 0:
                         raise RuntimeError(f'No audio in "{self.input_path_list[0]}"')
 
                     case 1 if muxer is None:
                         encoder_format_str_list = [
-                            FFMPEG_HEADER + f' -i "{{input}}" {_ff_encode_str}',
-                            *_flac_encode_str_list,
+                            *_ff_decode_str_list,
+                            *_flac_encode_cmd_list,
                             (
                                 f"{cmd_head_copy} {_mux_flac_input_list[0]} "
                                 '"{output}"'  # .
@@ -586,8 +1011,8 @@ class Ripper:
                             )
                         )
                         encoder_format_str_list = [
-                            FFMPEG_HEADER + f' -i "{{input}}" {_ff_encode_str}',
-                            *_flac_encode_str_list,
+                            *_ff_decode_str_list,
+                            *_flac_encode_cmd_list,
                             f"{_mux_str}",
                             *_del_flac_str_list,
                         ]
@@ -622,13 +1047,15 @@ class Ripper:
                 ):
                     log.warning("The CRF is not between QPmin and QPmax")
 
-                _param = ":".join(f"{key}={val}" for key, val in _option_map.items())
+                def get_x264_enc_opt(option_map: dict[str, str]) -> str:
+                    _param = ":".join(f"{key}={val}" for key, val in option_map.items())
+                    return f'-c:v libx264 {"" if is_pipe_input else "-pix_fmt yuv420p"} -x264-params "{_param}" '
 
-                encoder_format_str_list = [
-                    get_vs_ff_cmd(
-                        f'-c:v libx264 {"" if is_pipe_input else "-pix_fmt yuv420p"} -x264-params "{_param}" '
-                    )
-                ]
+                encoder_format_str_list = get_video_cmd_list(
+                    get_x264_enc_opt(_option_map)
+                )
+                if crf_auto is not None:
+                    crf_auto_enc_opt = get_x264_enc_opt(_option_map | {"crf": "{crf}"})
 
             case (
                 Ripper.Preset_name.x265
@@ -695,13 +1122,15 @@ class Ripper:
                 ):
                     log.warning("The CRF is not between QPmin and QPmax")
 
-                _param = ":".join(f"{key}={val}" for key, val in _option_map.items())
+                def get_x265_enc_opt(option_map: dict[str, str]) -> str:
+                    _param = ":".join(f"{key}={val}" for key, val in option_map.items())
+                    return f'-c:v libx265 {"" if is_pipe_input else "-pix_fmt yuv420p10le"} -x265-params "{_param}"'
 
-                encoder_format_str_list = [
-                    get_vs_ff_cmd(
-                        f'-c:v libx265 {"" if is_pipe_input else "-pix_fmt yuv420p10le"} -x265-params "{_param}"'
-                    )
-                ]
+                encoder_format_str_list = get_video_cmd_list(
+                    get_x265_enc_opt(_option_map)
+                )
+                if crf_auto is not None:
+                    crf_auto_enc_opt = get_x265_enc_opt(_option_map | {"crf": "{crf}"})
 
             case (
                 Ripper.Preset_name.h264_amf
@@ -731,9 +1160,9 @@ class Ripper:
                     (f"-{key} {val}" for key, val in _option_map.items() if val)
                 )
 
-                encoder_format_str_list = [
-                    get_vs_ff_cmd(f"-c:v {preset_name.value} {_param}")
-                ]
+                encoder_format_str_list = get_video_cmd_list(
+                    f"-c:v {preset_name.value} {_param}"
+                )
 
             case Ripper.Preset_name.svtav1:
                 _option_map = {
@@ -743,11 +1172,19 @@ class Ripper:
                     ),
                 }
 
-                _param = " ".join(
-                    (f"-{key} {val}" for key, val in _option_map.items() if val)
-                )
+                def get_svtav1_enc_opt(option_map: dict[str, str | None]) -> str:
+                    _param = " ".join(
+                        (f"-{key} {val}" for key, val in option_map.items() if val)
+                    )
+                    return f"-c:v libsvtav1 {_param}"
 
-                encoder_format_str_list = [get_vs_ff_cmd(f"-c:v libsvtav1 {_param}")]
+                encoder_format_str_list = get_video_cmd_list(
+                    get_svtav1_enc_opt(_option_map)
+                )
+                if crf_auto is not None:
+                    crf_auto_enc_opt = get_svtav1_enc_opt(
+                        _option_map | {"crf": "{crf}"}
+                    )
 
             case Ripper.Preset_name.vvenc:
                 _option_map = {
@@ -761,7 +1198,7 @@ class Ripper:
                     (f"-{key} {val}" for key, val in _option_map.items() if val)
                 )
 
-                encoder_format_str_list = [get_vs_ff_cmd(f"-c:v libvvenc {_param}")]
+                encoder_format_str_list = get_video_cmd_list(f"-c:v libvvenc {_param}")
 
             case Ripper.Preset_name.ffv1:
                 _option_map = {
@@ -773,7 +1210,14 @@ class Ripper:
                     (f"-{key} {val}" for key, val in _option_map.items() if val)
                 )
 
-                encoder_format_str_list = [get_vs_ff_cmd(f"-c:v ffv1 {_param}")]
+                encoder_format_str_list = get_video_cmd_list(f"-c:v ffv1 {_param}")
+
+        if crf_auto is not None and not crf_auto_enc_opt:
+            log.warning(
+                "{} can not be used with {}, disable it",
+                "-crf auto",
+                f"-preset {preset_name.value}",
+            )
 
         return Ripper.Option(
             preset_name,
@@ -781,13 +1225,19 @@ class Ripper:
             audio_encoder,
             muxer,
             muxer_format_str_list,
+            quality_log_offset_list,
+            crf_auto_enc_opt,
         )
 
     def run(
         self,
         prep_func: "Callable[[Self], None]" = lambda _: None,
     ) -> bool:
-        terminal_progress.indeterminate()
+        # 与主命令并行执行的子 Ripper 不占用终端和 web 的进度显示
+        is_side_stage: Final[bool] = self.option_map.get("_side_stage") == "1"
+
+        if not is_side_stage:
+            terminal_progress.indeterminate()
 
         if not self.input_path_list[0].exists():
             log.error('The file "{}" does not exist', self.input_path_list[0])
@@ -795,6 +1245,25 @@ class Ripper:
 
         prep_func(self)
 
+        # 输出缓存
+        output_cache_key: str | None = None
+        if self.option_map.get("output-cache", "0") != "0" and not is_side_stage:
+            output_cache_key = get_output_cache_key(self)
+
+        # 搜索 CRF 后重新生成 option，命中输出缓存时不必搜索
+        if (
+            self.auto_crf is None
+            and self.option.crf_auto_enc_opt
+            and (crf_auto := Crf_auto.from_option_map(self.option_map)) is not None
+            and not (
+                output_cache_key is not None and Output_cache.contains(output_cache_key)
+            )
+            and (auto_crf := search_crf(self, crf_auto)) is not None
+        ):
+            with self._prepare_lock:
+                self.auto_crf = auto_crf
+                self._option = self.preset_name_to_option(self.preset_name)
+
         # 生成临时名
         basename = self.output_prefix_list[0]
         temp_name = (
@@ -802,8 +1271,14 @@ class Ripper:
         )
         suffix: str
 
+        # 每个 Ripper 使用独立的进度文件和报告文件，防止并行执行时互相读取和删除
+        _ff_log_sign = f"{get_base62_time()}.{id(self):x}"
+        ff_progress_log_file = FF_PROGRESS_LOG_FILE.with_suffix(f".{_ff_log_sign}.log")
+        ff_report_log_file = FF_REPORT_LOG_FILE.with_suffix(f".{_ff_log_sign}.log")
+        ff_quality_log_prefix = FF_QUALITY_LOG_FILE.with_suffix(f".{_ff_log_sign}")
+
         # 根据格式判断
-        cmd_list: list[str]
+        cmd_list: list[str | tuple[str, ...]]
         match self.option.preset_name:
             case Ripper.Preset_name.custom:
                 suffix = (
@@ -817,21 +1292,50 @@ class Ripper:
                         {
                             "input": str(self.input_path_list[0]),
                             "output": str(self.output_dir / temp_name),
+                            "progress": str(ff_progress_log_file),
                         }
                     )
                     for s in self.option.encoder_format_str_list
                 ]
 
             case Ripper.Preset_name.flac:
+                # 交给 shell 执行的管道只返回 flac 的状态码，察觉不到 FFmpeg 的失败，改用临时 WAV
+                if (
+                    self.option_map.get("flac-pipe", "1") != "0"
+                    and not self.is_flac_pipe_fallback
+                ) and any(
+                    split_cmd(
+                        _s.format_map(
+                            {
+                                "input": str(self.input_path_list[0]),
+                                "output": str(self.output_dir / temp_name),
+                                "progress": str(ff_progress_log_file),
+                            }
+                        )
+                    )
+                    is None
+                    for _cmd in self.option.encoder_format_str_list
+                    for _s in ((_cmd,) if isinstance(_cmd, str) else _cmd)
+                    if "|" in _s
+                ):
+                    log.warning(
+                        "The pipe can not detect the failure of FFmpeg, use temporary WAV files"
+                    )
+                    with self._prepare_lock:
+                        self.is_flac_pipe_fallback = True
+                        self._option = self.preset_name_to_option(self.preset_name)
+
                 if self.option.muxer is not None or len(self.media_info.audio_info) > 1:
                     suffix = f".flac.{'mp4' if self.option.muxer == Ripper.Muxer.mp4 else 'mkv'}"
                     temp_name = temp_name + suffix
                     cmd_list = [
-                        s.format_map(
+                        _format_cmd(
+                            s,
                             {
                                 "input": str(self.input_path_list[0]),
                                 "output": str(self.output_dir / temp_name),
-                            }
+                                "progress": str(ff_progress_log_file),
+                            },
                         )
                         for str_list in (
                             self.option.encoder_format_str_list,
@@ -843,11 +1347,13 @@ class Ripper:
                     suffix = ".flac"
                     temp_name = temp_name + suffix
                     cmd_list = [
-                        s.format_map(
+                        _format_cmd(
+                            s,
                             {
                                 "input": str(self.input_path_list[0]),
                                 "output": str(self.output_dir / temp_name),
-                            }
+                                "progress": str(ff_progress_log_file),
+                            },
                         )
                         for s in self.option.encoder_format_str_list
                     ]
@@ -885,6 +1391,10 @@ class Ripper:
                                     add_tr_file_list.append(f_and_s[0])
 
                 _output_dir = self.output_dir / basename
+                # 只子集化时不经过之后的执行流程，在这里记录任务日志
+                # 输出目录可能是用户已有的目录，不作为临时输出，中断后由重新执行覆盖
+                if self.option.muxer is None and self.journal is not None:
+                    self.journal.set_running(self, self.output_dir / temp_name)
                 _output_dir.mkdir(parents=True, exist_ok=True)
 
                 _ass_list: Final[list[Path]] = []
@@ -925,6 +1435,22 @@ class Ripper:
                     )
                     _strict = self.option_map.get("subset-strict", "0") != "0"
 
+                    # 与主命令并行时，编码器已占用所有核心
+                    _max_workers: int | None = (
+                        max(1, (os.cpu_count() or 1) // 2)
+                        if self.option_map.get("_side_stage") == "1"
+                        else None
+                    )
+                    if (
+                        _parallel_jobs := self.option_map.get("parallel-jobs")
+                    ) is not None:
+                        try:
+                            _max_workers = max(1, int(_parallel_jobs))
+                        except ValueError:
+                            log.error(
+                                "{} param illegal", f"-parallel-jobs {_parallel_jobs}"
+                            )
+
                     subset_res = subset(
                         _ass_list,
                         _font_path_list,
@@ -936,6 +1462,7 @@ class Ripper:
                         drop_non_render=_drop_non_render,
                         drop_unkow_data=_drop_unkow_data,
                         strict=_strict,
+                        max_workers=_max_workers,
                     )
                 else:
                     subset_res = True
@@ -954,6 +1481,10 @@ class Ripper:
                     log.error("Run {} failed", "subset")
 
                 if self.option.muxer is None:
+                    if self.journal is not None:
+                        self.journal.set_end(
+                            self, is_done=subset_res, output_path=_output_dir
+                        )
                     return subset_res
 
                 suffix = ".mks"
@@ -988,6 +1519,7 @@ class Ripper:
                         {
                             "input": str(self.input_path_list[0]),
                             "output": str(self.output_dir / temp_name),
+                            "progress": str(ff_progress_log_file),
                         }
                     )
                 ]
@@ -1003,11 +1535,14 @@ class Ripper:
                             )
                         temp_name = temp_name + suffix
                         cmd_list = [
-                            s.format_map(
+                            _format_cmd(
+                                s,
                                 {
                                     "input": str(self.input_path_list[0]),
                                     "output": str(self.output_dir / temp_name),
-                                }
+                                    "progress": str(ff_progress_log_file),
+                                    "quality": str(ff_quality_log_prefix),
+                                },
                             )
                             for str_list in (
                                 self.option.encoder_format_str_list,
@@ -1025,11 +1560,14 @@ class Ripper:
                             )
                         temp_name = temp_name + suffix
                         cmd_list = [
-                            s.format_map(
+                            _format_cmd(
+                                s,
                                 {
                                     "input": str(self.input_path_list[0]),
                                     "output": str(self.output_dir / temp_name),
-                                }
+                                    "progress": str(ff_progress_log_file),
+                                    "quality": str(ff_quality_log_prefix),
+                                },
                             )
                             for str_list in (
                                 self.option.encoder_format_str_list,
@@ -1047,17 +1585,52 @@ class Ripper:
                             )
                         temp_name = temp_name + suffix
                         cmd_list = [
-                            s.format_map(
+                            _format_cmd(
+                                s,
                                 {
                                     "input": str(self.input_path_list[0]),
                                     "output": str(self.output_dir / temp_name),
-                                }
+                                    "progress": str(ff_progress_log_file),
+                                    "quality": str(ff_quality_log_prefix),
+                                },
                             )
                             for s in self.option.encoder_format_str_list
                         ]
 
         # 执行
         output_filename = basename + suffix
+        if output_cache_key is not None and Output_cache.restore(
+            output_cache_key, self.output_dir / output_filename
+        ):
+            log.info('Output cache hit, skip encoding: "{}"', output_filename)
+            if self.journal is not None:
+                self.journal.set_end(
+                    self, is_done=True, output_path=self.output_dir / output_filename
+                )
+            terminal_progress.clear()
+            return True
+
+        if self.journal is not None:
+            self.journal.set_running(
+                self,
+                self.output_dir / temp_name,
+                [
+                    str(self.output_dir.resolve() / (escape(_prefix) + "*"))
+                    for _prefix in (
+                        f"wait_subset_{temp_name}",
+                        f"subset_temp_{temp_name}",
+                        f"flac_temp_{_ff_log_sign}",
+                    )
+                ]
+                + [
+                    str(Path.cwd() / (escape(_log_prefix.name) + ".*"))
+                    for _log_prefix in (
+                        ff_progress_log_file.with_suffix(""),
+                        ff_report_log_file.with_suffix(""),
+                        ff_quality_log_prefix,
+                    )
+                ],
+            )
         run_start_time = datetime.now()
         run_sign = (
             f" Sub Ripper {sub_ripper_num}"
@@ -1082,7 +1655,7 @@ class Ripper:
         )
 
         # 先删除，防止直接读到结束标志
-        FF_PROGRESS_LOG_FILE.unlink(missing_ok=True)
+        ff_progress_log_file.unlink(missing_ok=True)
 
         self._progress["frame_count"] = 0
         self._progress["duration"] = 0
@@ -1090,81 +1663,56 @@ class Ripper:
             self._progress["frame_count"] = self.media_info.nb_frames
             self._progress["duration"] = self.media_info.duration
 
+        main_progress_reader = Progress_reader(
+            ff_progress_log_file,
+            frame_count=self._progress["frame_count"],
+            duration=self._progress["duration"],
+        )
+        # 执行命令组时替换为合并的读取器
+        progress_reader: Progress_reader | Progress_reader_group = main_progress_reader
+        progress_reader_lock = Lock()
+        """替换和关闭读取器时持有，防止刷新线程读取已关闭的文件"""
         refresh_progress_continue: bool = True
 
         def refresh_progress(sleep_sec: float) -> None:
             while refresh_progress_continue:
                 sleep(sleep_sec)
 
-                try:
-                    with FF_PROGRESS_LOG_FILE.open("rt", encoding="utf-8") as file:
-                        file.seek(0, 2)  # 将文件指针移动到文件末尾
-                        total_size = file.tell()  # 获取文件的总大小
-                        buffer = []
-                        while len(buffer) < 12:
-                            # 每次向前移动400字节
-                            step = min(400, total_size)
-                            total_size -= step
-                            file.seek(total_size)
-                            # 读取当前块的内容
-                            lines = file.readlines()
-                            # 将读取到的行添加到缓冲区
-                            buffer = lines + buffer
-                            # 如果已经到达文件开头，退出循环
-                            if total_size == 0:
-                                break
-                except FileNotFoundError:
-                    continue
-                except Exception as e:
-                    log.error(e)
-                    continue
+                with progress_reader_lock:
+                    try:
+                        if not progress_reader.read():
+                            continue
+                    except Exception as e:
+                        log.error(e)
+                        continue
 
-                res = dict(line.strip().split("=", maxsplit=1) for line in buffer[-12:])
+                    self._progress["frame"] = progress_reader.frame
+                    self._progress["fps"] = progress_reader.fps
+                    self._progress["out_time_us"] = progress_reader.out_time_us
+                    self._progress["speed"] = progress_reader.speed
+                    self._progress["eta"] = progress_reader.eta
+                    percent = progress_reader.percent
 
-                if p := res.get("progress"):
-                    out_time_us = res.get("out_time_us", -1)
-                    speed = res.get("speed", "-1").rstrip("x")
+                if is_side_stage:
+                    continue
 
-                    self._progress["frame"] = int(res.get("frame", -1))
-                    self._progress["fps"] = float(res.get("fps", -1))
-                    self._progress["out_time_us"] = (
-                        int(out_time_us) if out_time_us != "N/A" else 0
-                    )
-                    self._progress["speed"] = float(speed) if speed != "N/A" else 0
-
-                    if easyrip_web.http_server.Event.is_run_command:
-                        easyrip_web.http_server.Event.progress.append(self._progress)
-                        easyrip_web.http_server.Event.progress.popleft()
-
-                    if self.media_info.nb_frames and self._progress["frame"] != -1:
-                        terminal_progress.set(
-                            round(
-                                100
-                                * self._progress["frame"]
-                                / self.media_info.nb_frames
-                            )
-                        )
-                    elif self.media_info.duration > 0 and self._progress["out_time_us"]:
-                        terminal_progress.set(
-                            round(
-                                self._progress["out_time_us"]
-                                / self.media_info.duration
-                                / 10_000
-                            )
-                        )
-                    else:
-                        log.debug(
-                            "Can not get progress: {} {}",
-                            self.media_info,
-                            self._progress,
-                            print_level=log.LogLevel._detail,
-                        )
+                if easyrip_web.http_server.Event.is_run_command:
+                    easyrip_web.http_server.Event.progress.append(self._progress)
+                    easyrip_web.http_server.Event.progress.popleft()
 
-                    if p != "continue":
-                        break
+                if percent != -1:
+                    terminal_progress.set(round(percent))
+                else:
+                    log.debug(
+                        "Can not get progress: {} {}",
+                        self.media_info,
+                        self._progress,
+                        print_level=log.LogLevel._detail,
+                    )
 
-            easyrip_web.http_server.Event.progress.append({})
-            easyrip_web.http_server.Event.progress.popleft()
+            if not is_side_stage:
+                easyrip_web.http_server.Event.progress.append({})
+                easyrip_web.http_server.Event.progress.popleft()
 
         _refresh_progress_thread = Thread(
             target=refresh_progress,
@@ -1178,85 +1726,271 @@ class Ripper:
         )
         _refresh_progress_thread.start()
 
-        if self.preset_name is not Ripper.Preset_name.custom:
-            os.environ["FFREPORT"] = f"file={FF_REPORT_LOG_FILE}:level=31"
+        # 只对当前 Ripper 的子进程设置 FFREPORT，不修改全局环境变量
+        cmd_env: dict[str, str] | None = (
+            None
+            if self.preset_name is Ripper.Preset_name.custom
+            else os.environ | {"FFREPORT": f"file={ff_report_log_file}:level=31"}
+        )
+
+        # 直接执行 argv，不再经过 shell
+        process_option = Process_option.from_option_map(self.option_map)
+        process_usage_list: list[Process_usage] = []
+
+        # 后处理中只依赖输入的阶段与主命令并行执行，只有最终的合成需要等待
+        #   主命令 ─────┬─> FLAC Mux ─> Soft Sub Mux ─> 画质检测
+        #   FLAC Enc ───┘                 │
+        #   Subset ───────────────────────┘
+        side_stage_executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="Ripper_side_stage"
+        )
+
+        flac_stage: Future[bool] | None = None
+        _flac_fullname: Path | None = None
+        if (
+            self.preset_name != Ripper.Preset_name.flac
+            and self.option.audio_encoder == Ripper.Audio_codec.flac
+        ):
+            _flac_basename = f"flac_temp_{_ff_log_sign}"
+            _flac_fullname = Path(_flac_basename + ".flac.mkv")
+            _flac_ripper = Ripper(
+                [self.input_path_list[0]],
+                [_flac_basename],
+                self.output_dir,
+                Ripper.Preset_name.flac,
+                {
+                    k: v
+                    for k, v in (
+                        self.option_map
+                        | {
+                            "_sub_ripper_num": str(
+                                int(self.option_map.get("_sub_ripper_num", 0)) + 1
+                            ),
+                            "_sub_ripper_title": "FLAC Enc",
+                            "_side_stage": "1",
+                            "muxer": "mkv",
+                        }
+                    ).items()
+                    if k not in {"soft-sub", "sub", "translate-sub"}
+                },
+            )
+            flac_stage = side_stage_executor.submit(_flac_ripper.run)
+
+        subset_stage: Future[bool] | None = None
+        subset_folder: Path | None = None
+        if soft_sub := self.option_map.get("soft-sub"):
+            # 处理 soft-sub
+            soft_sub_list: list[Path]
+            soft_sub_map_list: list[str] = soft_sub.split(":")
+
+            if soft_sub_map_list[0] == "auto":
+                soft_sub_list = []
+
+                _input_prefix: str = self.input_path_list[0].name.split(".")[0]
+
+                for _path in self.output_dir.iterdir():
+                    if (
+                        _path.suffix in SUBTITLE_SUFFIX_SET
+                        and _path.stem.startswith(_input_prefix)
+                        and (
+                            len(soft_sub_map_list) == 1
+                            or Path(_path.stem).suffix.lstrip(".")
+                            in soft_sub_map_list[1:]
+                        )
+                    ):
+                        soft_sub_list.append(_path)
+
+            else:
+                soft_sub_list = [Path(s) for s in soft_sub.split("?")]
+
+            subset_folder = self.output_dir / f"subset_temp_{temp_name}"
+            if not soft_sub_list:
+                log.warning("-soft-sub is empty")
+            log.info("-soft-sub list = {}", soft_sub_list)
+
+            # 子集化
+            subset_stage = side_stage_executor.submit(
+                Ripper(
+                    soft_sub_list,
+                    (subset_folder.name,),
+                    self.output_dir,
+                    Ripper.Preset_name.subset,
+                    {
+                        k: v
+                        for k, v in self.option_map.items()
+                        if k not in {"muxer", "soft-sub"}
+                    }
+                    | {"_side_stage": "1"},
+                ).run
+            )
+
+        side_stage_executor.shutdown(wait=False)
 
         log.info(
             "Run the following commands in order:\n{}",
             textwrap.indent(
-                "\n".join(f"{i}. {s}" for i, s in enumerate(cmd_list, 1)), prefix="  "
+                "\n".join(f"{i}. {_cmd_to_str(s)}" for i, s in enumerate(cmd_list, 1)),
+                prefix="  ",
             ),
         )
+
+        # 命令组中的每个命令使用独立的进度文件和报告文件
+        ff_report_log_file_list: list[Path] = [ff_report_log_file]
+        ff_group_progress_log_file_list: list[Path] = []
+        group_speed: str = "N/A"
+
+        def _run_cmd_group(cmd_group: tuple[str, ...]) -> int:
+            nonlocal progress_reader, group_speed
+
+            _log_file_list = [
+                (
+                    ff_progress_log_file.with_suffix(f".{j}.log"),
+                    ff_report_log_file.with_suffix(f".{j}.log"),
+                )
+                for j in range(len(cmd_group))
+            ]
+            for _progress_file, _report_file in _log_file_list:
+                _progress_file.unlink(missing_ok=True)
+                ff_group_progress_log_file_list.append(_progress_file)
+                ff_report_log_file_list.append(_report_file)
+
+            _is_chunk: bool = isinstance(cmd_group, Chunk_cmd_group)
+            _group_reader = Progress_reader_group(
+                [
+                    Progress_reader(
+                        _progress_file,
+                        frame_count=self._progress["frame_count"],
+                        duration=self._progress["duration"],
+                    )
+                    for _progress_file, _ in _log_file_list
+                ],
+                is_chunk=_is_chunk,
+            )
+            with progress_reader_lock:
+                progress_reader = _group_reader
+
+            def _call(j: int) -> int:
+                return run_cmd(
+                    cmd_group[j],
+                    env=None
+                    if cmd_env is None
+                    else cmd_env
+                    | {"FFREPORT": f"file={_log_file_list[j][1]}:level=31"},
+                    option=process_option,
+                    usage_list=process_usage_list,
+                )
+
+            try:
+                # 未指定 -parallel-jobs 时，所有分段同时编码
+                with ThreadPoolExecutor(
+                    max_workers=min(
+                        len(cmd_group)
+                        if _is_chunk and self.option_map.get("parallel-jobs") is None
+                        else parallel_jobs,
+                        len(cmd_group),
+                    )
+                ) as executor:
+                    return next(
+                        (
+                            _res
+                            for _res in executor.map(_call, range(len(cmd_group)))
+                            if _res != 0
+                        ),
+                        0,
+                    )
+            finally:
+                with progress_reader_lock:
+                    progress_reader = main_progress_reader
+                    try:
+                        _group_reader.read()
+                    except Exception as e:
+                        log.error(e)
+                    if (_speed := _group_reader.speed_str) != "N/A":
+                        group_speed = _speed
+                    _group_reader.close()
+
+        parallel_jobs: int = max(1, (os.cpu_count() or 1) // 8)
+        if (_parallel_jobs := self.option_map.get("parallel-jobs")) is not None:
+            try:
+                parallel_jobs = max(1, int(_parallel_jobs))
+            except ValueError:
+                log.error("{} param illegal", f"-parallel-jobs {_parallel_jobs}")
+
         is_cmd_run_failed: bool = False
         for i, cmd in enumerate(cmd_list, 1):
             _cmd_num = f"{i}{'' if sub_ripper_num is None else f' (Sub Ripper {sub_ripper_num} - {sub_ripper_title})'}"
             log.info("Run the command {}", _cmd_num)
             log.debug(
                 "Run the command {}",
-                f"{_cmd_num}:\n  {cmd}",
+                f"{_cmd_num}:\n  {_cmd_to_str(cmd)}",
             )
-            if (_cmd_res := subprocess.call(cmd, shell=True)) != 0:
+            _usage_start = len(process_usage_list)
+            _cmd_res = (
+                run_cmd(
+                    cmd,
+                    env=cmd_env,
+                    option=process_option,
+                    usage_list=process_usage_list,
+                )
+                if isinstance(cmd, str)
+                else _run_cmd_group(cmd)
+            )
+            if _usage_list := process_usage_list[_usage_start:]:
+                log.debug(
+                    "Resource usage of the command {}: {}",
+                    _cmd_num,
+                    "".join(f"\n  {usage}" for usage in _usage_list),
+                )
+            if _cmd_res != 0:
                 is_cmd_run_failed = True
                 log.error(
                     "Command run failed: status code {}\n  Failed command: {}",
                     _cmd_res,
-                    f"{i}. {cmd}",
+                    f"{i}. {_cmd_to_str(cmd)}",
                 )
-                terminal_progress.error()
+                if not is_side_stage:
+                    terminal_progress.error()
                 break
 
         refresh_progress_continue = False
+        _refresh_progress_thread.join()
 
         # 读取编码速度
-        speed: str = "N/A"
-        if FF_PROGRESS_LOG_FILE.is_file():
-            with FF_PROGRESS_LOG_FILE.open("rt", encoding="utf-8") as file:
-                for line in file.readlines()[::-1]:
-                    if res := re.search(r"speed=(.*)", line):
-                        speed = res.group(1)
-                        break
+        try:
+            main_progress_reader.read()
+        except Exception as e:
+            log.error(e)
+        speed: str = main_progress_reader.speed_str
+        if speed == "N/A":
+            speed = group_speed
+        main_progress_reader.close()
 
         log.write_html_log(
             f'{gettext("Encoding speed")}: <span style="color:darkcyan;">{speed}</span><br>'
         )
 
         # 获取 ffmpeg report 中的报错
-        if FF_REPORT_LOG_FILE.is_file():
-            with FF_REPORT_LOG_FILE.open("rt", encoding="utf-8") as file:
-                for line in file.readlines()[2:]:
-                    log.warning("FFmpeg report: {}", line)
+        for _report_file in ff_report_log_file_list:
+            if _report_file.is_file():
+                with _report_file.open("rt", encoding="utf-8") as file:
+                    for line in file.readlines()[2:]:
+                        log.warning("FFmpeg report: {}", line)
+
+        # 等待并行的阶段结束
+        is_flac_stage_ok: bool = flac_stage is not None and flac_stage.result()
+        is_subset_stage_ok: bool = subset_stage is not None and subset_stage.result()
+
+        # 主命令、并行阶段、合成和重命名都成功时，才能缓存输出和标记为完成
+        is_run_ok: bool = not is_cmd_run_failed
 
         if is_cmd_run_failed:
             log.error("There have error in running")
         else:  # 多文件合成 or 后处理
             # flac 音频轨合成
-            if (
-                self.preset_name != Ripper.Preset_name.flac
-                and self.option.audio_encoder == Ripper.Audio_codec.flac
-            ):
-                _flac_basename = f"flac_temp_{get_base62_time()}"
-                _flac_fullname = Path(_flac_basename + ".flac.mkv")
-                _flac_ripper = Ripper(
-                    [self.input_path_list[0]],
-                    [_flac_basename],
-                    self.output_dir,
-                    Ripper.Preset_name.flac,
-                    {
-                        k: v
-                        for k, v in (
-                            self.option_map
-                            | {
-                                "_sub_ripper_num": str(
-                                    int(self.option_map.get("_sub_ripper_num", 0)) + 1
-                                ),
-                                "_sub_ripper_title": "FLAC Enc",
-                                "muxer": "mkv",
-                            }
-                        ).items()
-                        if k not in {"soft-sub", "sub", "translate-sub"}
-                    },
-                )
-                _flac_ripper.run()
+            if flac_stage is not None and _flac_fullname is not None:
+                if not is_flac_stage_ok:
+                    is_run_ok = False
+                    log.error("Run {} failed", "FLAC Enc")
 
                 _mux_temp_name: Path
                 _mux_cmd: str
@@ -1268,7 +2002,8 @@ class Ripper:
                 _mux_cmd = f'mkvmerge -o "{_mux_temp_name}" --no-audio "{temp_name}" --no-video "{_flac_fullname}"'
 
                 log.info(_mux_cmd)
-                if subprocess.call(_mux_cmd, shell=True):
+                if run_cmd(_mux_cmd, option=process_option):
+                    is_run_ok = False
                     log.error("There have error in running")
                 else:
                     Path(temp_name).unlink()
@@ -1296,55 +2031,13 @@ class Ripper:
                             if v
                         },
                     )
-                    mux_ripper.run()
+                    if not mux_ripper.run():
+                        is_run_ok = False
                 (_mux_temp_name.unlink())
 
-                if _flac_fullname.exists():
-                    _flac_fullname.unlink()
-
             # 内封字幕合成
-            if soft_sub := self.option_map.get("soft-sub"):
-                # 处理 soft-sub
-                soft_sub_list: list[Path]
-                soft_sub_map_list: list[str] = soft_sub.split(":")
-
-                if soft_sub_map_list[0] == "auto":
-                    soft_sub_list = []
-
-                    _input_prefix: str = self.input_path_list[0].name.split(".")[0]
-
-                    for _path in self.output_dir.iterdir():
-                        if (
-                            _path.suffix in SUBTITLE_SUFFIX_SET
-                            and _path.stem.startswith(_input_prefix)
-                            and (
-                                len(soft_sub_map_list) == 1
-                                or Path(_path.stem).suffix.lstrip(".")
-                                in soft_sub_map_list[1:]
-                            )
-                        ):
-                            soft_sub_list.append(_path)
-
-                else:
-                    soft_sub_list = [Path(s) for s in soft_sub.split("?")]
-
-                subset_folder = self.output_dir / f"subset_temp_{temp_name}"
-                if not soft_sub_list:
-                    log.warning("-soft-sub is empty")
-                log.info("-soft-sub list = {}", soft_sub_list)
-
-                # 子集化
-                if Ripper(
-                    soft_sub_list,
-                    (subset_folder.name,),
-                    self.output_dir,
-                    Ripper.Preset_name.subset,
-                    {
-                        k: v
-                        for k, v in self.option_map.items()
-                        if k not in {"muxer", "soft-sub"}
-                    },
-                ).run():
+            if subset_stage is not None and subset_folder is not None:
+                if is_subset_stage_ok:
                     # 合成 MKV
                     org_full_name: Path = self.output_dir / temp_name
                     new_full_name: Path = self.output_dir / f"wait_subset_{temp_name}"
@@ -1374,123 +2067,134 @@ class Ripper:
                             ).items()
                             if v
                         },
-                    ).run() and (new_full_name.exists()):
-                        new_full_name.unlink()
+                    ).run():
+                        if new_full_name.exists():
+                            new_full_name.unlink()
+                    else:
+                        is_run_ok = False
                 else:
+                    is_run_ok = False
                     log.error("Subset failed, cancel mux")
 
-                # 清理临时文件
-                shutil.rmtree(subset_folder)
-
             # 画质检测
-            if quality_detection := self.option_map.get("quality-detection"):
-                quality_detection = quality_detection.split(":")
-                quality_detection_th: float
-                quality_detection_filter: str
-                while True:
-                    match quality_detection[0]:
-                        case "ssim":
-                            quality_detection_th = 0.85
-                            quality_detection_filter = "ssim=f="
-
-                            def quality_detection_cmp(
-                                text: str,
-                            ) -> list[tuple[str | int, float]]:
-                                return [
-                                    (n, q)
-                                    for line in text.splitlines()
-                                    if (
-                                        v := [
-                                            s.split(":")[1] for s in line.split()[:-1]
-                                        ]
-                                    )
-                                    and (q := float(v[-1]))
-                                    and (n := int(v[0]) - 1)
-                                ]
-
-                            break
-                        case "psnr":
-                            quality_detection_th = 30
-                            quality_detection_filter = "psnr=f="
-
-                            def quality_detection_cmp(
-                                text: str,
-                            ) -> list[tuple[str | int, float]]:
-                                return [
-                                    (n, q)
-                                    for line in text.splitlines()
-                                    if (v := [s.split(":")[1] for s in line.split()])
-                                    and (q := float(v[-4]))
-                                    and (n := int(v[0]) - 1)
-                                ]
-
-                            break
-                        case "vmaf":
-                            quality_detection_th = 80
-                            quality_detection_filter = "libvmaf=log_fmt=csv:log_path="
-
-                            def quality_detection_cmp(
-                                text: str,
-                            ) -> list[tuple[str | int, float]]:
-                                return [
-                                    (n, q)
-                                    for v in tuple(csv.reader(text.splitlines()[1:]))
-                                    if (q := float(v[-2])) and (n := v[0])
-                                ]
-
-                            break
-                        case _:
-                            log.error(
-                                "Param error from '{}': {}",
-                                "-quality-detection",
-                                f"{quality_detection[0]} -> ssim",
-                            )
-                            quality_detection[0] = "ssim"
+            if (
+                quality_detection := Quality_detection.from_option_map(self.option_map)
+            ) is not None:
+                log.debug(
+                    "'{}' start: {}",
+                    "-quality-detection",
+                    f"{quality_detection.metric.value}:{quality_detection.threshold} {quality_detection.mode.value}",
+                )
 
-                if len(quality_detection) > 1:
-                    try:
-                        quality_detection_th = float(quality_detection[1])
-                    except ValueError as e:
-                        log.error("Param error from '{}': {}", "-quality-detection", e)
+                # (数据文件, 起始帧序号)
+                quality_log_list: list[tuple[Path, int]] = [
+                    (Path(f"{ff_quality_log_prefix}.{j}.log"), offset)
+                    for j, offset in enumerate(self.option.quality_log_offset_list)
+                ]
+                is_quality_detection_ok: bool = True
+
+                # 没有在编码时同步检测，需要再次解码比较
+                if not quality_log_list:
+                    _sample_start_list: list[float] = (
+                        get_sample_window_list(
+                            self.media_info.duration,
+                            quality_detection.sample_count,
+                            quality_detection.sample_sec,
+                        )
+                        if quality_detection.mode == Quality_detection_mode.sample
+                        and self.input_path_list[0].suffix != ".vpy"
+                        else []
+                    )
+                    _fps: float = (
+                        self.media_info.r_frame_rate[0]
+                        / self.media_info.r_frame_rate[1]
+                        if _sample_start_list and self.media_info.r_frame_rate[1]
+                        else 0
+                    )
+                    # 两个输入使用相同的定位，使比较的帧对齐
+                    _seek_list: list[tuple[str, int]] = [
+                        (
+                            f"-ss {_start:.6f} -t {quality_detection.sample_sec} ",
+                            round(_start * _fps),
+                        )
+                        for _start in _sample_start_list
+                    ] or [("", 0)]
+
+                    quality_cmd_list: list[str] = []
+                    for j, (_seek, _offset) in enumerate(_seek_list):
+                        _quality_log = Path(f"{ff_quality_log_prefix}.{j}.log")
+                        quality_log_list.append((_quality_log, _offset))
+                        quality_cmd_list.append(
+                            f'ffmpeg {"-hide_banner -v error " if _sample_start_list else ""}{_seek}-i "{self.input_path_list[0]}" {_seek}-i "{self.output_dir / temp_name}" -lavfi "{quality_detection.metric.get_filter(str(_quality_log))}" -f null -'
+                        )
 
-                quality_detection_data_file: Path = (
-                    self.output_dir / "quality_detection_data.log"
-                )
-                quality_detection_data_file_filter_str: str = (
-                    str(quality_detection_data_file)
-                    .replace("\\", "/")
-                    .replace(":", "\\\\:")
-                )
+                    # 各片段相互独立，并行比较
+                    with ThreadPoolExecutor(
+                        max_workers=min(len(quality_cmd_list), os.cpu_count() or 1),
+                        thread_name_prefix="Ripper_quality_detection",
+                    ) as quality_executor:
+                        is_quality_detection_ok = not any(
+                            quality_executor.map(
+                                lambda cmd: run_cmd(cmd, option=process_option),
+                                quality_cmd_list,
+                            )
+                        )
 
-                if subprocess.call(
-                    f'ffmpeg -i "{self.input_path_list[0]}" -i "{self.output_dir / temp_name}" -lavfi "{quality_detection_filter}{quality_detection_data_file_filter_str}" -f null -',
-                    shell=True,
-                ):
+                if not is_quality_detection_ok:
                     log.error("Run {} failed", "-quality-detection")
                 else:
-                    log.debug(
-                        "'{}' start: {}",
-                        "-quality-detection",
-                        f"{quality_detection[0]}:{quality_detection_th}",
+                    quality_stats = Quality_stats(
+                        quality_detection.metric, quality_detection.threshold
                     )
-                    with quality_detection_data_file.open("rt", encoding="utf-8") as f:
-                        _res = quality_detection_cmp(f.read())
-                        for n, q in _res:
-                            if q < quality_detection_th:
-                                log.error(
-                                    "{} {} < threshold {} in frame {}",
-                                    quality_detection[0].upper(),
-                                    q,
-                                    quality_detection_th,
-                                    n,
-                                )
+                    for _quality_log, _offset in quality_log_list:
+                        try:
+                            quality_stats.add_log(_quality_log, _offset)
+                        except (OSError, ValueError) as e:
+                            log.error(e)
+
+                    metric_name = quality_detection.metric.value.upper()
+                    if quality_stats.bad_range_list:
+                        # 只列出前几个区间，完整的列表在 JSON 中
+                        log.error(
+                            "{} < threshold {} in {} frames: {}",
+                            metric_name,
+                            quality_detection.threshold,
+                            quality_stats.bad_frame_count,
+                            ", ".join(
+                                str(start) if start == end else f"{start}-{end}"
+                                for start, end in quality_stats.bad_range_list[:10]
+                            )
+                            + (
+                                ", ..."
+                                if len(quality_stats.bad_range_list) > 10
+                                else ""
+                            ),
+                        )
+                    if quality_stats.count:
+                        p1, p5 = quality_stats.get_low(1, 5)
                         log.info(
-                            "{} min = {}",
-                            quality_detection[0].upper(),
-                            min(map(itemgetter(1), _res)),
+                            "{} min = {}, mean = {}, 1% low = {}, 5% low = {}",
+                            metric_name,
+                            quality_stats.min,
+                            round(quality_stats.mean, 6),
+                            p1,
+                            p5,
                         )
+                        try:
+                            quality_stats.write_json(
+                                self.output_dir / f"{output_filename}.quality.json"
+                            )
+                        except OSError as e:
+                            log.error(e)
                     log.debug("'{}' end", "-quality-detection")
-                quality_detection_data_file.unlink(missing_ok=True)
+
+        # 清理并行阶段的临时文件
+        if _flac_fullname is not None and _flac_fullname.exists():
+            _flac_fullname.unlink()
+        if subset_folder is not None and subset_folder.exists():
+            shutil.rmtree(subset_folder)
+        for _quality_log in Path().glob(f"{ff_quality_log_prefix}.*.log"):
+            _quality_log.unlink(missing_ok=True)
 
         # 获取体积
         temp_name_full = self.output_dir / temp_name
@@ -1500,10 +2204,22 @@ class Ripper:
         try:
             temp_name_full.rename(self.output_dir / output_filename)
         except FileExistsError as e:
+            is_run_ok = False
             log.error(e)
         except Exception as e:
+            is_run_ok = False
             log.error(e)
 
+        if output_cache_key is not None and is_run_ok:
+            Output_cache.set(output_cache_key, self.output_dir / output_filename)
+
+        if self.journal is not None:
+            self.journal.set_end(
+                self,
+                is_done=is_run_ok,
+                output_path=self.output_dir / output_filename,
+            )
+
         # 写入日志
         run_end_time = datetime.now()
         log.write_html_log(
@@ -1515,12 +2231,14 @@ class Ripper:
         )
 
         # 删除临时文件
-        FF_PROGRESS_LOG_FILE.unlink(missing_ok=True)
-        FF_REPORT_LOG_FILE.unlink(missing_ok=True)
-
-        # 删除临时环境变量
-        os.environ.pop("FFREPORT", None)
+        for _log_file in (
+            ff_progress_log_file,
+            *ff_group_progress_log_file_list,
+            *ff_report_log_file_list,
+        ):
+            _log_file.unlink(missing_ok=True)
 
-        terminal_progress.clear()
+        if not is_side_stage:
+            terminal_progress.clear()
 
-        return True
+        return is_run_ok
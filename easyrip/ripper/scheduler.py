@@ -0,0 +1,346 @@
+import ctypes
+import os
+import sys
+import threading
+from collections.abc import Callable, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from time import sleep
+from typing import TYPE_CHECKING, Final, final
+
+from ..easyrip_config.config import CONFIG_DEFAULT_DICT, config
+from ..easyrip_config.config_key import Config_key
+from ..easyrip_log import log
+from .param import Preset_name
+
+if TYPE_CHECKING:
+    from .ripper import Ripper
+
+
+@final
+@dataclass(slots=True, frozen=True)
+class Job_cost:
+    cpu_slots: int
+    """占用的逻辑核心数"""
+    memory_mb: int
+    """占用的内存 MiB"""
+
+
+_DEFAULT_JOB_COST: Final[dict[str, Job_cost]] = {
+    "custom": Job_cost(4, 1024),
+    "subset": Job_cost(1, 512),
+    "flac": Job_cost(4, 512),
+    "copy": Job_cost(1, 256),
+    "x264": Job_cost(8, 1024),
+    "x265": Job_cost(16, 3072),
+    "svtav1": Job_cost(16, 4096),
+    "vvenc": Job_cost(16, 4096),
+    "ffv1": Job_cost(4, 1024),
+    "hw": Job_cost(2, 1024),
+}
+"""preset 族的默认开销，以 1080p 为基准"""
+
+_VIDEO_FAMILY_SET: Final[frozenset[str]] = frozenset(
+    {"x264", "x265", "svtav1", "vvenc", "ffv1", "hw"}
+)
+
+
+def get_preset_family(preset_name: Preset_name) -> str:
+    """获取 preset 所属的族，例如 x265slow -> x265, hevc_nvenc -> hw"""
+    name = preset_name.value
+    if name.endswith(("_amf", "_nvenc", "_qsv")):
+        return "hw"
+    for family in ("x264", "x265"):
+        if name.startswith(family):
+            return family
+    return name
+
+
+def get_ripper_cost(ripper: "Ripper") -> Job_cost:
+    """
+    获取 Ripper 的开销
+
+    依次查找配置中的 preset 名、preset 族，最后使用默认值，配置的值非法时跳过
+    视频族的内存开销按分辨率相对 1080p 放大，分段编码时按同时编码的段数放大
+    """
+    preset_name = ripper.option.preset_name
+    family = get_preset_family(preset_name)
+
+    cost = _DEFAULT_JOB_COST.get(family, _DEFAULT_JOB_COST["custom"])
+
+    cost_map = config.get_user_profile(
+        Config_key.scheduler_job_cost,
+        CONFIG_DEFAULT_DICT[Config_key.scheduler_job_cost],
+    )
+    for key in (preset_name.value, family):
+        if not isinstance(cost_map, dict) or (val := cost_map.get(key)) is None:
+            continue
+        # [CPU 槽位, 内存 MiB]
+        if (
+            isinstance(val, list)
+            and len(val) == 2
+            and all(type(v) is int and v >= 0 for v in val)
+        ):
+            cost = Job_cost(val[0], val[1])
+            break
+        log.error(
+            "The config '{}' has an illegal value for '{}': {}",
+            Config_key.scheduler_job_cost.name,
+            key,
+            val,
+        )
+    else:
+        if family in _VIDEO_FAMILY_SET and (
+            (pixels := ripper.media_info.width * ripper.media_info.height) > 1920 * 1080
+        ):
+            cost = Job_cost(
+                cost.cpu_slots,
+                round(cost.memory_mb * pixels / (1920 * 1080)),
+            )
+
+    # 分段编码时同时运行多个编码器
+    if family in _VIDEO_FAMILY_SET:
+        try:
+            chunk_num = int(ripper.option_map.get("chunk") or 0)
+            parallel_jobs = int(ripper.option_map.get("parallel-jobs") or chunk_num)
+        except ValueError:
+            chunk_num = parallel_jobs = 0
+        if chunk_num > 1:
+            parallel_jobs = max(1, min(parallel_jobs, chunk_num))
+            cost = Job_cost(
+                cost.cpu_slots * parallel_jobs, cost.memory_mb * parallel_jobs
+            )
+
+    return cost
+
+
+def get_total_memory_mb() -> int:
+    """获取物理内存总量 MiB，获取失败时返回 0"""
+    try:
+        if sys.platform == "win32":
+
+            class MEMORYSTATUSEX(ctypes.Structure):
+                _fields_ = (
+                    ("dwLength", ctypes.c_ulong),
+                    ("dwMemoryLoad", ctypes.c_ulong),
+                    ("ullTotalPhys", ctypes.c_ulonglong),
+                    ("ullAvailPhys", ctypes.c_ulonglong),
+                    ("ullTotalPageFile", ctypes.c_ulonglong),
+                    ("ullAvailPageFile", ctypes.c_ulonglong),
+                    ("ullTotalVirtual", ctypes.c_ulonglong),
+                    ("ullAvailVirtual", ctypes.c_ulonglong),
+                    ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+                )
+
+            status = MEMORYSTATUSEX()
+            status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+            if not ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+                return 0
+            return status.ullTotalPhys // 2**20
+
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2**20
+
+    except (AttributeError, ValueError, OSError):
+        return 0
+
+
+@final
+class Scheduler:
+    """
+    按 CPU 槽位和内存预算调度任务
+
+    按队列顺序准入，队首放不下时为其预留开销，只用不会推迟队首的任务回填 (EASY backfill)
+    任务没有时长估计，因此回填的任务只能使用队首启动后仍然空闲的部分，
+    即队首等待期间回填的任务的开销加上队首的开销不超过总预算，
+    此前已在运行的任务结束后队首一定能启动，不会被源源不断的小任务饿死
+    单个任务的开销超过总预算时，会被限制到总预算，即单独运行
+    """
+
+    cpu_slots: int
+    memory_mb: int
+
+    def __init__(self, cpu_slots: int = 0, memory_mb: int = 0) -> None:
+        """
+        创建调度器并设定总预算
+
+        :param cpu_slots: 为 0 时使用逻辑核心数
+        :param memory_mb: 为 0 时使用物理内存总量，获取失败时不限制内存
+        """
+        self.cpu_slots = cpu_slots if cpu_slots > 0 else (os.cpu_count() or 1)
+        self.memory_mb = memory_mb if memory_mb > 0 else get_total_memory_mb()
+
+        self._free_cpu_slots: int = self.cpu_slots
+        self._free_memory_mb: int = self.memory_mb
+        self._condition = threading.Condition()
+
+        self._backfill_cpu_slots: int = 0
+        """当前队首等待期间回填的、仍在运行的任务的开销之和"""
+        self._backfill_memory_mb: int = 0
+        self._backfill_generation: int = 0
+        """队首每次变化时递增，之前回填的任务结束时不再计入"""
+
+    @classmethod
+    def from_config(cls) -> "Scheduler":
+        return cls(
+            config.get_user_profile(
+                Config_key.scheduler_cpu_slots,
+                CONFIG_DEFAULT_DICT[Config_key.scheduler_cpu_slots],
+            ),
+            config.get_user_profile(
+                Config_key.scheduler_memory_mb,
+                CONFIG_DEFAULT_DICT[Config_key.scheduler_memory_mb],
+            ),
+        )
+
+    def _clamp(self, cost: Job_cost) -> Job_cost:
+        return Job_cost(
+            min(max(cost.cpu_slots, 0), self.cpu_slots),
+            min(max(cost.memory_mb, 0), self.memory_mb) if self.memory_mb else 0,
+        )
+
+    def _is_fit(self, cost: Job_cost) -> bool:
+        return (
+            cost.cpu_slots <= self._free_cpu_slots
+            and cost.memory_mb <= self._free_memory_mb
+        )
+
+    def _is_backfill_fit(self, head_cost: Job_cost, cost: Job_cost) -> bool:
+        """回填后队首的预留仍然满足"""
+        return (
+            self._is_fit(cost)
+            and self._backfill_cpu_slots + cost.cpu_slots + head_cost.cpu_slots
+            <= self.cpu_slots
+            and self._backfill_memory_mb + cost.memory_mb + head_cost.memory_mb
+            <= self.memory_mb
+        )
+
+    def _release(self, cost: Job_cost, backfill_generation: int | None) -> None:
+        with self._condition:
+            self._free_cpu_slots += cost.cpu_slots
+            self._free_memory_mb += cost.memory_mb
+            if backfill_generation == self._backfill_generation:
+                self._backfill_cpu_slots -= cost.cpu_slots
+                self._backfill_memory_mb -= cost.memory_mb
+            self._condition.notify_all()
+
+    def run(
+        self,
+        job_list: Sequence[tuple[Job_cost, Callable[[], object]]],
+        *,
+        start_interval_sec: float = 0.1,
+    ) -> None:
+        """
+        运行所有任务，全部结束后返回
+
+        :param start_interval_sec: 相邻两个任务的启动间隔
+        """
+        pending: list[tuple[Job_cost, Callable[[], object]]] = [
+            (self._clamp(cost), func) for cost, func in job_list
+        ]
+
+        with ThreadPoolExecutor(max_workers=max(1, len(pending))) as executor:
+            while pending:
+                admitted: tuple[Job_cost, Callable[[], object]] | None = None
+                backfill_generation: int | None = None
+                with self._condition:
+                    while admitted is None:
+                        head_cost = pending[0][0]
+                        if self._is_fit(head_cost):
+                            admitted = pending.pop(0)
+                            self._backfill_generation += 1
+                            self._backfill_cpu_slots = self._backfill_memory_mb = 0
+                            break
+                        for i, job in enumerate(pending[1:], 1):
+                            if self._is_backfill_fit(head_cost, job[0]):
+                                admitted = pending.pop(i)
+                                backfill_generation = self._backfill_generation
+                                self._backfill_cpu_slots += job[0].cpu_slots
+                                self._backfill_memory_mb += job[0].memory_mb
+                                break
+                        else:
+                            self._condition.wait(1)
+
+                    cost = admitted[0]
+                    self._free_cpu_slots -= cost.cpu_slots
+                    self._free_memory_mb -= cost.memory_mb
+
+                log.debug(
+                    "Scheduler admit job: {} (free: {} CPU slots, {} MiB, backfill: {})",
+                    cost,
+                    self._free_cpu_slots,
+                    self._free_memory_mb,
+                    backfill_generation is not None,
+                    print_level=log.LogLevel._detail,
+                )
+
+                future: Future = executor.submit(admitted[1])
+                future.add_done_callback(
+                    lambda _, cost=cost, generation=backfill_generation: self._release(
+                        cost, generation
+                    )
+                )
+
+                if pending:
+                    sleep(start_interval_sec)
+
+
+_PRESET_SPEED_FACTOR: Final[dict[str, float]] = {
+    "custom": 1,
+    "subset": 0,
+    "flac": 0.02,
+    "copy": 0.01,
+    "x264": 1,
+    "x264fast": 0.5,
+    "x264slow": 2,
+    "x265": 4,
+    "x265fast4": 1.5,
+    "x265fast3": 2,
+    "x265fast2": 2.5,
+    "x265fast": 3,
+    "x265slow": 8,
+    "x265full": 16,
+    "svtav1": 4,
+    "vvenc": 12,
+    "ffv1": 0.3,
+    "hw": 0.2,
+}
+"""preset 相对 x264 的单位像素帧耗时"""
+
+
+def estimate_ripper_workload(ripper: "Ripper") -> float:
+    """
+    估算 Ripper 的工作量，只用于相对比较
+
+    像素数 × 帧数 × preset 相对耗时，没有帧数时用时长和帧率估算
+    """
+    preset_name = ripper.option.preset_name
+    speed_factor = _PRESET_SPEED_FACTOR.get(
+        preset_name.value,
+        _PRESET_SPEED_FACTOR.get(get_preset_family(preset_name), 1),
+    )
+
+    media_info = ripper.media_info
+    frame_count: float = media_info.nb_frames
+    if not frame_count:
+        fps_num, fps_den = media_info.r_frame_rate
+        frame_count = media_info.duration * (
+            fps_num / fps_den if fps_num and fps_den else 24
+        )
+
+    return (media_info.width * media_info.height or 1) * frame_count * speed_factor
+
+
+def sort_by_workload(ripper_list: "list[Ripper]") -> None:
+    """按估算工作量从大到小排序 (最长任务优先)，使并行执行时总耗时更短"""
+    workload_map = {
+        id(ripper): estimate_ripper_workload(ripper) for ripper in ripper_list
+    }
+    ripper_list.sort(key=lambda ripper: workload_map[id(ripper)], reverse=True)
+    log.debug(
+        "Sort by workload: {}",
+        [
+            f"{ripper.input_path_list[0].name}: {workload_map[id(ripper)]:.3g}"
+            for ripper in ripper_list
+        ],
+        print_level=log.LogLevel._detail,
+    )
@@ -1,6 +1,6 @@
 from .ass import Ass
-from .font import Font
-from .subset import load_fonts, subset
+from .font import Font, load_fonts
+from .subset import subset
 
 __all__ = [
     "Ass",
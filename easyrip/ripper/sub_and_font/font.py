@@ -1,11 +1,15 @@
+import bisect
 import enum
 import itertools
 import os
-from copy import deepcopy
+import zlib
+from array import array
 from dataclasses import dataclass, field
+from io import BytesIO
 from pathlib import Path
-from typing import Final
+from typing import TYPE_CHECKING, Final, Self, final
 
+import fontTools
 from fontTools import subset
 from fontTools.ttLib import TTCollection, TTFont
 from fontTools.ttLib.tables._n_a_m_e import NameRecord, makeName, table__n_a_m_e
@@ -14,6 +18,9 @@ from fontTools.ttLib.ttFont import TTLibError
 from ...easyrip_log import log
 from ...easyrip_mlang import Mlang_exception
 
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
 
 class Font_error(Mlang_exception):
     pass
@@ -31,53 +38,115 @@ class Font_type(enum.Enum):
         return self.value < other.value  # pyright: ignore[reportOperatorIssue]
 
 
+@final
+@dataclass(slots=True, frozen=True)
+class Font_info:
+    """不打开字体即可使用的信息，保存在字体索引中"""
+
+    pathname: str
+    font_number: int = 0
+    """TTC 中的序号，其他字体为 0"""
+    familys: frozenset[str] = frozenset()
+    font_type: Font_type = Font_type.Regular
+    is_otf: bool = False
+    cmap: bytes = b""
+    """以 zlib 压缩的码点区间 [起始, 结束] 数组"""
+    has_decode_error: bool = False
+    """name 表中有无法解码的 family 或 subfamily 记录"""
+
+    @staticmethod
+    def encode_cmap(codepoint_iter: "Iterable[int]") -> bytes:
+        range_array = array("I")
+        for codepoint in sorted(codepoint_iter):
+            if range_array and codepoint == range_array[-1] + 1:
+                range_array[-1] = codepoint
+            else:
+                range_array.extend((codepoint, codepoint))
+        return zlib.compress(range_array.tobytes())
+
+    def get_missing_chars(self, chars: "Iterable[str]") -> set[str]:
+        """字体中不存在的字符"""
+        range_array = array("I")
+        range_array.frombytes(zlib.decompress(self.cmap))
+        start_list = range_array[::2]
+        return {
+            c
+            for c in set(chars)
+            if (i := bisect.bisect_right(start_list, ord(c)) - 1) < 0
+            or ord(c) > range_array[i * 2 + 1]
+        }
+
+
 @dataclass(slots=True)
 class Font:
     pathname: str
     font: TTFont
     familys: set[str] = field(default_factory=set[str])
     font_type: Font_type = Font_type.Regular
+    font_number: int = 0
+    """TTC 中的序号，其他字体为 0"""
+
+    @classmethod
+    def from_info(cls, info: Font_info, *, lazy: bool = True) -> Self:
+        return cls(
+            info.pathname,
+            open_font(info.pathname, info.font_number, lazy=lazy),
+            set(info.familys),
+            info.font_type,
+            info.font_number,
+        )
+
+    def reload(self) -> TTFont:
+        """
+        重新打开一个独立的 TTFont，不复制也不修改 self.font
+
+        文件已不存在时从 self.font 保存的数据打开
+        """
+        if Path(self.pathname).is_file():
+            return open_font(self.pathname, self.font_number)
+        with BytesIO() as buffer:
+            self.font.save(buffer)
+            return TTFont(BytesIO(buffer.getvalue()), lazy=True)
 
     def __hash__(self) -> int:
-        return hash(self.pathname)
+        return hash((self.pathname, self.font_number))
 
     def __del__(self) -> None:
         self.font.close()
 
 
-def load_fonts(
-    path: str | Path,
-    *,
-    lazy: bool = True,
-    strict: bool = False,
-) -> list[Font]:
-    """strict: Skip UnicodeDecodeError font file"""
-    if isinstance(path, str):
-        path = Path(path)
+def open_font(pathname: str, font_number: int = 0, *, lazy: bool = True) -> TTFont:
+    """font_number 只在 TTC 中生效"""
+    return TTFont(
+        file=pathname,
+        lazy=lazy,
+        fontNumber=font_number if pathname.lower().endswith(".ttc") else -1,
+    )
 
-    res_font_list: Final[list[Font]] = []
 
-    for file in path.iterdir() if path.is_dir() else (path,):
-        if not (
-            file.is_file()
-            and (suffix := file.suffix.lower()) in {".ttf", ".otf", ".ttc"}
-        ):
-            continue
+def read_font_info(file: Path) -> list[Font_info]:
+    """解析字体文件中每个字体的 name 表和 cmap，无法使用的字体记录日志并跳过"""
+    res_info_list: Final[list[Font_info]] = []
 
-        try:
-            for font in (
-                list[TTFont](TTCollection(file=file, lazy=lazy))
-                if suffix == ".ttc"
-                else [TTFont(file=file, lazy=lazy)]
+    try:
+        is_ttc: bool = file.suffix.lower() == ".ttc"
+        # TTC 中的字体共用同一个文件，只在最后关闭
+        with (
+            TTCollection(file=file, lazy=True)
+            if is_ttc
+            else TTFont(file=file, lazy=True)
+        ) as font_or_ttc:
+            for font_number, font in enumerate(
+                list[TTFont](font_or_ttc) if is_ttc else [font_or_ttc]
             ):
-                skip_this_font: bool = False
                 table_name: table__n_a_m_e | None = font.get("name")
 
                 if table_name is None:
                     log.warning(f"No 'name' table found in font {file}")
                     continue
 
-                res_font = Font(str(file), font)
+                familys: set[str] = set()
+                has_decode_error: bool = False
                 is_regular: bool = False
                 is_bold: bool = False
                 is_italic: bool = False
@@ -91,17 +160,16 @@ def load_fonts(
                     try:
                         name_str: str = record.toUnicode()
                     except UnicodeDecodeError as e:
-                        error_text = f"Unicode decode error in font \"{file}\": {e}: '{record.toUnicode('replace')}'. Skip this {'font' if strict else 'name record'}."
-                        if strict:
-                            log.error(error_text, is_format=False)
-                            skip_this_font = True
-                            break
-                        log.warning(error_text, is_format=False)
+                        log.warning(
+                            f"Unicode decode error in font \"{file}\": {e}: '{record.toUnicode('replace')}'. Skip this name record.",
+                            is_format=False,
+                        )
+                        has_decode_error = True
                         continue
 
                     match name_id:
                         case 1:  # Font Family Name
-                            res_font.familys.add(name_str)
+                            familys.add(name_str)
 
                         case 2:  # Font Subfamily Name
                             if record.langID not in {0, 1033}:
@@ -115,13 +183,11 @@ def load_fonts(
                                     case "italic" | "oblique":
                                         is_italic = True
 
-                if skip_this_font:
-                    continue
-
-                if not res_font.familys:
+                if not familys:
                     log.warning(f"Font {file} has no family names. Skip this font")
                     continue
 
+                font_type: Font_type
                 if is_regular:
                     if is_bold or is_italic:
                         log.error(
@@ -131,115 +197,215 @@ def load_fonts(
                             is_italic,
                         )
                         continue
-                    res_font.font_type = Font_type.Regular
+                    font_type = Font_type.Regular
 
                 elif is_bold or is_italic:
-                    res_font.font_type = Font_type((is_bold, is_italic))
+                    font_type = Font_type((is_bold, is_italic))
 
                 else:
-                    res_font.font_type = Font_type.Regular
+                    font_type = Font_type.Regular
                     log.warning(
                         f'Font "{file}" does not have an English subfamily name. Defaulting to Regular'
                     )
 
-                res_font_list.append(res_font)
+                res_info_list.append(
+                    Font_info(
+                        str(file),
+                        font_number,
+                        frozenset(familys),
+                        font_type,
+                        font.sfntVersion == "OTTO",
+                        Font_info.encode_cmap(font.getBestCmap() or ()),
+                        has_decode_error,
+                    )
+                )
 
-        except TTLibError as e:
-            log.error(f'Failed to load font file "{file}": {e}')
-        except Exception as e:
-            log.error(f'Unexpected error when load font "{file}": {e}')
+    except TTLibError as e:
+        log.error(f'Failed to load font file "{file}": {e}')
+    except Exception as e:
+        log.error(f'Unexpected error when load font "{file}": {e}')
 
-    return res_font_list
+    return res_info_list
 
 
-def load_windows_fonts(
+def load_fonts(
+    path: str | Path,
     *,
     lazy: bool = True,
     strict: bool = False,
 ) -> list[Font]:
-    paths: tuple[Path, ...] = (
+    """
+    strict: Skip UnicodeDecodeError font file
+
+    字体信息从字体索引中读取，只有新增或修改的字体文件需要解析
+    """
+    from .font_index import get_font_info_list
+
+    res_font_list: Final[list[Font]] = []
+    for info in get_font_info_list(path, strict=strict):
+        try:
+            res_font_list.append(Font.from_info(info, lazy=lazy))
+        except TTLibError as e:
+            log.error(f'Failed to load font file "{info.pathname}": {e}')
+        except Exception as e:
+            log.error(f'Unexpected error when load font "{info.pathname}": {e}')
+    return res_font_list
+
+
+def get_windows_font_dir_tuple() -> tuple[Path, ...]:
+    return (
         Path(os.environ["SYSTEMROOT"]) / "Fonts",
         Path(os.environ["LOCALAPPDATA"]) / "Microsoft/Windows/Fonts",
     )
 
+
+def load_windows_fonts(
+    *,
+    lazy: bool = True,
+    strict: bool = False,
+) -> list[Font]:
     return list(
         itertools.chain.from_iterable(
-            load_fonts(path, lazy=lazy, strict=strict) for path in paths
+            load_fonts(path, lazy=lazy, strict=strict)
+            for path in get_windows_font_dir_tuple()
         )
     )
 
 
-def subset_font(font: Font, subset_str: str, affix: str) -> tuple[TTFont, bool]:
-    subset_font = deepcopy(font.font)
-
-    # 检查哪些字符不存在于字体中
-    try:
-        cmap = subset_font.getBestCmap()
-        if cmap is None:
-            raise Exception("cmap is None")
-        available_chars = set(map(chr, cmap))
-    except Exception as e:
-        raise Font_error("Can not read best cmap from '{}'", font.pathname) from e
-    input_chars = set(subset_str)
-    missing_chars = input_chars - available_chars
-
+def warn_missing_chars(
+    familys: "Iterable[str]", font_type: Font_type, missing_chars: set[str]
+) -> None:
     if missing_chars:
         # 将缺失字符按 Unicode 码点排序
         sorted_missing = sorted(missing_chars, key=ord)
         missing_info = ", ".join(f"'{c}' (U+{ord(c):04X})" for c in sorted_missing)
         log.warning(
             'The font "{}" does not contain these characters: {}',
-            f"{font.familys} / {font.font_type.name}",
+            f"{set(familys)} / {font_type.name}",
             missing_info,
         )
 
-    # 创建子集化选项
+
+SUBSET_NAME_ID_TUPLE: Final[tuple[int, ...]] = (0, 1, 2, 3, 4, 5, 6)
+"""子集化后保留的 name 表记录"""
+
+
+def get_subset_options() -> subset.Options:
     options = subset.Options()
     options.hinting = True  # 保留 hinting
-    options.name_IDs = []  # 不保留 name 表记录
+    options.name_IDs = list(SUBSET_NAME_ID_TUPLE)
+    # 保留所有平台和语言的记录，由 apply_subset_affix 改名
+    options.name_legacy = True
+    options.name_languages = ["*"]
+    return options
 
-    # 创建子集化器
-    subsetter = subset.Subsetter(options=options)
 
-    # 设置要保留的字符
-    subsetter.populate(text=subset_str)
+def get_subset_options_sign() -> str:
+    """影响子集化结果的选项和版本，用于缓存键"""
+    options = get_subset_options()
+    return f"fontTools {fontTools.__version__} hinting={options.hinting} name_IDs={options.name_IDs} name_legacy={options.name_legacy} name_languages={options.name_languages}"
 
-    # 执行子集化
-    subsetter.subset(subset_font)
 
-    # 修改 Name Record
+def apply_subset_affix(font: TTFont, affix: str) -> None:
+    """给子集化后的字体的名称加上词缀，使其不与原字体冲突"""
     affix_ascii = affix.encode("ascii")
     affix_utf16be = affix.encode("utf-16-be")
-    table_name: table__n_a_m_e | None = font.font.get("name")
-    subset_table_name: table__n_a_m_e | None = subset_font.get("name")
-
-    # 这两个都是复制的，所以不可能是 None
-    assert table_name is not None
-    assert subset_table_name is not None
+    table_name: table__n_a_m_e | None = font.get("name")
+    if table_name is None:
+        return
 
-    subset_table_name.names = list[NameRecord]()  # 重写 name table
+    name_record_list = list[NameRecord]()  # 重写 name table
     for record in table_name.names:
         name_id = int(record.nameID)
 
-        if name_id not in {0, 1, 2, 3, 4, 5, 6}:
+        if name_id not in SUBSET_NAME_ID_TUPLE:
             continue
 
+        string: bytes = record.string
         _prefix = affix_utf16be if record.getEncoding() == "utf_16_be" else affix_ascii
         match name_id:
             case 1 | 3 | 4 | 6:
-                record.string = _prefix + record.string
+                string = _prefix + string
             case 5:
-                record.string += _prefix
+                string += _prefix
 
-        subset_table_name.names.append(
+        name_record_list.append(
             makeName(
-                record.string,
+                string,
                 record.nameID,
                 record.platformID,
                 record.platEncID,
                 record.langID,
             )
         )
+    table_name.names = name_record_list
+
+
+def _subset_ttfont(font: TTFont, subset_str: str, affix: str) -> None:
+    """原地子集化，affix 为空时不改名"""
+    # 创建子集化器
+    subsetter = subset.Subsetter(options=get_subset_options())
+
+    # 设置要保留的字符
+    subsetter.populate(text=subset_str)
+
+    # 执行子集化
+    subsetter.subset(font)
+
+    # 修改 Name Record
+    if affix:
+        apply_subset_affix(font, affix)
+
+
+def subset_font(
+    font: Font,
+    subset_str: str,
+    affix: str,
+    *,
+    is_check_missing: bool = True,
+) -> tuple[TTFont, bool]:
+    """
+    is_check_missing: 检查并警告字体中不存在的字符，否则视为全部存在
+
+    affix 为空时不改名，不修改 font
+    """
+    # 重新打开而不是 deepcopy，只解码子集化需要的表
+    subset_font = font.reload()
+
+    # 检查哪些字符不存在于字体中
+    missing_chars: set[str] = set()
+    if is_check_missing:
+        try:
+            cmap = subset_font.getBestCmap()
+            if cmap is None:
+                raise Exception("cmap is None")
+            available_chars = set(map(chr, cmap))
+        except Exception as e:
+            subset_font.close()
+            raise Font_error("Can not read best cmap from '{}'", font.pathname) from e
+        missing_chars = set(subset_str) - available_chars
+        warn_missing_chars(font.familys, font.font_type, missing_chars)
+
+    _subset_ttfont(subset_font, subset_str, affix)
 
     subset_font.close()
     return subset_font, not missing_chars
+
+
+def subset_font_to_bytes(info: Font_info, subset_str: str) -> bytes:
+    """
+    按路径和序号打开字体并子集化，返回保存后的字体，名称不加词缀
+
+    可在子进程中执行，不检查缺失的字符，以免在子进程中输出日志
+    """
+    with open_font(info.pathname, info.font_number) as font, BytesIO() as buffer:
+        _subset_ttfont(font, subset_str, "")
+        font.save(buffer)
+        return buffer.getvalue()
+
+
+def apply_subset_affix_to_bytes(font_bytes: bytes, affix: str) -> bytes:
+    with TTFont(BytesIO(font_bytes)) as font, BytesIO() as buffer:
+        apply_subset_affix(font, affix)
+        font.save(buffer)
+        return buffer.getvalue()
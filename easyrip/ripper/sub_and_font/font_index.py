@@ -0,0 +1,217 @@
+import json
+import sqlite3
+import threading
+from contextlib import closing
+from pathlib import Path
+from typing import Final, final
+
+from ...easyrip_log import log
+from ...global_val import get_CONFIG_DIR
+from .font import Font_info, Font_type, read_font_info
+
+FONT_SUFFIX_TUPLE: Final[tuple[str, ...]] = (".ttf", ".otf", ".ttc")
+
+
+@final
+class _Font_index:
+    """
+    以 sqlite 保存在配置目录的字体索引
+
+    按目录增量更新，字体文件的大小或修改时间变化时重新解析，不存在时删除
+    """
+
+    VERSION: Final[int] = 1
+    """解析逻辑变化时递增，使旧索引失效"""
+
+    _lock: Final = threading.Lock()
+    _is_disabled: bool = False
+
+    @classmethod
+    def _connect(cls) -> sqlite3.Connection:
+        index_file = get_CONFIG_DIR() / "font_index.db"
+        index_file.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(index_file, timeout=10)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS font_file ("
+            "path TEXT PRIMARY KEY, dir TEXT, size INTEGER, mtime_ns INTEGER, "
+            "version INTEGER)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS font_file_dir ON font_file (dir)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS font ("
+            "path TEXT, font_number INTEGER, familys TEXT, font_type TEXT, "
+            "is_otf INTEGER, cmap BLOB, has_decode_error INTEGER, "
+            "PRIMARY KEY (path, font_number))"
+        )
+        return conn
+
+    @classmethod
+    def update(cls, file_list: list[Path], dir_key: str | None) -> list[Font_info]:
+        """
+        返回 file_list 中所有字体的信息，只解析新增或修改的文件
+
+        :param dir_key: 非 None 时 file_list 为此目录的全部字体文件，删除目录中已不存在的文件
+        """
+        stat_dict: dict[str, tuple[int, int]] = {}
+        for file in file_list:
+            try:
+                stat = file.stat()
+            except OSError as e:
+                log.error(e)
+                continue
+            stat_dict[str(file.absolute())] = (stat.st_size, stat.st_mtime_ns)
+
+        if cls._is_disabled:
+            return [
+                info
+                for pathname in stat_dict
+                for info in read_font_info(Path(pathname))
+            ]
+
+        try:
+            with cls._lock, closing(cls._connect()) as conn, conn:
+                row_list: list[tuple[str, int, int]]
+                if dir_key is not None:
+                    row_list = conn.execute(
+                        "SELECT path, size, mtime_ns FROM font_file "
+                        "WHERE dir = ? AND version = ?",
+                        (dir_key, cls.VERSION),
+                    ).fetchall()
+                else:
+                    row_list = []
+                    for pathname in stat_dict:
+                        row = conn.execute(
+                            "SELECT path, size, mtime_ns FROM font_file "
+                            "WHERE path = ? AND version = ?",
+                            (pathname, cls.VERSION),
+                        ).fetchone()
+                        if row is not None:
+                            row_list.append(row)
+            indexed_dict: dict[str, tuple[int, int]] = {
+                path: (size, mtime_ns) for path, size, mtime_ns in row_list
+            }
+
+            changed_list = [
+                pathname
+                for pathname, stat in stat_dict.items()
+                if indexed_dict.get(pathname) != stat
+            ]
+            removed_list = (
+                [pathname for pathname in indexed_dict if pathname not in stat_dict]
+                if dir_key is not None
+                else []
+            )
+
+            # 解析时不持有锁
+            if changed_list:
+                log.info("Update font index: {} files", len(changed_list))
+            changed_info_dict = {
+                pathname: read_font_info(Path(pathname)) for pathname in changed_list
+            }
+
+            with cls._lock, closing(cls._connect()) as conn, conn:
+                for pathname in (*changed_list, *removed_list):
+                    conn.execute("DELETE FROM font WHERE path = ?", (pathname,))
+                    conn.execute("DELETE FROM font_file WHERE path = ?", (pathname,))
+                for pathname, info_list in changed_info_dict.items():
+                    conn.execute(
+                        "INSERT INTO font_file VALUES (?, ?, ?, ?, ?)",
+                        (
+                            pathname,
+                            str(Path(pathname).parent),
+                            *stat_dict[pathname],
+                            cls.VERSION,
+                        ),
+                    )
+                    conn.executemany(
+                        "INSERT INTO font VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            (
+                                info.pathname,
+                                info.font_number,
+                                json.dumps(sorted(info.familys), ensure_ascii=False),
+                                info.font_type.name,
+                                info.is_otf,
+                                info.cmap,
+                                info.has_decode_error,
+                            )
+                            for info in info_list
+                        ),
+                    )
+
+                res_info_list: list[Font_info] = []
+                for pathname in stat_dict:
+                    if pathname in changed_info_dict:
+                        res_info_list.extend(changed_info_dict[pathname])
+                        continue
+                    res_info_list.extend(
+                        Font_info(
+                            path,
+                            font_number,
+                            frozenset(json.loads(familys)),
+                            Font_type[font_type],
+                            bool(is_otf),
+                            cmap,
+                            bool(has_decode_error),
+                        )
+                        for (
+                            path,
+                            font_number,
+                            familys,
+                            font_type,
+                            is_otf,
+                            cmap,
+                            has_decode_error,
+                        ) in conn.execute(
+                            "SELECT * FROM font WHERE path = ? ORDER BY font_number",
+                            (pathname,),
+                        )
+                    )
+
+        except Exception as e:
+            cls._disable(e)
+            return [
+                info
+                for pathname in stat_dict
+                for info in read_font_info(Path(pathname))
+            ]
+
+        return res_info_list
+
+    @classmethod
+    def _disable(cls, e: Exception) -> None:
+        """索引不可用时直接解析字体，本次运行内不再尝试"""
+        cls._is_disabled = True
+        log.warning("Font index is disabled: {}", e)
+
+
+def get_font_info_list(path: str | Path, *, strict: bool = False) -> list[Font_info]:
+    """
+    目录或字体文件中所有字体的信息
+
+    strict: Skip UnicodeDecodeError font
+    """
+    path = Path(path)
+
+    if path.is_dir():
+        file_list = sorted(
+            file
+            for file in path.iterdir()
+            if file.suffix.lower() in FONT_SUFFIX_TUPLE and file.is_file()
+        )
+        dir_key = str(path.absolute())
+    elif path.is_file() and path.suffix.lower() in FONT_SUFFIX_TUPLE:
+        file_list = [path]
+        dir_key = None
+    else:
+        return []
+
+    res_info_list: list[Font_info] = []
+    for info in _Font_index.update(file_list, dir_key):
+        if strict and info.has_decode_error:
+            log.error(
+                'Unicode decode error in font "{}". Skip this font', info.pathname
+            )
+            continue
+        res_info_list.append(info)
+    return res_info_list
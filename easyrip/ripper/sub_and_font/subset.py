@@ -1,5 +1,8 @@
+import multiprocessing
+import os
 import re
-from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 from typing import TYPE_CHECKING, Final
 
@@ -16,11 +19,23 @@ from .ass import (
     Event_type,
     Script_info_data,
 )
-from .font import Font, Font_type, load_fonts, load_windows_fonts, subset_font
+from .font import (
+    Font_info,
+    Font_type,
+    apply_subset_affix_to_bytes,
+    get_windows_font_dir_tuple,
+    subset_font_to_bytes,
+    warn_missing_chars,
+)
+from .font_index import get_font_info_list
+from .subset_cache import Subset_cache
 
 if TYPE_CHECKING:
     from collections.abc import Iterable
 
+_PROCESS_POOL_MIN_FONT_SIZE: Final[int] = 8 * 2**20
+"""字体总大小低于此值时，启动进程的开销大于并行的收益"""
+
 
 def _bold_italic_to_font_type(bold: bool | int, italic: bool | int) -> Font_type:
     if bold:
@@ -28,6 +43,109 @@ def _bold_italic_to_font_type(bold: bool | int, italic: bool | int) -> Font_type
     return Font_type.Italic if italic else Font_type.Regular
 
 
+def _run_subset_job_list(
+    job_list: "list[tuple[Font_info, str]]",
+    *,
+    max_workers: int | None = None,
+) -> "list[bytes | BaseException]":
+    """
+    各字体的子集化互相独立，且为纯 Python 的 CPU 密集计算，在进程池中并行执行
+
+    结果的顺序与 job_list 一致，进程池不可用时顺序执行
+
+    :param max_workers: 进程数的上限，None 为逻辑核心数
+    """
+
+    def _run_inline(job: "tuple[Font_info, str]") -> bytes | BaseException:
+        try:
+            return subset_font_to_bytes(*job)
+        except Exception as e:
+            return e
+
+    try:
+        total_size = sum(Path(job[0].pathname).stat().st_size for job in job_list)
+    except OSError:
+        total_size = 0
+    if (
+        len(job_list) <= 1
+        or (max_workers := min(len(job_list), max_workers or os.cpu_count() or 1)) <= 1
+        or total_size < _PROCESS_POOL_MIN_FONT_SIZE
+    ):
+        return [_run_inline(job) for job in job_list]
+
+    try:
+        # spawn 不复制父进程的线程状态，在 Ripper 的线程中也是安全的
+        # 打包为可执行文件时，子进程依赖 __main__ 中的 freeze_support 进入
+        with ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            future_list = [
+                executor.submit(subset_font_to_bytes, *job) for job in job_list
+            ]
+            res_list: list[bytes | BaseException] = []
+            for future in future_list:
+                try:
+                    res_list.append(future.result())
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    res_list.append(e)
+            return res_list
+
+    except (OSError, BrokenProcessPool) as e:
+        log.warning("Process pool is unavailable, subset fonts one by one: {}", e)
+        return [_run_inline(job) for job in job_list]
+
+
+def _get_subset_font_bytes_list(
+    job_list: "list[tuple[Font_info, str]]",
+    *,
+    max_workers: int | None = None,
+) -> "list[bytes | BaseException]":
+    """
+    名称未加词缀的子集化字体，相同的字体和字符集只子集化一次
+
+    优先使用子集化缓存，只有未命中的在进程池中执行
+    """
+    # 字符集排序去重后作为缓存键和子集化的输入
+    job_list = [(info, "".join(sorted(set(s)))) for info, s in job_list]
+    cache_key_list = [Subset_cache.get_key(*job) for job in job_list]
+    # 无法缓存的任务不去重
+    key_list = [
+        f"_{i}" if cache_key is None else cache_key
+        for i, cache_key in enumerate(cache_key_list)
+    ]
+
+    key__font_bytes: dict[str, bytes | BaseException] = {}
+    for cache_key in cache_key_list:
+        if (
+            cache_key is not None
+            and cache_key not in key__font_bytes
+            and (font_bytes := Subset_cache.get(cache_key)) is not None
+        ):
+            key__font_bytes[cache_key] = font_bytes
+    if key__font_bytes:
+        log.info(
+            "Subset cache hit: {}/{} fonts", len(key__font_bytes), len(set(key_list))
+        )
+
+    miss__job = {
+        key: job
+        for key, job in zip(key_list, job_list, strict=True)
+        if key not in key__font_bytes
+    }
+    for key, font_bytes in zip(
+        miss__job,
+        _run_subset_job_list(list(miss__job.values()), max_workers=max_workers),
+        strict=True,
+    ):
+        key__font_bytes[key] = font_bytes
+        if isinstance(font_bytes, bytes) and not key.startswith("_"):
+            Subset_cache.set(key, font_bytes)
+
+    return [key__font_bytes[key] for key in key_list]
+
+
 def subset(
     sub_path_list: "Iterable[str | Path]",
     font_path_list: "Iterable[str | Path]",
@@ -39,7 +157,9 @@ def subset(
     drop_non_render: bool = True,
     drop_unkow_data: bool = True,
     strict: bool = False,
+    max_workers: int | None = None,
 ) -> bool:
+    """max_workers: 子集化字体的进程数的上限，None 为逻辑核心数"""
     DEFAULT_STYLE_NAME = "Default"
 
     return_res: bool = True
@@ -287,14 +407,15 @@ def subset(
         ] + path_and_sub.script_info.data
         subset_sub_dict[_ass_path_abs] = (output_dir / _ass_path.name, path_and_sub)
 
-    # 加载 Font
-    fonts: Final[list[Font]] = []
+    # 从字体索引中查找字体，只在子集化时打开用到的字体
+    fonts: Final[list[Font_info]] = []
     for _path in font_path_list:
-        fonts.extend(load_fonts(_path, strict=strict))
+        fonts.extend(get_font_info_list(_path, strict=strict))
     if use_win_font:
-        fonts.extend(load_windows_fonts(strict=strict))
+        for _path in get_windows_font_dir_tuple():
+            fonts.extend(get_font_info_list(_path, strict=strict))
 
-    font_sign__font: dict[tuple[str, Font_type], Font] = {}
+    font_sign__font: dict[tuple[str, Font_type], Font_info] = {}
     family_lower__family = {}  # 存储小写 family 用于判断 ASS 的大小写不敏感语法
     for _font in fonts:
         for family in _font.familys:
@@ -302,7 +423,7 @@ def subset(
             font_sign__font[(family, _font.font_type)] = _font
 
     # 子集化映射
-    font__subset_str: dict[Font, dict[str, str]] = {}
+    font__subset_str: dict[Font_info, dict[str, str]] = {}
     for key, val in font_sign__subset_str.items():
         _k: tuple[str, Font_type] = key
         if key not in font_sign__font:
@@ -400,6 +521,8 @@ def subset(
         )
 
     # 子集化字体
+    # (字体, 子字符集, 词缀, 内嵌的字幕路径, 输出的文件名)，字幕路径为 None 时输出到 output_dir
+    subset_job_list: list[tuple[Font_info, str, str, str | None, str]] = []
     for key, val in font__subset_str.items():
         _affix: str
         _basename: str
@@ -410,37 +533,64 @@ def subset(
                 _affix = family__affix[family]
                 _basename = family
                 _infix = key.font_type.name
-                _suffix = "otf" if key.font.sfntVersion == "OTTO" else "ttf"
+                _suffix = "otf" if key.is_otf else "ttf"
                 break
         else:
             raise AssertionError("No font name")
 
         if font_in_sub:
             for org_path_abs, s in val.items():
-                new_font, is_subset_success = subset_font(key, s, _affix)
-
-                if strict and is_subset_success is False:
-                    return_res = False
-
-                with BytesIO() as buffer:
-                    new_font.save(buffer)
-                    if org_path_abs not in subset_font_bytes_and_name_dict:
-                        subset_font_bytes_and_name_dict[org_path_abs] = []
-                    subset_font_bytes_and_name_dict[org_path_abs].append(
-                        (
-                            f"{_affix}{_basename}_{'B' if key.font_type in {Font_type.Bold, Font_type.Bold_Italic} else ''}{'I' if key.font_type in {Font_type.Italic, Font_type.Bold_Italic} else ''}0.{_suffix}",
-                            buffer.getvalue(),
-                        )
+                subset_job_list.append(
+                    (
+                        key,
+                        s,
+                        _affix,
+                        org_path_abs,
+                        f"{_affix}{_basename}_{'B' if key.font_type in {Font_type.Bold, Font_type.Bold_Italic} else ''}{'I' if key.font_type in {Font_type.Italic, Font_type.Bold_Italic} else ''}0.{_suffix}",
                     )
+                )
         else:
-            new_font, is_subset_success = subset_font(
-                key, "".join(v for v in val.values()), _affix
+            subset_job_list.append(
+                (
+                    key,
+                    "".join(v for v in val.values()),
+                    _affix,
+                    None,
+                    f"{_affix}{_basename}.{_infix}.{_suffix}",
+                )
             )
 
-            if strict and is_subset_success is False:
+    # 缺失的字符由字体索引中的 cmap 检查
+    for key, s, _, _, _ in subset_job_list:
+        if missing_chars := key.get_missing_chars(s):
+            warn_missing_chars(key.familys, key.font_type, missing_chars)
+            if strict:
                 return_res = False
 
-            new_font.save(output_dir / f"{_affix}{_basename}.{_infix}.{_suffix}")
+    for (key, _, _affix, org_path_abs, font_name), font_bytes in zip(
+        subset_job_list,
+        _get_subset_font_bytes_list(
+            [job[:2] for job in subset_job_list], max_workers=max_workers
+        ),
+        strict=True,
+    ):
+        try:
+            if isinstance(font_bytes, BaseException):
+                raise font_bytes
+            font_bytes = apply_subset_affix_to_bytes(font_bytes, _affix)
+        except Exception as e:
+            log.error(f'Failed to subset font "{key.pathname}": {e}')
+            return_res = False
+            continue
+
+        if org_path_abs is None:
+            (output_dir / font_name).write_bytes(font_bytes)
+        else:
+            if org_path_abs not in subset_font_bytes_and_name_dict:
+                subset_font_bytes_and_name_dict[org_path_abs] = []
+            subset_font_bytes_and_name_dict[org_path_abs].append(
+                (font_name, font_bytes)
+            )
 
     # 保存子集化的字幕
     for org_path_abs_1, path_and_sub in subset_sub_dict.items():
@@ -467,8 +617,4 @@ def subset(
                 )
             )
 
-    # 释放文件占用
-    for font in font_sign__font.values():
-        font.__del__()
-
     return return_res
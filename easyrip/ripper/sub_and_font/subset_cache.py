@@ -0,0 +1,131 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Final, final
+
+from ...easyrip_config.config import CONFIG_DEFAULT_DICT, config
+from ...easyrip_config.config_key import Config_key
+from ...easyrip_log import log
+from ...global_val import get_CONFIG_DIR
+from .font import Font_info, get_subset_options_sign
+
+
+@final
+class Subset_cache:
+    """
+    以字体文件、字符集和子集化选项为键，保存名称未加词缀的子集化字体
+
+    命中时只需重新加上词缀，按最近使用时间淘汰，使总体积不超过上限
+    """
+
+    VERSION: Final[int] = 1
+    """缓存键的组成变化时递增，使旧缓存失效"""
+
+    _lock: Final = threading.Lock()
+    _is_disabled: bool = False
+
+    @classmethod
+    def _connect(cls) -> sqlite3.Connection:
+        cache_file = get_CONFIG_DIR() / "subset_cache.db"
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(cache_file, timeout=10)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS subset_cache ("
+            "key TEXT PRIMARY KEY, data BLOB, size INTEGER, access_time REAL)"
+        )
+        return conn
+
+    @classmethod
+    def get_key(cls, info: Font_info, subset_str: str) -> str | None:
+        """字体文件不可读时返回 None"""
+        try:
+            stat = Path(info.pathname).stat()
+        except OSError as e:
+            log.debug(
+                "Subset cache is skipped: {}", e, print_level=log.LogLevel._detail
+            )
+            return None
+
+        data = json.dumps(
+            [
+                cls.VERSION,
+                info.pathname,
+                stat.st_size,
+                stat.st_mtime_ns,
+                info.font_number,
+                "".join(sorted(set(subset_str))),
+                get_subset_options_sign(),
+            ],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def get(cls, key: str) -> bytes | None:
+        if cls._is_disabled:
+            return None
+
+        try:
+            with cls._lock, closing(cls._connect()) as conn, conn:
+                row = conn.execute(
+                    "SELECT data FROM subset_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                conn.execute(
+                    "UPDATE subset_cache SET access_time = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+
+        except Exception as e:
+            cls._disable(e)
+            return None
+
+        return row[0]
+
+    @classmethod
+    def set(cls, key: str, font_bytes: bytes) -> None:
+        if cls._is_disabled:
+            return
+
+        try:
+            max_size: int = (
+                config.get_user_profile(
+                    Config_key.subset_cache_max_mb,
+                    CONFIG_DEFAULT_DICT[Config_key.subset_cache_max_mb],
+                )
+                * 2**20
+            )
+            if len(font_bytes) > max_size:
+                return
+
+            with cls._lock, closing(cls._connect()) as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO subset_cache VALUES (?, ?, ?, ?)",
+                    (key, font_bytes, len(font_bytes), time.time()),
+                )
+
+                # 按最近使用时间淘汰
+                total_size: int = conn.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM subset_cache"
+                ).fetchone()[0]
+                for _key, _size in conn.execute(
+                    "SELECT key, size FROM subset_cache ORDER BY access_time"
+                ).fetchall():
+                    if total_size <= max_size:
+                        break
+                    conn.execute("DELETE FROM subset_cache WHERE key = ?", (_key,))
+                    total_size -= _size
+
+        except Exception as e:
+            cls._disable(e)
+
+    @classmethod
+    def _disable(cls, e: Exception) -> None:
+        """缓存不可用时不影响子集化，本次运行内不再尝试"""
+        cls._is_disabled = True
+        log.warning("Subset cache is disabled: {}", e)
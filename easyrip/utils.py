@@ -10,7 +10,8 @@ import time
 from collections.abc import Iterable
 from dataclasses import asdict, is_dataclass
 from itertools import zip_longest
-from typing import TYPE_CHECKING, Any, Final, TypeGuard, get_args, get_origin
+from types import UnionType
+from typing import TYPE_CHECKING, Any, Final, TypeGuard, Union, get_args, get_origin
 
 import Crypto.Cipher.AES
 import Crypto.Util.Padding
@@ -278,6 +279,11 @@ def type_match[T](val: Any, t: type[T]) -> TypeGuard[T]:
     if t_org is None:
         return isinstance(val, t)
 
+    # 联合类型的 origin 不是可用于 isinstance 的类，需要先处理
+    if t_org is UnionType or t_org is Union:
+        # Union[T1, T2, ...] 或 T1 | T2 检查
+        return any(type_match(val, t) for t in get_args(t))
+
     # 首先检查是否是 b_org 的实例
     if not isinstance(val, t_org):
         return False
@@ -319,15 +325,10 @@ def type_match[T](val: Any, t: type[T]) -> TypeGuard[T]:
             elem_type = args[0]
             return all(type_match(item, elem_type) for item in val)
 
-    elif t_org is frozenset:
+    elif t_org is frozenset and len(args) == 1:
         # frozenset[T] 检查
-        if len(args) == 1:
-            elem_type = args[0]
-            return all(type_match(item, elem_type) for item in val)
-
-    elif hasattr(t_org, "__name__") and t_org.__name__ == "Union":
-        # Union[T1, T2, ...] 或 T1 | T2 检查
-        return any(type_match(val, t) for t in args)
+        elem_type = args[0]
+        return all(type_match(item, elem_type) for item in val)
 
     return True
 
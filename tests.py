@@ -1,14 +1,26 @@
+import functools
+import importlib
 import io
 import itertools
 import json
+import math
+import os
 import re
 import shutil
 import subprocess
 import sys
+import tempfile
+import threading
+import time
 import timeit
 import unittest
+import unittest.mock
 from pathlib import Path
-from typing import Final
+from typing import Any, Final
+
+from fontTools.fontBuilder import FontBuilder
+from fontTools.pens.ttGlyphPen import TTGlyphPen
+from fontTools.ttLib import TTFont
 
 import easyrip
 import easyrip.easyrip_web
@@ -22,8 +34,25 @@ from easyrip import (
 from easyrip.easyrip_command import Cmd_type, Opt_type
 from easyrip.easyrip_mlang import Lang_tag_val, all_supported_lang_map
 from easyrip.easyrip_mlang.global_lang_val import Global_lang_val
+from easyrip.ripper import journal as journal_module
+from easyrip.ripper import media_info as media_info_module
+from easyrip.ripper import process as process_module
+from easyrip.ripper.bench import Bench_result, bench_to_table
+from easyrip.ripper.crf_search import interpolate_crf
+from easyrip.ripper.media_info import Media_info, get_keyframe_list
+from easyrip.ripper.output_cache import Output_cache
+from easyrip.ripper.progress import Progress_reader, Progress_reader_group
+from easyrip.ripper.quality import Quality_metric, Quality_stats
 from easyrip.ripper.ripper import Ripper
-from easyrip.ripper.sub_and_font.font import load_fonts, load_windows_fonts
+from easyrip.ripper.scheduler import Job_cost, Scheduler, get_ripper_cost
+from easyrip.ripper.sub_and_font.font import (
+    Font,
+    Font_info,
+    load_fonts,
+    load_windows_fonts,
+    read_font_info,
+    subset_font,
+)
 
 if sys.stdout.encoding != "UTF-8":
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", errors="replace")
@@ -33,6 +62,26 @@ log.print_level = log.LogLevel._detail
 log.write_level = log.LogLevel.none
 
 
+def build_test_font(path: Path, family: str) -> None:
+    """生成只含 "ABC" 三个字符的 TTF"""
+    glyph_order = [".notdef", *(f"uni{ord(c):04X}" for c in "ABC")]
+    pen = TTGlyphPen(None)
+    pen.moveTo((0, 0))
+    pen.lineTo((0, 500))
+    pen.lineTo((500, 0))
+    pen.closePath()
+    fb = FontBuilder(1000, isTTF=True)
+    fb.setupGlyphOrder(glyph_order)
+    fb.setupCharacterMap({ord(c): f"uni{ord(c):04X}" for c in "ABC"})
+    fb.setupGlyf({name: pen.glyph() for name in glyph_order})
+    fb.setupHorizontalMetrics(dict.fromkeys(glyph_order, (500, 0)))
+    fb.setupHorizontalHeader(ascent=800, descent=-200)
+    fb.setupNameTable({"familyName": family, "styleName": "Regular"})
+    fb.setupOS2()
+    fb.setupPost()
+    fb.save(path)
+
+
 def run_command_and_run_ripper_list(cmd: str) -> bool:
     def __run(cmd: str) -> bool:
         if not (run_command(cmd)):
@@ -166,6 +215,7 @@ class TestRip(unittest.TestCase):
             cls.test_flac,
             cls.test_c_a_flac,
             cls.test_soft_sub,
+            cls.test_chunk,
         ):
             method_name = method.__name__
             cls.test_media_file_dict[method_name] = [
@@ -188,7 +238,6 @@ class TestRip(unittest.TestCase):
             "ffprobe",
             "flac",
             "mp4box",
-            "mkvpropedit",
             "mkvmerge",
         ):
             self.assertTrue(shutil.which(tool), f"The '{tool}' not found in PATH")
@@ -318,6 +367,25 @@ class TestRip(unittest.TestCase):
             )
         )
 
+    def test_chunk(self):
+        """测试分段编码，拼接后的帧数与输入一致"""
+        output_basename = TestRip.test_media_file_dict[self.test_chunk.__name__][0]
+
+        self.assertTrue(
+            run_command_and_run_ripper_list(
+                f"-i {TestRip.TEST_VA_BASENAME}.{TestRip.TEST_VA_SUFFIX} -p x264fast -chunk 3 -c:a copy -muxer mkv -o {output_basename}"
+            )
+        )
+
+        output_path = output_basename.with_suffix(output_basename.suffix + ".va.mkv")
+        self.assertTrue(output_path.is_file())
+        self.assertEqual(
+            get_keyframe_list(output_path)[1],
+            get_keyframe_list(f"{TestRip.TEST_VA_BASENAME}.{TestRip.TEST_VA_SUFFIX}")[
+                1
+            ],
+        )
+
 
 class TestSubset(unittest.TestCase):
     def test_ass_class(self):
@@ -339,6 +407,553 @@ class TestSubset(unittest.TestCase):
         self.assertFalse(load_fonts(":&?"))
         self.assertTrue(load_windows_fonts())
 
+    def test_font_info_cmap(self):
+        info = Font_info("", cmap=Font_info.encode_cmap(map(ord, "ABCXYZ\u4e00\u4e01")))
+        self.assertEqual(info.get_missing_chars("AZ\u4e00"), set())
+        self.assertEqual(info.get_missing_chars("@DW\u4e02"), {"@", "D", "W", "\u4e02"})
+
+    def test_subset_process_pool(self):
+        # 包中的 subset 是同名函数
+        subset_module = importlib.import_module("easyrip.ripper.sub_and_font.subset")
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            info_list: list[Font_info] = []
+            for family in ("Test Font A", "Test Font B"):
+                path = Path(temp_dir) / f"{family}.ttf"
+                build_test_font(path, family)
+                info_list.extend(read_font_info(path))
+
+            job_list = [(info_list[0], "A"), (info_list[1], "AB"), (info_list[0], "BC")]
+            with unittest.mock.patch.object(
+                subset_module, "_PROCESS_POOL_MIN_FONT_SIZE", 0
+            ):
+                res_list = subset_module._run_subset_job_list(job_list, max_workers=2)
+
+            # 结果的顺序与任务一致
+            for (_, subset_str), font_bytes in zip(job_list, res_list, strict=True):
+                assert isinstance(font_bytes, bytes), font_bytes
+                with TTFont(io.BytesIO(font_bytes)) as font:
+                    self.assertEqual(
+                        set(map(chr, font.getBestCmap())),
+                        set(subset_str),
+                    )
+
+    def test_subset_font(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / "Test Font.ttf"
+            build_test_font(path, "Test Font")
+            font = Font.from_info(read_font_info(path)[0])
+
+            subset_ttfont, is_all_found = subset_font(font, "AB", "TEST")
+            self.assertTrue(is_all_found)
+            self.assertEqual(set(map(chr, subset_ttfont.getBestCmap())), {"A", "B"})
+            self.assertEqual(subset_ttfont["name"].getBestFamilyName(), "TESTTest Font")
+            # 不修改原字体
+            self.assertEqual(set(map(chr, font.font.getBestCmap())), set("ABC"))
+
+            # 文件已不存在时从 font.font 的数据重新打开
+            font.font.ensureDecompiled()
+            path.unlink()
+            subset_ttfont, is_all_found = subset_font(
+                font, "C", "", is_check_missing=False
+            )
+            self.assertTrue(is_all_found)
+            self.assertEqual(set(map(chr, subset_ttfont.getBestCmap())), {"C"})
+
+
+class TestJournal(unittest.TestCase):
+    def test_journal(self):
+        with (
+            tempfile.TemporaryDirectory() as temp_dir,
+            unittest.mock.patch.object(
+                journal_module, "get_CONFIG_DIR", lambda: Path(temp_dir) / "config"
+            ),
+        ):
+            work_dir = Path(temp_dir)
+            video_ripper = Ripper(
+                [work_dir / "a.mkv"],
+                [None],
+                work_dir,
+                Ripper.Preset_name.x265,
+                {"crf": "20"},
+                is_lazy=True,
+            )
+            subset_ripper = Ripper(
+                [work_dir / "b.ass"],
+                [None],
+                work_dir,
+                Ripper.Preset_name.subset,
+                {},
+                is_lazy=True,
+            )
+
+            journal = journal_module.Ripper_journal()
+            self.assertTrue(journal.path.is_relative_to(work_dir / "config"))
+            journal.add([video_ripper, subset_ripper])
+            self.assertEqual(len(journal.get_unfinished_list()), 2)
+
+            # 中断后的临时输出在下次执行时删除
+            temp_path = work_dir / "a.temp.mkv"
+            temp_path.write_bytes(b"temp")
+            (temp_glob_file := work_dir / "FFProgress.sign.log").write_bytes(b"")
+            journal.set_running(
+                video_ripper, temp_path, [str(work_dir / "FFProgress.sign.*")]
+            )
+            journal.set_end(video_ripper, is_done=False)
+            self.assertFalse(journal.is_done(video_ripper))
+            journal.set_running(video_ripper, temp_path)
+            self.assertFalse(temp_path.exists())
+            self.assertFalse(temp_glob_file.exists())
+
+            (output_path := work_dir / "a.mkv.v.mkv").write_bytes(b"video")
+            journal.set_end(video_ripper, is_done=True, output_path=output_path)
+            self.assertTrue(journal.is_done(video_ripper))
+
+            # 只子集化时输出是目录
+            journal.set_running(subset_ripper, work_dir / "b.temp")
+            (output_dir := work_dir / "b").mkdir()
+            (output_dir / "b.ass").write_bytes(b"sub")
+            journal.set_end(subset_ripper, is_done=True, output_path=output_dir)
+            self.assertTrue(journal.is_done(subset_ripper))
+
+            # 从文件恢复
+            journal = journal_module.Ripper_journal()
+            self.assertTrue(journal.is_done(video_ripper))
+            self.assertTrue(journal.is_done(subset_ripper))
+            record = journal.get(subset_ripper)
+            assert record is not None
+            self.assertEqual(record.size, 3)
+            self.assertFalse(journal.get_unfinished_list())
+
+            # 输出被删除后不再视为完成
+            output_path.unlink()
+            self.assertFalse(journal.is_done(video_ripper))
+
+            journal.clean()
+            self.assertFalse(journal.path.exists())
+
+
+class TestOutputCache(unittest.TestCase):
+    def test_output_cache_copy(self):
+        with (
+            tempfile.TemporaryDirectory() as temp_dir,
+            unittest.mock.patch.object(
+                Output_cache, "get_cache_dir", lambda: Path(temp_dir) / "cache"
+            ),
+        ):
+            output_path = Path(temp_dir) / "a.mkv"
+            output_path.write_bytes(b"output")
+            Output_cache.set("key", output_path)
+            self.assertTrue(Output_cache.contains("key"))
+
+            # 原地修改输出不影响缓存
+            with output_path.open("r+b") as f:
+                f.write(b"edited")
+            restore_path = Path(temp_dir) / "b.mkv"
+            self.assertTrue(Output_cache.restore("key", restore_path))
+            self.assertEqual(restore_path.read_bytes(), b"output")
+
+            # 原地修改恢复的输出也不影响缓存
+            with restore_path.open("r+b") as f:
+                f.write(b"edited")
+            restore_path.unlink()
+            self.assertTrue(Output_cache.restore("key", restore_path))
+            self.assertEqual(restore_path.read_bytes(), b"output")
+
+    def test_output_cache_lru(self):
+        with (
+            tempfile.TemporaryDirectory() as temp_dir,
+            unittest.mock.patch.object(
+                Output_cache, "get_cache_dir", lambda: Path(temp_dir) / "cache"
+            ),
+            # 上限 1 MiB
+            unittest.mock.patch(
+                "easyrip.ripper.output_cache.config.get_user_profile", return_value=1
+            ),
+        ):
+            for name in ("a", "b", "c", "big"):
+                (Path(temp_dir) / f"{name}.mkv").write_bytes(
+                    name.encode() * (2**21 if name == "big" else 400 * 2**10)
+                )
+
+            Output_cache.set("a", Path(temp_dir) / "a.mkv")
+            Output_cache.set("b", Path(temp_dir) / "b.mkv")
+            # 超过上限的输出不缓存
+            Output_cache.set("big", Path(temp_dir) / "big.mkv")
+            self.assertFalse(Output_cache.contains("big"))
+
+            # 恢复时更新使用时间，淘汰最久未使用的 b
+            restore_path = Path(temp_dir) / "restore.mkv"
+            self.assertTrue(Output_cache.restore("a", restore_path))
+            self.assertEqual(restore_path.read_bytes()[:1], b"a")
+            Output_cache.set("c", Path(temp_dir) / "c.mkv")
+            self.assertTrue(Output_cache.contains("a"))
+            self.assertFalse(Output_cache.contains("b"))
+            self.assertTrue(Output_cache.contains("c"))
+            self.assertFalse((Path(temp_dir) / "cache" / "b.mkv").exists())
+
+            # 不覆盖已有的输出，未命中时不创建输出
+            self.assertFalse(Output_cache.restore("c", restore_path))
+            self.assertEqual(restore_path.read_bytes()[:1], b"a")
+            self.assertFalse(Output_cache.restore("b", Path(temp_dir) / "b2.mkv"))
+            self.assertFalse((Path(temp_dir) / "b2.mkv").exists())
+
+            # 缓存文件被删除时视为未命中
+            (Path(temp_dir) / "cache" / "c.mkv").unlink()
+            self.assertFalse(Output_cache.restore("c", Path(temp_dir) / "c2.mkv"))
+            self.assertFalse(Output_cache.contains("c"))
+            self.assertFalse(Output_cache._is_disabled)
+
+
+class TestScheduler(unittest.TestCase):
+    @staticmethod
+    def run_scheduler(
+        scheduler: Scheduler, job_list: list[tuple[str, Job_cost, float]]
+    ) -> tuple[list[str], int]:
+        """返回启动顺序和同时占用的最大 CPU 槽位"""
+        lock = threading.Lock()
+        start_list: list[str] = []
+        used_cpu_slots = max_cpu_slots = 0
+
+        def job(name: str, cost: Job_cost, sec: float) -> None:
+            nonlocal used_cpu_slots, max_cpu_slots
+            with lock:
+                start_list.append(name)
+                used_cpu_slots += cost.cpu_slots
+                max_cpu_slots = max(max_cpu_slots, used_cpu_slots)
+            time.sleep(sec)
+            with lock:
+                used_cpu_slots -= cost.cpu_slots
+
+        scheduler.run(
+            [
+                (cost, functools.partial(job, name, cost, sec))
+                for name, cost, sec in job_list
+            ],
+            start_interval_sec=0,
+        )
+        return start_list, max_cpu_slots
+
+    def test_scheduler_order_and_capacity(self):
+        start_list, max_cpu_slots = self.run_scheduler(
+            Scheduler(4, 1024),
+            [(str(i), Job_cost(i % 3 + 1, 256), 0.02) for i in range(12)],
+        )
+        self.assertEqual(sorted(start_list, key=int), [str(i) for i in range(12)])
+        self.assertLessEqual(max_cpu_slots, 4)
+
+        # 超过总预算的任务被限制到总预算，单独运行
+        start_list, _ = self.run_scheduler(
+            Scheduler(4, 0),
+            [("big", Job_cost(64, 2**20), 0.1), ("small", Job_cost(1, 0), 0.02)],
+        )
+        self.assertEqual(start_list, ["big", "small"])
+
+    def test_scheduler_backfill(self):
+        # 回填只使用队首启动后仍然空闲的部分，之前的任务结束时队首立即启动
+        start_list, _ = self.run_scheduler(
+            Scheduler(8, 0),
+            [
+                ("running", Job_cost(6, 0), 0.4),
+                ("head", Job_cost(4, 0), 0.02),
+                *((f"cheap{i}", Job_cost(1, 0), 0.25) for i in range(8)),
+            ],
+        )
+        self.assertEqual(
+            start_list[:6],
+            ["running", "cheap0", "cheap1", "cheap2", "cheap3", "head"],
+        )
+
+        # 队首需要全部预算时，源源不断的小任务也不会使其饿死
+        start_list, _ = self.run_scheduler(
+            Scheduler(4, 0),
+            [
+                ("running", Job_cost(2, 0), 0.2),
+                ("head", Job_cost(4, 0), 0.02),
+                *((f"cheap{i}", Job_cost(1, 0), 0.1) for i in range(8)),
+            ],
+        )
+        self.assertEqual(start_list[:2], ["running", "head"])
+
+    def test_scheduler_job_cost_config(self):
+        ripper = Ripper(
+            ["a.mkv"],
+            [None],
+            None,
+            Ripper.Preset_name.x265fast,
+            {},
+            is_lazy=True,
+        )
+        ripper._option = unittest.mock.Mock(preset_name=Ripper.Preset_name.x265fast)
+        ripper._media_info = unittest.mock.Mock(width=1920, height=1080)
+
+        for cost_map, cost in (
+            ({"x265fast": [2, 512]}, Job_cost(2, 512)),
+            ({"x265fast": [16], "x265": [3, 256]}, Job_cost(3, 256)),
+            ({"x265": ["a", 1]}, Job_cost(16, 3072)),
+            ({"x265": [-1, 1]}, Job_cost(16, 3072)),
+        ):
+            with unittest.mock.patch(
+                "easyrip.ripper.scheduler.config.get_user_profile",
+                return_value=cost_map,
+            ):
+                self.assertEqual(get_ripper_cost(ripper), cost)
+
+
+@unittest.skipUnless(os.name == "posix", "Need POSIX tools")
+class TestProcess(unittest.TestCase):
+    def test_split_cmd(self):
+        split_cmd = process_module.split_cmd
+        self.assertEqual(
+            split_cmd('echo "a b" | cat && true'),
+            [[["echo", "a b"], ["cat"]], [["true"]]],
+        )
+        # 不支持的操作符和需要展开的字符交给 shell
+        for cmd in (
+            "echo a > b",
+            "echo a; true",
+            "false || true",
+            "sleep 1 &",
+            "| cat",
+            "true &&",
+            "echo $HOME",
+            "ls *.mkv",
+            'echo "a',
+        ):
+            self.assertIsNone(split_cmd(cmd), cmd)
+        # 不是可执行文件的命令
+        self.assertIsNone(split_cmd("cd .. && true"))
+        self.assertIsNone(split_cmd("easyrip_not_found_tool -v"))
+
+    def test_split_cmd_windows(self):
+        with (
+            unittest.mock.patch.object(process_module.os, "name", "nt"),
+            unittest.mock.patch.object(
+                process_module.shutil, "which", lambda name: name
+            ),
+        ):
+            # 反斜杠不是转义字符
+            self.assertEqual(
+                process_module.split_cmd(
+                    r'ffmpeg -i "C:\dir\a b.mkv" C:\out\$a.mkv | flac -'
+                ),
+                [
+                    [
+                        ["ffmpeg", "-i", r"C:\dir\a b.mkv", r"C:\out\$a.mkv"],
+                        ["flac", "-"],
+                    ]
+                ],
+            )
+            for cmd in ("echo %PATH%", "echo a^&b", "echo a!b", "dir *.mkv"):
+                self.assertIsNone(process_module.split_cmd(cmd), cmd)
+
+    def test_run_cmd(self):
+        run_cmd = process_module.run_cmd
+        # 管道中任一进程失败时返回其状态码
+        self.assertEqual(run_cmd("true | cat"), 0)
+        self.assertEqual(run_cmd("false | cat"), 1)
+        self.assertEqual(run_cmd("sh -c 'exit 3' | sh -c 'exit 4'"), 3)
+        self.assertEqual(run_cmd("true && sh -c 'exit 5'"), 5)
+        self.assertEqual(run_cmd("false && true"), 1)
+        # 找不到命令时交给 shell
+        self.assertEqual(run_cmd("true && easyrip_not_found_tool"), 127)
+        self.assertEqual(run_cmd("sh -c 'exit 6' && true"), 6)
+
+        usage_list: list[process_module.Process_usage] = []
+        self.assertEqual(run_cmd("echo a | cat", usage_list=usage_list), 0)
+        self.assertEqual([usage.name for usage in usage_list], ["echo", "cat"])
+
+    def test_run_cmd_cancel(self):
+        proc_list: list[subprocess.Popen] = []
+        popen = subprocess.Popen
+
+        def _popen(*args: Any, **kwargs: Any) -> subprocess.Popen:
+            proc_list.append(popen(*args, **kwargs))
+            return proc_list[-1]
+
+        # 取消时终止管道中的所有进程
+        with (
+            unittest.mock.patch.object(process_module.subprocess, "Popen", _popen),
+            unittest.mock.patch.object(
+                process_module, "_wait", side_effect=KeyboardInterrupt
+            ),
+            self.assertRaises(KeyboardInterrupt),
+        ):
+            process_module.run_cmd("sleep 30 | sleep 30")
+
+        self.assertEqual(len(proc_list), 2)
+        for proc in proc_list:
+            self.assertIsNotNone(proc.returncode)
+            self.assertLess(proc.returncode, 0)
+
+
+class TestProgress(unittest.TestCase):
+    def test_progress_reader(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / "FFProgress.log"
+            reader = Progress_reader(path, frame_count=100)
+            # 文件尚未生成
+            self.assertFalse(reader.read())
+            self.assertEqual(reader.percent, -1)
+
+            with (
+                path.open("ab", buffering=0) as f,
+                unittest.mock.patch(
+                    "easyrip.ripper.progress.monotonic", side_effect=[10, 12, 20]
+                ),
+            ):
+                # 不完整的块和行不解析
+                f.write(b"frame=10\nfps=5.0\nout_time_us=400000\nprogr")
+                self.assertFalse(reader.read())
+                self.assertEqual(reader.frame, -1)
+
+                f.write(b"ess=continue\n")
+                self.assertTrue(reader.read())
+                self.assertEqual(reader.frame, 10)
+                self.assertFalse(reader.is_end)
+                self.assertEqual(reader.fps, 5)
+                self.assertEqual(reader.percent, 10)
+                self.assertFalse(reader.read())
+
+                # 窗口内的平均帧率
+                f.write(b"frame=30\nfps=6.0\nout_time_us=1200000\nprogress=continue\n")
+                self.assertTrue(reader.read())
+                self.assertEqual(reader.fps, 10)
+                self.assertEqual(reader.eta, 7)
+
+            # 下一条命令截断重写进度文件
+            path.write_bytes(b"frame=2\nprogress=end\n")
+            with unittest.mock.patch(
+                "easyrip.ripper.progress.monotonic", return_value=30
+            ):
+                self.assertTrue(reader.read())
+            self.assertEqual(reader.frame, 2)
+            self.assertTrue(reader.is_end)
+            self.assertEqual(reader.eta, 0)
+            self.assertNotIn("fps", reader.block)
+            reader.close()
+
+    def test_progress_reader_group(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            reader_list: list[Progress_reader] = []
+            for i, frame in enumerate((20, 30)):
+                path = Path(temp_dir) / f"FFProgress.{i}.log"
+                path.write_bytes(f"frame={frame}\nprogress=continue\n".encode())
+                reader_list.append(Progress_reader(path, frame_count=100))
+
+            group = Progress_reader_group(reader_list, is_chunk=True)
+            self.assertTrue(group.read())
+            self.assertEqual(group.frame, 50)
+            self.assertEqual(group.percent, 50)
+            self.assertFalse(group.is_end)
+
+            group.is_chunk = False
+            self.assertEqual(group.frame, 25)
+            self.assertEqual(group.percent, 25)
+            group.close()
+
+
+class TestMediaInfoCache(unittest.TestCase):
+    def test_media_info_cache(self):
+        cache_cls = media_info_module._Media_info_cache
+        with (
+            tempfile.TemporaryDirectory() as temp_dir,
+            unittest.mock.patch.object(
+                media_info_module, "get_CONFIG_DIR", lambda: Path(temp_dir)
+            ),
+            unittest.mock.patch.multiple(
+                cache_cls, _conn=None, _row_num=None, _is_disabled=False, MAX_ROW_NUM=2
+            ),
+            unittest.mock.patch.object(
+                Media_info,
+                "_from_ffprobe",
+                return_value=Media_info(1920, 1080, 24, (24, 1), 1),
+            ) as from_ffprobe,
+        ):
+            path = Path(temp_dir) / "a.mkv"
+            path.write_bytes(b"a")
+            self.assertEqual(Media_info.from_path(path).width, 1920)
+            self.assertEqual(Media_info.from_path(path).r_frame_rate, (24, 1))
+            self.assertEqual(from_ffprobe.call_count, 1)
+
+            # 修改时间或大小变化时失效
+            os.utime(path, ns=(0, 10**9))
+            Media_info.from_path(path)
+            self.assertEqual(from_ffprobe.call_count, 2)
+            path.write_bytes(b"ab")
+            os.utime(path, ns=(0, 10**9))
+            Media_info.from_path(path)
+            self.assertEqual(from_ffprobe.call_count, 3)
+            Media_info.from_path(path)
+            self.assertEqual(from_ffprobe.call_count, 3)
+
+            # 探测失败时不缓存
+            from_ffprobe.return_value = Media_info()
+            (failed_path := Path(temp_dir) / "b.vpy").write_bytes(b"")
+            Media_info.from_path(failed_path)
+            Media_info.from_path(failed_path)
+            self.assertEqual(from_ffprobe.call_count, 5)
+
+            # 超出上限时只保留最近使用的记录
+            from_ffprobe.return_value = Media_info(1280, 720)
+            for name in ("c.mkv", "d.mkv"):
+                (Path(temp_dir) / name).write_bytes(b"")
+                Media_info.from_path(Path(temp_dir) / name)
+            self.assertEqual(cache_cls._row_num, 2)
+            Media_info.from_path(path)
+            self.assertEqual(from_ffprobe.call_count, 8)
+
+            assert cache_cls._conn is not None
+            cache_cls._conn.close()
+
+
+class TestQuality(unittest.TestCase):
+    def test_quality_stats(self):
+        stats = Quality_stats(Quality_metric.ssim, 0.9)
+        for n, q in Quality_metric.ssim.iter_log(
+            f"n:{n + 1} Y:{q} U:{q} V:{q} All:{q} (10.0)"
+            for n, q in enumerate((0.95, 0.8, 0.85, 0.99, 0.7, 0.96, 0.5))
+        ):
+            stats.add(n + 100, q)
+
+        self.assertEqual(stats.count, 7)
+        self.assertEqual(stats.min, 0.5)
+        self.assertAlmostEqual(stats.mean, 5.75 / 7)
+        self.assertEqual(stats.get_low(1, 50), (0.5, 0.85))
+        self.assertEqual(stats.bad_frame_count, 4)
+        self.assertEqual(stats.bad_range_list, [(101, 102), (104, 104), (106, 106)])
+        self.assertEqual(
+            json.loads(json.dumps(stats.to_dict()))["bad_range_list"],
+            [[101, 102], [104, 104], [106, 106]],
+        )
+
+    def test_bench_to_table(self):
+        # 无损编码时 PSNR 为 inf，JSON 中保存为 None
+        stats = Quality_stats(Quality_metric.psnr, 40)
+        stats.add(0, math.inf)
+        stats.add(1, math.inf)
+        table = bench_to_table(
+            [
+                Bench_result(
+                    "-preset ffv1",
+                    frame_count=2,
+                    duration=1,
+                    encode_sec=1,
+                    size=2**20,
+                    quality=stats.to_dict(),
+                ),
+                Bench_result("-preset x265", is_failed=True),
+            ]
+        )
+        self.assertIn("PSNR inf / inf", table)
+        self.assertIn("failed", table)
+
+    def test_interpolate_crf(self):
+        score_list = [(26, 0.95), (18, 0.99), (22, 0.97)]
+        self.assertAlmostEqual(interpolate_crf(score_list, 0.98), 20)
+        self.assertEqual(interpolate_crf(score_list, 0.999), 18)
+        self.assertEqual(interpolate_crf(score_list, 0.9), 26)
+
 
 class TestThirdPartyApi(unittest.TestCase):
     def test_mkvtoolnix_api(self):